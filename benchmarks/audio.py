@@ -0,0 +1,29 @@
+import wave
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+SAMPLING_RATE: int = 48000
+CHANNELS: int = 2
+
+
+def write_tone(path: Path, seconds: float, frequency: float = 440.0, silence: float = 0.0) -> Path:
+    """
+    Write a 16-bit stereo sine tone, optionally padded with ``silence`` seconds at both ends.
+    """
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    tone = (np.sin(2 * np.pi * frequency * t) * 0.3 * 32767).astype(np.int16)
+    pad = np.zeros(int(silence * SAMPLING_RATE), dtype=np.int16)
+    mono = np.concatenate([pad, tone, pad])
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLING_RATE)
+        f.writeframes(np.repeat(mono, CHANNELS).tobytes())
+    return path
+
+
+def make_library(directory: Path, count: int, seconds: float) -> List[str]:
+    directory.mkdir(parents=True, exist_ok=True)
+    return [write_tone(directory / f"tone_{i}.wav", seconds, 220.0 + 55.0 * i).as_posix() for i in range(count)]
@@ -0,0 +1,182 @@
+"""
+Measures the memory the discord.py cache takes per 1,000 guilds under each cache profile,
+by feeding synthetic gateway payloads (guilds, then message traffic) to an offline client.
+Each profile runs in a fresh interpreter so their RSS figures don't mix.
+
+    python -m benchmarks.cache_profile --guilds 1000,5000 --output cache.json
+"""
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+from argparse import SUPPRESS, ArgumentParser, Namespace
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterator, List
+
+from discord import Client
+from discord.user import ClientUser
+
+from ursa.discord.profile import DEFAULT_PROFILE, LEAN_PROFILE, client_options
+
+# name -> (cache profile, message content); "default" is how Ursa ran before cache profiles
+SCENARIOS: Dict[str, tuple] = {
+    "default": (DEFAULT_PROFILE, True),
+    "lean": (LEAN_PROFILE, True),
+    "lean-no-content": (LEAN_PROFILE, False),
+}
+SELF_ID: int = 1
+TIMESTAMP: str = "2024-01-01T00:00:00+00:00"
+
+
+def _rss_bytes() -> int:
+    # Linux only, like the other benchmarks' /proc readers
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+    return 0
+
+
+def _user(user_id: int) -> Dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None,
+            "global_name": f"User {user_id}"}
+
+
+def _member(user_id: int) -> Dict:
+    return {"user": _user(user_id), **_member_fields()}
+
+
+def _member_fields() -> Dict:
+    return {"roles": [], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0}
+
+
+def _guild(ns: Namespace, guild_id: int) -> Dict:
+    base = guild_id * 10_000
+    text = [{"id": str(base + i), "name": f"text-{i}", "type": 0, "position": i, "permission_overwrites": [],
+             "topic": "a channel topic", "nsfw": False} for i in range(ns.text_channels)]
+    voice = [{"id": str(base + 100 + i), "name": f"voice-{i}", "type": 2, "position": i,
+              "permission_overwrites": [], "bitrate": 64000, "user_limit": 0} for i in range(ns.voice_channels)]
+    listeners = [base + 1000 + i for i in range(ns.listeners)]
+    return {
+        "id": str(guild_id), "name": f"guild {guild_id}", "icon": None, "owner_id": str(base + 1000),
+        "member_count": ns.members, "large": ns.members > 250, "features": [], "threads": [], "stickers": [],
+        "roles": [{"id": str(guild_id if i == 0 else base + 500 + i), "name": f"role-{i}", "permissions": "0",
+                   "position": i, "color": 0, "hoist": False, "managed": False, "mentionable": False}
+                  for i in range(ns.roles)],
+        "emojis": [{"id": str(base + 700 + i), "name": f"emoji{i}", "roles": [], "require_colons": True,
+                    "managed": False, "animated": False, "available": True} for i in range(ns.emojis)],
+        "channels": text + voice,
+        # without the members intent, guilds arrive with ourselves and the members in voice
+        "members": [_member(SELF_ID)] + [_member(user_id) for user_id in listeners],
+        "voice_states": [{"user_id": str(user_id), "channel_id": voice[0]["id"], "session_id": "x", "deaf": False,
+                          "mute": False, "self_deaf": False, "self_mute": False, "self_video": False,
+                          "suppress": False} for user_id in listeners],
+    }
+
+
+def _messages(ns: Namespace, guild_id: int) -> Iterator[Dict]:
+    base = guild_id * 10_000
+    for i in range(ns.messages):
+        author = base + 2000 + i
+        yield {"id": str(base * 1000 + i), "channel_id": str(base + i % ns.text_channels), "guild_id": str(guild_id),
+               "author": _user(author), "member": _member_fields(),
+               "content": "an ordinary chat message, nothing to do with the bot " * 2, "timestamp": TIMESTAMP,
+               "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+               "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0}
+
+
+def run_scenario(ns: Namespace, scenario: str, guilds: int) -> Dict:
+    """
+    Fill one client's cache; run in a fresh process.
+    """
+    profile, message_content = SCENARIOS[scenario]
+    client = Client(**client_options(message_content, profile))
+    state = client._connection
+    state.user = ClientUser(state=state, data=_user(SELF_ID))
+    models = None
+    if ns.gui:
+        from PyQt5.QtWidgets import QApplication
+        from ursa.models.guilds import GuildsModel
+        app = QApplication(["benchmarks.cache_profile"])
+    gc.collect()
+    before = _rss_bytes()
+
+    start = perf_counter()
+    for guild_id in range(1, guilds + 1):
+        state._add_guild_from_data(_guild(ns, guild_id))
+    # the gateway only sends message events with the message intents
+    delivered = 0
+    if state._intents.guild_messages:
+        for guild_id in range(1, guilds + 1):
+            for data in _messages(ns, guild_id):
+                state.parse_message_create(data)
+                delivered += 1
+    if ns.gui:
+        models = GuildsModel(client)
+    elapsed = perf_counter() - start
+    gc.collect()
+    rss = _rss_bytes() - before
+
+    return {
+        "scenario": scenario,
+        "guilds": guilds,
+        "messages_delivered": delivered,
+        "messages_cached": len(state._messages or ()),
+        "members_cached": sum(len(guild._members) for guild in client.guilds),
+        "guilds_model": models is not None,
+        "seconds": elapsed,
+        "rss_bytes": rss,
+        "rss_mib_per_1000_guilds": rss / 1024 ** 2 * 1000 / guilds,
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(prog="benchmarks.cache_profile")
+    parser.add_argument('--guilds', type=str, default="1000,5000", help="comma separated guild counts")
+    parser.add_argument('--scenarios', type=str, default=",".join(SCENARIOS),
+                        help="comma separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument('--text-channels', type=int, default=20, dest='text_channels')
+    parser.add_argument('--voice-channels', type=int, default=5, dest='voice_channels')
+    parser.add_argument('--roles', type=int, default=20)
+    parser.add_argument('--emojis', type=int, default=30)
+    parser.add_argument('--members', type=int, default=500, help="member count each guild reports")
+    parser.add_argument('--listeners', type=int, default=3, help="members in voice per guild")
+    parser.add_argument('--messages', type=int, default=20, help="message events per guild")
+    parser.add_argument('--gui', action='store_true', default=False, help="also build the GUI's GuildsModel")
+    parser.add_argument('--worker', type=str, default=None, help=SUPPRESS)
+    parser.add_argument('-o', '--output', type=str, default=None, help="write JSON here instead of stdout")
+    ns = parser.parse_args()
+
+    if ns.worker is not None:
+        scenario, guilds = ns.worker.split(':')
+        print(json.dumps(run_scenario(ns, scenario, int(guilds))))
+        return 0
+
+    results: Dict = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": vars(ns),
+        "results": list(),
+    }
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    for guilds in [int(n) for n in ns.guilds.split(',')]:
+        for scenario in ns.scenarios.split(','):
+            argv: List[str] = [sys.executable, "-m", "benchmarks.cache_profile", *sys.argv[1:],
+                               "--worker", f"{scenario}:{guilds}"]
+            out = subprocess.run(argv, env=env, check=True, capture_output=True, text=True).stdout
+            results["results"].append(json.loads(out.splitlines()[-1]))
+
+    text = json.dumps(results, indent=2)
+    if ns.output:
+        Path(ns.output).write_text(text)
+    else:
+        print(text)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
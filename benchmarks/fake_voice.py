@@ -0,0 +1,151 @@
+import logging
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep
+from typing import Callable, List, Optional
+
+from discord import AudioSource
+from discord.opus import Encoder
+
+log = logging.getLogger(__name__)
+
+FRAME_SECONDS: float = Encoder.FRAME_LENGTH / 1000
+
+
+class FakeGuild(object):
+    id: int
+    name: str
+
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"bench-{guild_id}"
+
+
+class FakeVoiceClient(object):
+    """
+    Stand-in for discord.VoiceClient that consumes AudioSource.read() on its own thread,
+    either paced at real time or as fast as possible, and honours ``after=``.
+
+    With ``timing``, the interval between consecutive PCM packets is recorded, whoever sends them.
+    """
+    guild: FakeGuild
+    realtime: bool
+    encoder: Optional[Encoder]
+    source: Optional[AudioSource]
+    after: Optional[Callable]
+    lock: Lock
+    frames: int
+    late_frames: int
+    plays: int
+    gaps: List[float]
+    last_end: Optional[float]
+    timing: bool
+    intervals: List[float]
+    last_packet: Optional[float]
+    finished: Event
+    _thread: Optional[Thread]
+    _stop: Event
+    _resumed: Event
+
+    def __init__(self, guild_id: int = 0, realtime: bool = False, encoder: Optional[Encoder] = None,
+                 timing: bool = False):
+        self.guild = FakeGuild(guild_id)
+        self.realtime = realtime
+        self.encoder = encoder
+        self.source = None
+        self.after = None
+        self.lock = Lock()
+        self.frames = 0
+        self.late_frames = 0
+        self.plays = 0
+        self.gaps = list()
+        self.last_end = None
+        self.timing = timing
+        self.intervals = list()
+        self.last_packet = None
+        self.finished = Event()
+        self._thread = None
+        self._stop = Event()
+        self._resumed = Event()
+        self._resumed.set()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self.source is not None and not self._stop.is_set() and self._resumed.is_set()
+
+    def is_paused(self) -> bool:
+        return self.source is not None and not self._stop.is_set() and not self._resumed.is_set()
+
+    def play(self, source: AudioSource, *, after: Optional[Callable] = None) -> None:
+        if self.is_playing():
+            raise RuntimeError("Already playing audio.")
+
+        with self.lock:
+            self.plays += 1
+            if self.last_end is not None:
+                self.gaps.append(perf_counter() - self.last_end)
+                self.last_end = None
+
+        self.source = source
+        self.after = after
+        self._stop = Event()
+        self._thread = Thread(target=self._run, args=(source, after, self._stop), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._resumed.set()
+
+    def pause(self) -> None:
+        self._resumed.clear()
+
+    def resume(self) -> None:
+        self._resumed.set()
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        self.stop()
+
+    def send_audio_packet(self, data: bytes, *, encode: bool = True) -> None:
+        if encode and self.encoder is not None:
+            self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+        self.frames += 1
+        if self.timing and encode:
+            now = perf_counter()
+            if self.last_packet is not None:
+                self.intervals.append(now - self.last_packet)
+            self.last_packet = now
+
+    def _run(self, source: AudioSource, after: Optional[Callable], stop: Event) -> None:
+        error = None
+        start = perf_counter()
+        loops = 0
+        try:
+            while not stop.is_set():
+                self._resumed.wait()
+                data = source.read()
+                if not data:
+                    stop.set()
+                    break
+
+                self.send_audio_packet(data, encode=not source.is_opus())
+                if self.realtime:
+                    loops += 1
+                    delay = start + loops * FRAME_SECONDS - perf_counter()
+                    if delay < 0:
+                        self.late_frames += 1
+                    else:
+                        sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            stop.set()
+            with self.lock:
+                self.last_end = perf_counter()
+            if after is not None:
+                try:
+                    after(error)
+                except Exception:
+                    log.exception("after callback failed")
+            source.cleanup()
+            self.finished.set()
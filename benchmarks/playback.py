@@ -0,0 +1,263 @@
+"""
+Offline playback benchmarks, driven by a fake VoiceClient and synthetic audio.
+
+    python -m benchmarks.playback --output results.json
+"""
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+from argparse import ArgumentParser, Namespace
+from asyncio import AbstractEventLoop
+from inspect import isawaitable
+from pathlib import Path
+from statistics import mean
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+from typing import Callable, Dict, List, Optional
+
+import discord.opus
+from discord.opus import Encoder
+
+from ursa.PhasedContext import PhasedContext
+from ursa.decoder import LOOP_WRAPS, decoder_pool
+from ursa.playback import PlaybackController
+from ursa.playlist import Playlist
+from ursa.scheduler import audio_scheduler
+from ursa.session import BackgroundSession
+
+from .audio import make_library
+from .fake_voice import FakeVoiceClient, FRAME_SECONDS
+
+DEFAULT_TIMEOUT: float = 120.0
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _wait_for(predicate: Callable[[], bool], timeout: float = DEFAULT_TIMEOUT, tick: Callable = None) -> bool:
+    deadline = perf_counter() + timeout
+    while not predicate():
+        if perf_counter() > deadline:
+            return False
+        if tick is not None:
+            tick()
+        sleep(0.005)
+    return True
+
+
+def _start_loop() -> AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, name="bench-loop", daemon=True).start()
+    return loop
+
+
+def _on_loop(loop: AbstractEventLoop, fn: Callable, *args):
+    async def call():
+        result = fn(*args)
+        if isawaitable(result):
+            result = await result
+        return result
+
+    return asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+
+def _gap_stats(gaps: List[float]) -> Dict[str, Optional[float]]:
+    if not gaps:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "max_ms": None}
+
+    ordered = sorted(gaps)
+    return {
+        "count": len(ordered),
+        "mean_ms": mean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def _chain(tracks: List[str]) -> Playlist:
+    return Playlist.from_list([[t, (i + 1) % len(tracks)] for i, t in enumerate(tracks)])
+
+
+def _new_client(ns: Namespace, guild_id: int = 0) -> FakeVoiceClient:
+    encoder = Encoder() if ns.encode else None
+    return FakeVoiceClient(guild_id, realtime=ns.realtime, encoder=encoder)
+
+
+def bench_playlist(ns: Namespace, tracks: List[str]) -> Dict:
+    vc = _new_client(ns)
+    playlist = _chain(tracks)
+
+    def callback(error):
+        if vc.plays < ns.transitions + 1:
+            playlist.play_track(vc, callback)
+
+    playlist.current_track.play_track(vc, callback)
+    _wait_for(lambda: vc.plays >= ns.transitions + 1 and not vc.is_playing())
+    return {"gaps": _gap_stats(vc.gaps), "late_frames": vc.late_frames}
+
+
+def bench_phased_context(ns: Namespace, tracks: List[str]) -> Dict:
+    vc = _new_client(ns)
+    context = PhasedContext({"a": _chain(tracks), "b": _chain(list(reversed(tracks)))})
+    switches: List[float] = list()
+
+    def callback(error):
+        pass
+
+    for i in range(ns.transitions):
+        start = perf_counter()
+        context.play_list("ab"[i % 2], vc, callback)
+        switches.append(perf_counter() - start)
+        sleep(FRAME_SECONDS * 5)
+
+    vc.stop()
+    return {"switches": _gap_stats(switches)}
+
+
+def bench_session(ns: Namespace, loop: AbstractEventLoop, tracks: List[str]) -> Dict:
+    vc = _new_client(ns)
+    context = PhasedContext({"loop": _chain(tracks)})
+    session = _on_loop(loop, BackgroundSession, vc.guild, "bench", context, vc, None)
+    _on_loop(loop, session.play_list, "loop")
+    _wait_for(lambda: vc.plays >= ns.transitions + 1)
+    _on_loop(loop, session.close)
+    return {"gaps": _gap_stats(vc.gaps), "late_frames": vc.late_frames}
+
+
+def bench_gui(ns: Namespace, loop: AbstractEventLoop, tracks: List[str]) -> Dict:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ.setdefault("URSA_APPID", "0")
+    os.environ.setdefault("URSA_TOKEN", "offline")
+    from PyQt5.QtCore import QModelIndex
+    from PyQt5.QtWidgets import QApplication
+    from ursa.interface.main_window import MainWindow, SourceType
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    gui = MainWindow(idle_timeout=0)
+    gui.tracks_dock.load_model({"bench": {"loop": [[t, (i + 1) % len(tracks)] for i, t in enumerate(tracks)]}})
+    model = gui.tracks_dock.model
+    phase = model.index(0, 0, model.index(0, 0, QModelIndex()))
+
+    vc = _new_client(ns)
+    gui.source = SourceType.SOURCE_TRACKS
+    gui.connected_voice = vc
+    gui.player = _on_loop(loop, PlaybackController, vc, "gui")
+    gui.current_audio_handle = None
+    # start from the last track so the first callback lands on track 0
+    gui.current_track = model.index(len(tracks) - 1, 0, phase)
+    _on_loop(loop, gui.tracks_callback, None)
+    _wait_for(lambda: vc.plays >= ns.transitions + 1, tick=app.processEvents)
+    _on_loop(loop, gui.player.close)
+    _wait_for(lambda: not vc.is_playing())
+    return {"gaps": _gap_stats(vc.gaps), "late_frames": vc.late_frames}
+
+
+def bench_loop(ns: Namespace, tracks: List[str]) -> Dict:
+    vc = _new_client(ns)
+    playlist = Playlist.from_list([[tracks[0], 0]])
+    frames_per_pass = ns.seconds / FRAME_SECONDS
+    wraps_start = LOOP_WRAPS.get()
+
+    def callback(error):
+        pass
+
+    playlist.play_track(vc, callback)
+    _wait_for(lambda: vc.frames >= frames_per_pass * (ns.transitions + 1))
+    vc.stop()
+    _wait_for(lambda: not vc.is_playing())
+    # a self-looping track should be played once and wrapped in place, with no gaps
+    return {"plays": vc.plays, "wraps": LOOP_WRAPS.get() - wraps_start, "gaps": _gap_stats(vc.gaps),
+            "late_frames": vc.late_frames}
+
+
+def _start_chain(vc: FakeVoiceClient, playlist: Playlist, plays: int) -> None:
+    def callback(error):
+        if vc.plays < plays:
+            playlist.play_track(vc, callback)
+
+    playlist.current_track.play_track(vc, callback)
+
+
+def bench_concurrency(ns: Namespace, tracks: List[str], streams: int) -> Dict:
+    clients = [_new_client(ns, guild_id) for guild_id in range(streams)]
+    cpu_start = _cpu_seconds()
+    wall_start = perf_counter()
+    for vc in clients:
+        _start_chain(vc, _chain(tracks), len(tracks))
+
+    _wait_for(lambda: all(vc.plays >= len(tracks) and not vc.is_playing() for vc in clients))
+    cpu = _cpu_seconds() - cpu_start
+    wall = perf_counter() - wall_start
+    audio_seconds = sum(vc.frames for vc in clients) * FRAME_SECONDS
+    cpu_per_audio_second = cpu / audio_seconds if audio_seconds else None
+    return {
+        "streams": streams,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "audio_seconds": audio_seconds,
+        "cpu_per_stream": cpu_per_audio_second,
+        "max_streams_per_core": 1 / cpu_per_audio_second if cpu_per_audio_second else None,
+        "late_frames": sum(vc.late_frames for vc in clients),
+        "gaps": _gap_stats([g for vc in clients for g in vc.gaps]),
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(prog="benchmarks.playback")
+    parser.add_argument('--tracks', type=int, default=4, help="number of synthetic tracks")
+    parser.add_argument('--seconds', type=float, default=1.0, help="length of each synthetic track")
+    parser.add_argument('--transitions', type=int, default=20, help="track transitions per scenario")
+    parser.add_argument('--streams', type=str, default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument('--realtime', action='store_true', help="pace reads at 20 ms instead of max speed")
+    parser.add_argument('--encode', action='store_true', help="include Opus encoding (needs libopus)")
+    parser.add_argument('--decoder', choices=['auto', 'ffmpeg'], default='auto',
+                        help="decode with PyAV when installed (auto), or always with FFmpeg")
+    parser.add_argument('--skip-gui', action='store_true', help="skip the MainWindow scenario")
+    parser.add_argument('-o', '--output', type=str, default=None, help="write JSON here instead of stdout")
+    ns = parser.parse_args()
+
+    if ns.encode and not discord.opus.is_loaded() and not discord.opus._load_default():
+        parser.error("libopus could not be loaded")
+
+    decoder_pool.configure(use_pyav=ns.decoder == 'auto')
+    # plays and gaps are counted by FakeVoiceClient.play; the scheduler has its own benchmark
+    audio_scheduler.configure(threads=0)
+    decoder_pool.warm_up()
+    results: Dict = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": vars(ns),
+        "decoder": "pyav" if decoder_pool.use_pyav else "ffmpeg",
+        "results": dict(),
+    }
+    loop = _start_loop()
+    with TemporaryDirectory(prefix="ursa-bench-") as tmp:
+        tracks = make_library(Path(tmp), ns.tracks, ns.seconds)
+        results["results"]["playlist"] = bench_playlist(ns, tracks)
+        results["results"]["phased_context"] = bench_phased_context(ns, tracks)
+        results["results"]["loop"] = bench_loop(ns, tracks)
+        results["results"]["session"] = bench_session(ns, loop, tracks)
+        if not ns.skip_gui:
+            results["results"]["gui"] = bench_gui(ns, loop, tracks)
+        results["results"]["concurrency"] = [bench_concurrency(ns, tracks, int(n)) for n in ns.streams.split(',')]
+
+    text = json.dumps(results, indent=2)
+    if ns.output:
+        Path(ns.output).write_text(text)
+    else:
+        print(text)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
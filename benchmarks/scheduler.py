@@ -0,0 +1,129 @@
+"""
+Compares packet timing and CPU of discord.py's thread-per-stream player model against
+Ursa's audio scheduler, with every stream paced at real time.
+
+    python -m benchmarks.scheduler --streams 10,50,100 --output scheduler.json
+"""
+import json
+import os
+import platform
+import sys
+import threading
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List
+
+from ursa.decoder import decoder_pool
+from ursa.scheduler import TICK_OVERRUNS, audio_scheduler
+
+from .audio import make_library
+from .fake_voice import FakeVoiceClient, FRAME_SECONDS
+from .playback import _cpu_seconds, _wait_for
+
+MODELS = ("threads", "scheduler")
+
+
+def _jitter_stats(intervals: List[float]) -> Dict:
+    if not intervals:
+        return {"packets": 0}
+
+    deviations = sorted(abs(i - FRAME_SECONDS) for i in intervals)
+
+    def at(q: float) -> float:
+        return deviations[min(int(len(deviations) * q), len(deviations) - 1)] * 1000
+
+    return {
+        "packets": len(deviations),
+        "mean_ms": sum(deviations) / len(deviations) * 1000,
+        "p50_ms": at(0.5),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": deviations[-1] * 1000,
+        # a packet more than half a frame off its slot
+        "late_packets": sum(1 for d in deviations if d > FRAME_SECONDS / 2),
+    }
+
+
+def bench_model(ns: Namespace, tracks: List[str], model: str, streams: int) -> Dict:
+    clients = [FakeVoiceClient(guild_id, realtime=True, timing=True) for guild_id in range(streams)]
+    lock = Lock()
+    done: List[int] = [0]
+    threads_peak: List[int] = [threading.active_count()]
+
+    def after(error):
+        with lock:
+            done[0] += 1
+
+    def sample_threads() -> None:
+        threads_peak[0] = max(threads_peak[0], threading.active_count())
+
+    overruns_start = TICK_OVERRUNS.total()
+    cpu_start = _cpu_seconds()
+    wall_start = perf_counter()
+    for i, vc in enumerate(clients):
+        source = decoder_pool.open(tracks[i % len(tracks)])
+        if model == "scheduler":
+            audio_scheduler.play(vc, source, after=after)
+        else:
+            vc.play(source, after=after)
+
+    _wait_for(lambda: done[0] >= streams, tick=sample_threads)
+    wall = perf_counter() - wall_start
+    cpu = _cpu_seconds() - cpu_start
+    audio_seconds = sum(vc.frames for vc in clients) * FRAME_SECONDS
+    return {
+        "model": model,
+        "streams": streams,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "cpu_per_stream": cpu / audio_seconds if audio_seconds else None,
+        "threads_peak": threads_peak[0],
+        "tick_overruns": TICK_OVERRUNS.total() - overruns_start if model == "scheduler" else None,
+        "jitter": _jitter_stats([i for vc in clients for i in vc.intervals]),
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(prog="benchmarks.scheduler")
+    parser.add_argument('--streams', type=str, default="10,50,100", help="comma separated concurrency levels")
+    parser.add_argument('--seconds', type=float, default=10.0, help="length of each synthetic track")
+    parser.add_argument('--tracks', type=int, default=4, help="number of synthetic tracks")
+    parser.add_argument('--threads', type=int, default=1, help="scheduler threads")
+    parser.add_argument('--models', type=str, default=",".join(MODELS), help="comma separated subset of " +
+                        ", ".join(MODELS))
+    parser.add_argument('-o', '--output', type=str, default=None, help="write JSON here instead of stdout")
+    ns = parser.parse_args()
+
+    levels = [int(n) for n in ns.streams.split(',')]
+    decoder_pool.configure(max_decoders=max(levels + [decoder_pool.max_decoders]))
+    audio_scheduler.configure(threads=ns.threads)
+    results: Dict = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": vars(ns),
+        "decoder": "pyav" if decoder_pool.use_pyav else "ffmpeg",
+        "results": list(),
+    }
+    with TemporaryDirectory(prefix="ursa-bench-") as tmp:
+        tracks = make_library(Path(tmp), ns.tracks, ns.seconds)
+        for streams in levels:
+            for model in ns.models.split(','):
+                results["results"].append(bench_model(ns, tracks, model, streams))
+    audio_scheduler.shutdown()
+    decoder_pool.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if ns.output:
+        Path(ns.output).write_text(text)
+    else:
+        print(text)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Measures the trigram index behind the tracks filter and chat argument resolution: build time,
+substring query and update latency over synthetic track libraries, and fuzzy resolution
+of chat arguments against phase names.
+
+    python -m benchmarks.search --tracks 10000,100000 --output search.json
+"""
+import json
+import platform
+import random
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from pathlib import Path
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from ursa.search import TrigramIndex
+
+SYLLABLES: List[str] = [
+    "ar", "bel", "cor", "da", "en", "fir", "gal", "hul", "is", "jor", "ka", "lum", "mor", "nex", "or",
+    "pra", "quil", "ros", "sen", "tur", "ul", "vex", "wen", "yor", "zan",
+]
+SEED: int = 1234
+
+
+def vocabulary(count: int) -> List[str]:
+    rng = random.Random(SEED)
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.sample(SYLLABLES, rng.randint(2, 3))))
+    return sorted(words)
+
+
+def track_names(count: int, words: List[str]) -> List[str]:
+    rng = random.Random(SEED)
+    return [
+        f"{'_'.join(rng.sample(words, rng.randint(2, 4)))}_{i:06d}.{rng.choice(('ogg', 'flac', 'mp3'))}"
+        for i in range(count)
+    ]
+
+
+def _latencies(run: Callable[[str], object], queries: List[str], repeat: int) -> Dict[str, float]:
+    samples = list()
+    for _ in range(repeat):
+        for query in queries:
+            start = perf_counter()
+            run(query)
+            samples.append((perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(median(samples), 4),
+        'p99_ms': round(quantiles(samples, n=100)[98], 4),
+        'max_ms': round(max(samples), 4),
+    }
+
+
+def run(count: int, ns: Namespace) -> Dict:
+    words = vocabulary(ns.words)
+    names = track_names(count, words)
+    start = perf_counter()
+    index = TrigramIndex(enumerate(names))
+    build_s = perf_counter() - start
+
+    rng = random.Random(SEED + 1)
+    # a track's own number, a single word and a pair of words
+    number = [f"{rng.randrange(count):06d}" for _ in range(20)]
+    word = rng.sample(words, 20)
+    pair = ["_".join(names[rng.randrange(count)].split("_")[:2]) for _ in range(20)]
+    # queries most names match: an extension, two letters and a common fragment
+    extension = [".ogg", ".flac", ".mp3"]
+    short = [syllable for syllable in SYLLABLES if len(syllable) == 2]
+    common = [f"{syllable}_" for syllable in SYLLABLES[:10]]
+    # lookups are capped unless asked for every match
+    every = partial(index.find, limit=None)
+
+    start = perf_counter()
+    for key in range(0, count, 100):
+        index.add(key, "renamed_" + names[key])
+    update_ms = (perf_counter() - start) * 1000 / len(range(0, count, 100))
+
+    # chat arguments resolve against phase or context names, with a letter dropped
+    phases = TrigramIndex((name, name) for name in rng.sample(words, ns.names))
+    misspelt = rng.sample(list(phases.texts), 20)
+    typos = [name[:2] + name[3:] for name in misspelt]
+
+    return {
+        'tracks': count,
+        'build_s': round(build_s, 3),
+        'update_ms': round(update_ms, 4),
+        'find_number': _latencies(index.find, number, ns.repeat),
+        'find_word': _latencies(index.find, word, ns.repeat),
+        'find_pair': _latencies(index.find, pair, ns.repeat),
+        'find_extension': _latencies(index.find, extension, ns.repeat),
+        'find_short': _latencies(index.find, short, ns.repeat),
+        'find_common': _latencies(index.find, common, ns.repeat),
+        'find_word_all': _latencies(every, word, ns.repeat),
+        'find_extension_all': _latencies(every, extension, ns.repeat),
+        'find_short_all': _latencies(every, short, ns.repeat),
+        'find_common_all': _latencies(every, common, ns.repeat),
+        'matches_per_word': round(sum(len(every(w)) for w in word) / len(word)),
+        'resolve_names': ns.names,
+        'resolve': _latencies(phases.resolve, typos, ns.repeat),
+        # the rest are ambiguous, and get a "Did you mean" reply instead
+        'resolved': sum(phases.resolve(typo) == name for name, typo in zip(misspelt, typos)),
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(prog="benchmarks.search")
+    parser.add_argument('--tracks', type=str, default="10000,100000", help="comma separated library sizes")
+    parser.add_argument('--words', type=int, default=1000, help="distinct words track names are made of")
+    parser.add_argument('--names', type=int, default=200, help="phase names resolved against")
+    parser.add_argument('--repeat', type=int, default=20, help="times each query runs")
+    parser.add_argument('-o', '--output', type=str, default=None, help="write JSON here instead of stdout")
+    ns = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'runs': [run(int(count), ns) for count in ns.tracks.split(",")],
+    }
+    text = json.dumps(results, indent=2)
+    if ns.output:
+        Path(ns.output).write_text(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
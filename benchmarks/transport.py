@@ -0,0 +1,184 @@
+"""
+Compares PCM transports between decoders and the voice sender: memory allocated by each
+frame read (traced with tracemalloc on a single stream), and CPU and garbage collector
+activity with many concurrent streams.
+
+    python -m benchmarks.transport --streams 50 --output transport.json
+"""
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from discord import FFmpegPCMAudio
+
+from ursa.decoder import decoder_pool
+
+from .audio import make_library
+from .fake_voice import FakeVoiceClient
+from .playback import _chain, _cpu_seconds, _start_chain, _wait_for
+
+# name -> (use_pyav, transport); "bytes" is discord.py's FFmpegPCMAudio, one new bytes per frame
+TRANSPORTS: Dict[str, tuple] = {
+    "bytes": (False, None),
+    "pipe-ffmpeg": (False, "pipe"),
+    "pipe-pyav": (True, "pipe"),
+    "shm": (True, "shm"),
+}
+# frames read before tracing, so decoders are running and buffers are in place
+PROBE_WARMUP: int = 50
+PROBE_FRAMES: int = 500
+TRACE_DEPTH: int = 32
+
+
+def _ffmpeg_pcm_audio(source: str, gain: float = 0.0, start: int = 0, end: Optional[int] = None) -> FFmpegPCMAudio:
+    # discord.py's own source, for comparison; the synthetic tracks need no gain or trim
+    return FFmpegPCMAudio(source)
+
+
+def _gc_collections() -> List[int]:
+    return [generation["collections"] for generation in gc.get_stats()]
+
+
+def _worker_cpu_seconds() -> float:
+    # live pool workers are not in RUSAGE_CHILDREN until they exit; read them from /proc (Linux only)
+    workers = decoder_pool.workers
+    if workers is None:
+        return 0.0
+
+    total = 0
+    for pid in list(workers._processes or ()):
+        try:
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # utime and stime, fields 14 and 15 of proc(5)
+        total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def _play_all(streams: int, tracks: List[str]) -> List[FakeVoiceClient]:
+    clients = [FakeVoiceClient(guild_id) for guild_id in range(streams)]
+    for vc in clients:
+        _start_chain(vc, _chain(tracks), len(tracks))
+    _wait_for(lambda: all(vc.plays >= len(tracks) and not vc.is_playing() for vc in clients))
+    return clients
+
+
+def _read_frames(source, kept: List) -> None:
+    # every returned frame is kept alive, so one allocated per read still shows in the snapshot
+    for i in range(len(kept)):
+        kept[i] = source.read()
+
+
+def probe_allocations(track: str) -> Dict:
+    """
+    Blocks and bytes allocated under ``read()``, per frame, on this thread. Decoder threads and
+    processes allocate too, but their tracebacks never pass through this module.
+    """
+    source = decoder_pool.open(track)
+    kept: List[Optional[object]] = [None] * PROBE_FRAMES
+    try:
+        for _ in range(PROBE_WARMUP):
+            source.read()
+        tracemalloc.start(TRACE_DEPTH)
+        try:
+            before = tracemalloc.take_snapshot()
+            _read_frames(source, kept)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+    finally:
+        source.cleanup()
+
+    frames = sum(1 for frame in kept if frame)
+    read_path = [tracemalloc.Filter(True, __file__, all_frames=True)]
+    diff = after.filter_traces(read_path).compare_to(before.filter_traces(read_path), 'traceback')
+    blocks = sum(max(stat.count_diff, 0) for stat in diff)
+    size = sum(max(stat.size_diff, 0) for stat in diff)
+    return {
+        "frames": frames,
+        "blocks_per_frame": blocks / frames if frames else None,
+        "bytes_per_frame": size / frames if frames else None,
+    }
+
+
+def bench_transport(ns: Namespace, tracks: List[str], name: str) -> Dict:
+    use_pyav, transport = TRANSPORTS[name]
+    original_open: Callable = decoder_pool.open
+    if transport is None:
+        decoder_pool.open = _ffmpeg_pcm_audio
+    else:
+        decoder_pool.configure(use_pyav=use_pyav, transport=transport)
+
+    try:
+        # unmeasured pass, so shm worker processes are already spawned
+        _play_all(ns.streams, tracks[:1])
+        allocations = probe_allocations(tracks[0])
+        gc.collect()
+        gc_start = _gc_collections()
+        cpu_start = _cpu_seconds() + _worker_cpu_seconds()
+        wall_start = perf_counter()
+        clients = _play_all(ns.streams, tracks)
+        wall = perf_counter() - wall_start
+        cpu = _cpu_seconds() + _worker_cpu_seconds() - cpu_start
+        collections = [end - start for start, end in zip(gc_start, _gc_collections())]
+    finally:
+        decoder_pool.open = original_open
+
+    frames = sum(vc.frames for vc in clients)
+    return {
+        "transport": name,
+        "decoder": "pyav" if use_pyav and decoder_pool.use_pyav else "ffmpeg",
+        "streams": ns.streams,
+        "frames": frames,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "read_allocations": allocations,
+        "gc_collections": collections,
+        "gc_collections_per_second": [c / wall for c in collections] if wall else None,
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(prog="benchmarks.transport")
+    parser.add_argument('--streams', type=int, default=50, help="concurrent streams")
+    parser.add_argument('--tracks', type=int, default=2, help="tracks played per stream")
+    parser.add_argument('--seconds', type=float, default=5.0, help="length of each synthetic track")
+    parser.add_argument('--transports', type=str, default=",".join(TRANSPORTS),
+                        help="comma separated subset of " + ", ".join(TRANSPORTS))
+    parser.add_argument('-o', '--output', type=str, default=None, help="write JSON here instead of stdout")
+    ns = parser.parse_args()
+
+    results: Dict = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": vars(ns),
+        "results": list(),
+    }
+    decoder_pool.configure(max_decoders=max(ns.streams, decoder_pool.max_decoders))
+    with TemporaryDirectory(prefix="ursa-bench-") as tmp:
+        tracks = make_library(Path(tmp), ns.tracks, ns.seconds)
+        for name in ns.transports.split(','):
+            results["results"].append(bench_transport(ns, tracks, name))
+    decoder_pool.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if ns.output:
+        Path(ns.output).write_text(text)
+    else:
+        print(text)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+from ursa.analysis import PcmScan, analyse_file, loop_points
+
+PERIOD: int = 100
+LEAD: int = 1000
+TONE: int = 10000
+
+
+def tone(length: int = TONE) -> np.ndarray:
+    """
+    Silence, a sine wave with an exact period of ``PERIOD`` samples, then silence again; stereo int16.
+    Its rising zero crossings are at samples 96, 196, ... of the tone.
+    """
+    n = np.arange(length)
+    sine = np.round(10000 * np.sin(2 * np.pi * n / PERIOD + 0.3)).astype(np.int16)
+    mono = np.concatenate((np.zeros(LEAD, np.int16), sine, np.zeros(LEAD, np.int16)))
+    return np.stack((mono, mono), axis=1)
+
+
+def scan(pcm: np.ndarray, chunk: int) -> PcmScan:
+    result = PcmScan()
+    for begin in range(0, len(pcm), chunk):
+        result.feed(pcm[begin:begin + chunk])
+    return result
+
+
+def test_loop_points_on_matching_crossings():
+    head = np.array([-10, 10, 20, 30, 40, 50, 60])
+    # the later crossing is steeper and much louder than the one at the start
+    tail = np.array([-10, 10, 20, -5, 500, 600])
+    assert loop_points(head, tail, 0, 100, search=6) == (1, 95)
+
+
+def test_loop_points_without_crossings():
+    ramp = np.arange(1, 50)
+    assert loop_points(ramp, ramp, 10, 59, search=20) == (10, 59)
+    assert loop_points(ramp[:1], ramp[:1], 3, 4) == (3, 4)
+    assert loop_points(ramp[:0], ramp[:0], 3, 3) == (3, 3)
+
+
+@pytest.mark.parametrize("chunk", [1 << 20, 4096, 777, 1])
+def test_scan_bounds_and_loop(chunk):
+    result = scan(tone(), chunk)
+    assert result.samples == LEAD + TONE + LEAD
+    assert result.bounds() == (LEAD, LEAD + TONE)
+    # every period is an equally good seam, so the latest one is taken
+    loop_start, loop_end = result.loop_points()
+    assert loop_start == LEAD + 96
+    assert loop_end == LEAD + TONE - PERIOD + 96
+    assert (loop_end - loop_start) % PERIOD == 0
+
+
+def test_scan_of_silence():
+    quiet = np.full((5000, 2), 20, dtype=np.int16)
+    result = scan(quiet, 1024)
+    assert result.bounds() == (0, 0)
+    assert result.loop_points() == (0, 0)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs the ffmpeg binary")
+def test_analyse_file(tmp_path):
+    path = tmp_path / "tone.wav"
+    length = 2 * 48000
+    with wave.open(path.as_posix(), 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(48000)
+        # long enough for the loudness meter's 400 ms blocks
+        f.writeframes(tone(length).tobytes())
+
+    result = analyse_file(path.as_posix())
+    assert result is not None
+    assert -20 < result["loudness"] < 0
+    assert result["samples"] == LEAD + length + LEAD
+    assert (result["start"], result["end"]) == (LEAD, LEAD + length)
+    assert (result["loop_start"], result["loop_end"]) == (LEAD + 96, LEAD + length - PERIOD + 96)
+
+    assert analyse_file((tmp_path / "missing.wav").as_posix()) is None
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from ursa.cache import TrackCache, readahead
+
+TRACKS = [("a", 1), ("b", 2), ("c", 0), ("d", -1), ("e", 9)]
+
+
+def test_readahead_follows_next_numbers():
+    assert readahead(TRACKS, 0) == ["a", "b", "c"]
+    assert readahead(TRACKS, 0, depth=1) == ["a", "b"]
+    # the loop back to the start is not fetched twice
+    assert readahead(TRACKS, 1, depth=5) == ["b", "c", "a"]
+
+
+def test_readahead_any_successor():
+    # -1 fans out to every track, nearest first and without repeats
+    assert readahead(TRACKS, 3) == ["d", "a", "b", "c", "e"]
+    assert readahead(TRACKS, 3, depth=0) == ["d"]
+
+
+def test_readahead_out_of_range():
+    assert readahead(TRACKS, 4) == ["e"]
+    assert readahead(TRACKS, 5) == []
+    assert readahead(TRACKS, -1) == []
+    assert readahead([], 0) == []
+
+
+@pytest.fixture
+def sources(tmp_path):
+    directory = tmp_path / "share"
+    directory.mkdir()
+    paths = dict()
+    for name in "abcd":
+        path = directory / f"{name}.ogg"
+        path.write_bytes(name.encode() * 100)
+        paths[name] = path.as_posix()
+    return paths
+
+
+def make_cache(tmp_path, max_bytes: int) -> TrackCache:
+    return TrackCache(tmp_path / "cache", max_bytes=max_bytes)
+
+
+def fetch(cache: TrackCache, *paths: str) -> None:
+    cache.prefetch(paths)
+    # wait for the copies; the next prefetch starts a new executor
+    cache.executor.shutdown(wait=True)
+    cache.executor = None
+
+
+def test_resolve_serves_fetched_copies(tmp_path, sources):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    assert cache.resolve(sources["a"]) == sources["a"]
+
+    fetch(cache, sources["a"], "http://example.com/a.ogg")
+    cached = cache.resolve(sources["a"])
+    assert cached != sources["a"] and cached.endswith(".ogg")
+    with open(cached, 'rb') as f:
+        assert f.read() == b"a" * 100
+    assert cache.resolve("http://example.com/a.ogg") == "http://example.com/a.ogg"
+    assert not cache.pending
+
+
+def test_changed_source_is_a_miss(tmp_path, sources):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    fetch(cache, sources["a"])
+    stat = os.stat(sources["a"])
+    os.utime(sources["a"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.resolve(sources["a"]) == sources["a"]
+
+
+def test_evicts_least_recently_used(tmp_path, sources):
+    cache = make_cache(tmp_path, max_bytes=250)
+    fetch(cache, sources["a"], sources["b"])
+    # a use makes "a" the most recent, so "b" goes first
+    cached_a = cache.resolve(sources["a"])
+    cached_b = cache.resolve(sources["b"])
+    cache.resolve(sources["a"])
+
+    fetch(cache, sources["c"])
+    assert cache.resolve(sources["b"]) == sources["b"]
+    assert not os.path.exists(cached_b)
+    assert cache.resolve(sources["a"]) == cached_a
+    assert cache.resolve(sources["c"]) != sources["c"]
+    assert sum(cache.entries.values()) == 200
+
+
+def test_oversized_files_are_not_copied(tmp_path, sources):
+    cache = make_cache(tmp_path, max_bytes=50)
+    fetch(cache, sources["a"])
+    assert cache.resolve(sources["a"]) == sources["a"]
+    assert not cache.entries
+
+
+def test_existing_copies_are_reused(tmp_path, sources):
+    fetch(make_cache(tmp_path, max_bytes=1000), sources["a"], sources["b"])
+
+    cache = make_cache(tmp_path, max_bytes=1000)
+    assert cache.resolve(sources["a"]) != sources["a"]
+    assert cache.resolve(sources["b"]) != sources["b"]
+    # a smaller limit applies from the next copy on
+    cache.configure(max_bytes=150)
+    fetch(cache, sources["c"])
+    assert len(cache.entries) == 1
+    assert cache.resolve(sources["c"]) != sources["c"]
+
+
+def test_disabled_cache_does_nothing(tmp_path, sources):
+    cache = TrackCache(tmp_path / "cache", enabled=False)
+    cache.prefetch([sources["a"]])
+    assert cache.executor is None
+    assert cache.resolve(sources["a"]) == sources["a"]
+    assert not (tmp_path / "cache").exists()
@@ -0,0 +1,125 @@
+import asyncio
+import sys
+from textwrap import dedent
+
+import pytest
+
+from ursa import DMCI
+from ursa.DMCI import parse_command, register_module, run_command
+
+ECHO_MODULE: str = '''
+from ursa.parser_module import ParserModule
+
+
+class {name}(ParserModule):
+    def init(self, parser):
+        parser.add_argument('word')
+
+    def parser_name(self):
+        return 'echo'
+
+    def process(self, ns):
+        return "{prefix}" + ns.word
+'''
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch, tmp_path):
+    # each test gets its own registry, and a directory on the path for its modules
+    monkeypatch.setattr(DMCI, "module_targets", dict(DMCI.module_targets))
+    monkeypatch.setattr(DMCI, "command_parsers", dict())
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    yield tmp_path
+    for name in [name for name in sys.modules if name.startswith("dmci_test_")]:
+        del sys.modules[name]
+
+
+def write_module(directory, module: str, text: str) -> None:
+    (directory / f"{module}.py").write_text(dedent(text))
+
+
+def test_usage_lists_modules():
+    usage = parse_command("c!")
+    assert usage.startswith("usage: c! {")
+    assert "odds" in usage and "roll" in usage and "reload" in usage
+    assert parse_command("c!nosuchmodule 1") == usage
+
+
+def test_modules_load_on_first_use(registry):
+    write_module(registry, "dmci_test_lazy", ECHO_MODULE.format(name="Parser", prefix="echo: "))
+    register_module("echo", "dmci_test_lazy")
+    assert "dmci_test_lazy" not in sys.modules
+    assert "echo" in parse_command("c!")
+
+    assert parse_command("c!echo hello") == "echo: hello"
+    assert "dmci_test_lazy" in sys.modules
+
+
+def test_target_names_its_parser_class(registry):
+    write_module(registry, "dmci_test_named", ECHO_MODULE.format(name="Shouter", prefix="named: "))
+    register_module("shout", "dmci_test_named:Shouter")
+    assert parse_command("c!shout hi") == "named: hi"
+
+
+def test_broken_modules_answer_as_defunct(registry):
+    write_module(registry, "dmci_test_broken", "raise RuntimeError('broken on import')\n")
+    write_module(registry, "dmci_test_empty", "VALUE = 1\n")
+    register_module("broken", "dmci_test_broken")
+    register_module("empty", "dmci_test_empty")
+
+    assert parse_command("c!broken") == "DEFUNCT MODULE: PARSE FAILED"
+    assert parse_command("c!empty") == "DEFUNCT MODULE: PARSE FAILED"
+    # the rest still work
+    assert parse_command("c!roll 1 1").endswith("Total: 1")
+
+
+def test_parse_errors_are_replies():
+    assert "required: faces" in parse_command("c!roll 2")
+    assert parse_command("c!roll -h").startswith("usage: c!roll")
+
+
+def test_reload_is_owner_only_and_picks_up_changes(registry):
+    write_module(registry, "dmci_test_reload", ECHO_MODULE.format(name="Parser", prefix="v1 "))
+    register_module("echo", "dmci_test_reload")
+    assert parse_command("c!echo a") == "v1 a"
+
+    write_module(registry, "dmci_test_reload", ECHO_MODULE.format(name="Parser", prefix="version two "))
+    assert parse_command("c!reload echo") == "Only the bot's owner can reload modules."
+    assert parse_command("c!echo a") == "v1 a"
+
+    assert parse_command("c!reload echo", allow_reload=True) == "Reloaded echo."
+    assert parse_command("c!echo a") == "version two a"
+    assert parse_command("c!reload nothing", allow_reload=True) == "No such module nothing!"
+
+
+def test_failed_reload_keeps_the_loaded_version(registry):
+    write_module(registry, "dmci_test_keep", ECHO_MODULE.format(name="Parser", prefix="kept "))
+    register_module("echo", "dmci_test_keep")
+    assert parse_command("c!echo a") == "kept a"
+
+    write_module(registry, "dmci_test_keep", "raise RuntimeError('now broken')\n")
+    assert parse_command("c!reload echo", allow_reload=True) == "Reloading echo failed: now broken"
+    assert parse_command("c!echo a") == "kept a"
+
+
+def test_run_command_times_out(registry):
+    write_module(registry, "dmci_test_slow", '''
+        import time
+        from ursa.parser_module import ParserModule
+
+
+        class Parser(ParserModule):
+            def init(self, parser):
+                pass
+
+            def parser_name(self):
+                return 'slow'
+
+            def process(self, ns):
+                time.sleep(1)
+                return "done"
+    ''')
+    register_module("slow", "dmci_test_slow")
+    assert asyncio.run(run_command("c!slow", timeout=0.1)) == "Timed out after 0.1s."
+    assert asyncio.run(run_command("c!roll 1 1")).endswith("Total: 1")
@@ -0,0 +1,92 @@
+import pytest
+
+from ursa.DMCI import odds, parse_command
+from ursa.DMCI.odds import Distribution, distribution, normalize_expression, parse_expression
+
+# the mean of the highest three of 4d6
+MEAN_4D6KH3: float = 15869 / 1296
+
+
+@pytest.fixture
+def few_samples(monkeypatch):
+    monkeypatch.setattr(odds, "MC_SAMPLES", 200_000)
+    odds._cached_distribution.cache_clear()
+    yield
+    odds._cached_distribution.cache_clear()
+
+
+def test_normalize_expression():
+    assert normalize_expression("3d6 + 2") == "3d6+2"
+    assert normalize_expression("d20") == "1d20"
+    assert normalize_expression("4d6kh3-1d4") == "4d6kh3-1d4"
+    # keeping every die is no keep at all
+    assert normalize_expression("2d6kh2") == "2d6"
+    assert normalize_expression("5") == "5"
+
+
+@pytest.mark.parametrize("expression", ["3x6", "0d6", "2d0", "4d6kh0", f"{odds.MAX_DICE + 1}d6", "1000d10000"])
+def test_parse_rejects(expression):
+    with pytest.raises(ValueError):
+        parse_expression(expression)
+
+
+def test_exact_two_dice():
+    dist = distribution("2d6")
+    assert dist.exact
+    assert dist.offset == 2
+    assert dist.pmf[7 - 2] == pytest.approx(6 / 36)
+    assert dist.mean == pytest.approx(7)
+    assert dist.at_least(12) == pytest.approx(1 / 36)
+    assert dist.at_least(2) == pytest.approx(1)
+    assert dist.at_least(13) == 0
+    assert dist.percentile(50) == 7
+
+
+def test_exact_negative_term_and_constant():
+    dist = distribution("1d4-1d4+3")
+    assert dist.offset == 0
+    assert len(dist.pmf) == 7
+    assert dist.mean == pytest.approx(3)
+    assert dist.pmf[3] == pytest.approx(4 / 16)
+
+
+def test_exact_large_goes_through_fft():
+    dist = distribution("100d100")
+    assert dist.exact
+    assert dist.pmf.sum() == pytest.approx(1)
+    assert dist.pmf.min() >= 0
+    assert dist.mean == pytest.approx(5050, rel=1e-9)
+
+
+def test_percentile_of_point_mass():
+    dist = Distribution(4, odds.np.ones(1), exact=True)
+    assert [dist.percentile(q) for q in odds.PERCENTILES] == [4] * len(odds.PERCENTILES)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_monte_carlo_keep_highest(few_samples, workers):
+    dist = distribution("4d6kh3", workers=workers)
+    assert not dist.exact
+    # the shares of every worker add up to the samples reported
+    assert dist.samples == odds.MC_SAMPLES
+    assert dist.pmf.sum() == pytest.approx(1)
+    assert dist.offset == 3
+    assert len(dist.pmf) == 16
+    assert dist.mean == pytest.approx(MEAN_4D6KH3, abs=0.05)
+
+
+def test_configured_workers(few_samples, monkeypatch):
+    monkeypatch.setattr(odds, "mc_workers", 1)
+    odds.configure(workers=3)
+    assert odds.mc_workers == 3
+    assert distribution("2d20kl1").samples == odds.MC_SAMPLES
+    with pytest.raises(ValueError):
+        odds.configure(workers=0)
+
+
+def test_odds_command():
+    response = parse_command("c!odds 2d6 -t 7")
+    assert response.startswith("2d6 (exact)")
+    assert "Mean: 7.00" in response
+    assert response.endswith("P(>= 7): 58.33%")
+    assert parse_command("c!odds 3x6") == "Invalid dice expression '3x6'"
@@ -0,0 +1,103 @@
+import pytest
+
+from ursa import search
+from ursa.search import TrigramIndex, trigrams
+
+NAMES = {
+    1: "Battle",
+    2: "Battle Theme.ogg",
+    3: "Boss Battle.ogg",
+    4: "Tavern.mp3",
+    5: "Forest Ambience.ogg",
+}
+
+
+@pytest.fixture
+def index():
+    return TrigramIndex(NAMES.items())
+
+
+def test_trigrams():
+    assert trigrams("abcd") == {"abc", "bcd"}
+    assert trigrams("ab") == set()
+
+
+def test_find_ignores_case(index):
+    assert index.find("battle") == {1, 2, 3}
+    assert index.find("BATTLE THEME") == {2}
+    assert index.find(".OGG") == {2, 3, 5}
+    assert index.find("dragon") == set()
+
+
+def test_find_checks_the_substring():
+    # the same trigrams, but neither contains the other
+    index = TrigramIndex([("a", "abcab"), ("b", "bcabc")])
+    assert index.find("abcab", limit=None) == {"a"}
+    assert index.find("bcabc") == {"b"}
+
+
+def test_short_queries(index):
+    assert index.find("v", limit=None) == {4}
+    assert index.find("ta", limit=None) == {4}
+    assert index.find("h", limit=None) == {2}
+    assert index.find("", limit=None) == set(NAMES)
+    assert len(index.find("b", limit=2)) == 2
+    assert index.find("b", limit=2) <= {1, 2, 3}
+
+
+def test_incremental_updates(index):
+    index.add(6, "Battle Royale")
+    assert index.find("battle") == {1, 2, 3, 6}
+    assert len(index) == 6
+
+    # adding a key again renames it; its old trigrams no longer find it
+    index.add(4, "Boss Rush")
+    assert index.find("tavern") == set()
+    assert index.find("boss") == {3, 4}
+    assert "tav" not in index.postings
+
+    index.remove(3)
+    index.remove(3)
+    assert 3 not in index
+    assert index.find("boss") == {4}
+    assert index.similar("boss battle", threshold=0.6) == []
+
+    for key in list(index.texts):
+        index.remove(key)
+    assert not index.postings and not index.sizes and not len(index)
+
+
+def test_capped_lookups(monkeypatch):
+    monkeypatch.setattr(search, "LAZY_RATIO", 2)
+    index = TrigramIndex((i, f"track {i:04d}.ogg") for i in range(1000))
+    # small postings are intersected, large ones walked until the limit is reached
+    queries = [("track 00", 5), ("track 00", 60), ("track", 10), ("k 0", 300), ("ogg", 7), ("g", 3), ("xyz", 10)]
+    for query, limit in queries:
+        everything = index.find(query, limit=None)
+        capped = index.find(query, limit=limit)
+        assert len(capped) == min(limit, len(everything))
+        assert capped <= everything
+    assert index.find("track 0042") == {42}
+
+
+def test_similar(index):
+    matches = index.similar("batle theme")
+    assert matches[0][1] == 2
+    assert [score for score, key in matches] == sorted((score for score, key in matches), reverse=True)
+    assert all(0.2 <= score < 1 for score, key in matches)
+
+    assert index.similar("battle theme.ogg")[0] == (1.0, 2)
+    assert len(index.similar("battle", limit=1)) == 1
+    assert index.similar("qqqq") == []
+
+
+def test_resolve(index):
+    # an exact name wins even though other names contain it
+    assert index.resolve("battle") == 1
+    assert index.resolve("tavern") == 4
+    assert index.resolve("Forest Ambiance") == 5
+    assert index.resolve("battle.ogg") == 3
+    # several keys contain or resemble these
+    assert index.resolve("ogg") is None
+    assert index.resolve("batle") is None
+    assert index.resolve("qqqq") is None
@@ -0,0 +1,91 @@
+import sqlite3
+
+import pytest
+
+from ursa.session import SessionCursor
+from ursa.session_store import ACTIVE, LEFT, SUSPENDED, SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / "nested" / "sessions.sqlite3")
+    yield store
+    store.close()
+
+
+def cursor(position: int = 0, phase: str = "combat") -> bytes:
+    return SessionCursor("dungeon", phase, 2, position, 11, 12, True).encode()
+
+
+def test_cursor_round_trip():
+    original = SessionCursor("dungeon", "combat", 2, 48000, 11, 12, True)
+    assert SessionCursor.decode(original.encode()) == original
+    assert original.resume_point == ("combat", 2, 48000)
+
+    stopped = SessionCursor("dungeon", None, 0, 0, None, 12, False)
+    assert SessionCursor.decode(stopped.encode()) == stopped
+    assert stopped.resume_point is None
+
+
+def test_flush_writes_only_latest_change(store):
+    store.put(1, ACTIVE, cursor(10))
+    store.put(1, SUSPENDED, cursor(20))
+    store.put(2, ACTIVE, cursor(30))
+    assert store.flush() == 2
+    assert store.flush() == 0
+
+    assert sorted(store.load()) == [(1, SUSPENDED, cursor(20)), (2, ACTIVE, cursor(30))]
+
+
+def test_delete(store):
+    store.put(1, ACTIVE, cursor())
+    store.put(2, ACTIVE, cursor())
+    store.flush()
+
+    store.delete(1)
+    # a delete replaces a pending put, and deleting an unknown guild is harmless
+    store.put(2, LEFT, cursor())
+    store.delete(2)
+    store.delete(3)
+    assert store.flush() == 3
+    assert store.load() == []
+
+
+def test_survives_reopen(tmp_path):
+    path = tmp_path / "sessions.sqlite3"
+    first = SessionStore(path)
+    first.put(5, SUSPENDED, cursor(99))
+    # close flushes whatever is pending
+    first.close()
+
+    second = SessionStore(path)
+    try:
+        [(guild_id, state, data)] = second.load()
+    finally:
+        second.close()
+    assert (guild_id, state) == (5, SUSPENDED)
+    assert SessionCursor.decode(data).position == 99
+
+
+def test_failed_flush_keeps_pending(store, monkeypatch):
+    store.put(1, ACTIVE, cursor(1))
+
+    def broken():
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(store, "_connect", broken)
+    assert store.flush() == 0
+    # newer changes that arrive before the retry win
+    store.put(1, SUSPENDED, cursor(2))
+    assert store.load() == []
+
+    monkeypatch.undo()
+    assert store.flush() == 1
+    assert store.load() == [(1, SUSPENDED, cursor(2))]
+
+
+def test_unreadable_store_loads_empty(tmp_path):
+    path = tmp_path / "sessions.sqlite3"
+    path.write_bytes(b"not a database" * 100)
+    store = SessionStore(path)
+    assert store.load() == []
+    store.close()
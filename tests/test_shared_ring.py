@@ -0,0 +1,91 @@
+import ctypes
+from threading import Thread
+
+import pytest
+
+from ursa.shared_ring import SharedPCMRing
+
+CAPACITY: int = 64
+
+
+@pytest.fixture
+def ring():
+    ring = SharedPCMRing(CAPACITY)
+    yield ring
+    ring.release()
+
+
+def read(ring: SharedPCMRing, n: int) -> bytes:
+    buffer = (ctypes.c_char * n)()
+    got = ring.readinto(buffer)
+    return buffer.raw[:got]
+
+
+def test_wraps_around_the_end(ring):
+    first = bytes(range(48))
+    assert ring.write(first)
+    assert read(ring, 40) == first[:40]
+
+    # 8 bytes left at the head, so this write runs past the end of the buffer
+    second = bytes(range(100, 150))
+    assert ring.write(bytearray(second))
+    assert read(ring, 58) == first[40:] + second
+    ring.finish()
+    assert read(ring, 16) == b""
+
+
+def test_streams_more_than_capacity(ring):
+    data = bytes(i * 7 % 251 for i in range(CAPACITY * 50 + 13))
+    results = list()
+
+    def produce():
+        # chunks that do not divide the capacity, so every boundary is hit
+        for start in range(0, len(data), 37):
+            results.append(ring.write(data[start:start + 37]))
+        ring.finish()
+    writer = Thread(target=produce)
+    writer.start()
+
+    received = bytearray()
+    while True:
+        chunk = read(ring, 23)
+        received += chunk
+        if len(chunk) < 23:
+            break
+    writer.join(5)
+    assert not writer.is_alive()
+    assert bytes(received) == data
+    assert all(results)
+
+
+def test_attached_ring_shares_the_buffer(ring):
+    other = SharedPCMRing(name=ring.name)
+    try:
+        assert other.capacity == CAPACITY
+        assert not other.owner
+        other.write(b"pcm" * 20)
+        other.finish()
+        assert read(ring, 100) == b"pcm" * 20
+    finally:
+        other.release()
+
+
+def test_close_stops_a_blocked_writer(ring):
+    results = list()
+    writer = Thread(target=lambda: results.append(ring.write(b"x" * CAPACITY * 3)))
+    writer.start()
+    assert read(ring, CAPACITY) == b"x" * CAPACITY
+    ring.close()
+    writer.join(5)
+    assert not writer.is_alive()
+    assert results == [False]
+    assert ring.closed
+    assert read(ring, 8) == b""
+
+
+def test_release_is_idempotent():
+    ring = SharedPCMRing(CAPACITY)
+    ring.release()
+    ring.release()
+    assert ring.closed
+    assert not ring.write(b"late")
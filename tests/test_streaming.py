@@ -0,0 +1,176 @@
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import List, Optional
+
+import pytest
+
+from ursa import streaming
+from ursa.metrics import Counter
+from ursa.streaming import HttpStream, RingBuffer
+
+PAYLOAD: bytes = os.urandom(300 * 1024)
+RANGE_RE = re.compile(r'bytes=(\d+)-')
+
+
+class TrackServer(object):
+    """
+    Serves ``PAYLOAD`` and records the requests it gets. ``drop_after`` cuts the first response
+    short after that many bytes; ``ignore_range`` answers ranged requests with the whole file;
+    ``hold_after`` sends that many bytes, then waits for ``release`` before sending the rest.
+    """
+    drop_after: Optional[int]
+    ignore_range: bool
+    hold_after: Optional[int]
+    release: Event
+    ranges: List[Optional[str]]
+
+    def __init__(self):
+        self.drop_after = None
+        self.ignore_range = False
+        self.hold_after = None
+        self.release = Event()
+        self.ranges = list()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                range_header = self.headers.get("Range")
+                server.ranges.append(range_header)
+                match = RANGE_RE.fullmatch(range_header or "")
+                start = int(match.group(1)) if match and not server.ignore_range else 0
+
+                self.send_response(206 if start else 200)
+                self.send_header("Content-Length", str(len(PAYLOAD) - start))
+                if start:
+                    self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+                self.end_headers()
+
+                body = PAYLOAD[start:]
+                if server.drop_after is not None and len(server.ranges) == 1:
+                    # half a response, then a dead connection
+                    self.wfile.write(body[:server.drop_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                if server.hold_after is not None:
+                    self.wfile.write(body[:server.hold_after])
+                    self.wfile.flush()
+                    server.release.wait(10)
+                    body = body[server.hold_after:]
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/track.ogg"
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'TrackServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    with TrackServer() as track_server:
+        yield track_server
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(streaming, "RETRY_BACKOFF", 0)
+
+
+def read_all(ring: RingBuffer) -> bytes:
+    data = bytearray()
+    while True:
+        chunk = ring.read()
+        if not chunk:
+            return bytes(data)
+        data += chunk
+
+
+def test_stream_reads_whole_payload(server):
+    stream = HttpStream(server.url)
+    assert read_all(stream.ring) == PAYLOAD
+    assert stream.error is None
+    assert server.ranges == [None]
+
+
+def test_stream_resumes_with_range_after_drop(server):
+    server.drop_after = 100 * 1024
+    resumes = streaming.STREAM_RESUMES.total()
+
+    stream = HttpStream(server.url)
+    assert read_all(stream.ring) == PAYLOAD
+    assert server.ranges == [None, f"bytes={server.drop_after}-"]
+    assert streaming.STREAM_RESUMES.total() == resumes + 1
+
+
+def test_stream_discards_prefix_when_server_ignores_range(server):
+    server.drop_after = 100 * 1024
+    server.ignore_range = True
+
+    stream = HttpStream(server.url)
+    assert read_all(stream.ring) == PAYLOAD
+    assert server.ranges == [None, f"bytes={server.drop_after}-"]
+
+
+def test_stream_rebuffers_when_starved(server):
+    server.hold_after = 64 * 1024
+    rebuffers = Counter("test_stream_rebuffers_total", "rebuffers in test_stream_rebuffers_when_starved")
+    ring = RingBuffer(capacity=256 * 1024, rebuffer=32 * 1024, rebuffers=rebuffers)
+    HttpStream(server.url, ring=ring)
+
+    # drain what arrived before the server stalled
+    first = bytearray()
+    while len(first) < server.hold_after:
+        first += ring.read()
+    assert rebuffers.total() == 0
+
+    # the next read has to wait for a whole rebuffer's worth, not a trickle
+    reader = Thread(target=lambda: first.extend(ring.read()), daemon=True)
+    reader.start()
+    reader.join(0.2)
+    assert reader.is_alive()
+
+    server.release.set()
+    reader.join(10)
+    assert not reader.is_alive()
+    assert rebuffers.total() == 1
+    assert len(first) >= server.hold_after + ring.rebuffer or len(first) == len(PAYLOAD)
+    assert bytes(first) + read_all(ring) == PAYLOAD
+
+
+def test_ring_eof_returns_short_then_empty():
+    ring = RingBuffer(capacity=1024, rebuffer=512)
+    ring.write(b"x" * 100)
+    ring.finish()
+
+    buffer = bytearray(256)
+    assert ring.readinto(buffer) == 100
+    assert ring.read() == b""
+    assert ring.readinto(buffer) == 0
+
+
+def test_ring_close_unblocks_writer():
+    ring = RingBuffer(capacity=16, rebuffer=8)
+    result = list()
+    writer = Thread(target=lambda: result.append(ring.write(b"y" * 64)), daemon=True)
+    writer.start()
+    writer.join(0.1)
+    assert writer.is_alive()
+
+    ring.close()
+    writer.join(5)
+    assert result == [False]
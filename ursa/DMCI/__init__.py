@@ -1,14 +1,30 @@
+import asyncio
+import logging
 from argparse import ArgumentParser, ArgumentError, Namespace
-from importlib import import_module
-from os import listdir
-from os.path import dirname, isfile, join, basename
-from typing import Dict, Tuple, Optional, IO
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module, invalidate_caches, reload
+from importlib.metadata import entry_points
+from sys import modules
+from typing import Dict, List, Tuple, Optional, IO
 
 from ..parser_module import ParserModule
 
+log = logging.getLogger(__name__)
+
 
 PARSER_NAME: str = "Parser"
 PARSER_PREFIX: str = "c!"
+ENTRY_POINT_GROUP: str = "ursa.dmci"
+RELOAD_COMMAND: str = "reload"
+# seconds a chat command may compute before its caller gives up on it
+COMMAND_TIMEOUT: float = 10.0
+COMMAND_WORKERS: int = 2
+
+# subcommand -> "package.module" or "package.module:Attribute"
+MODULE_MANIFEST: Dict[str, str] = {
+    'roll': 'ursa.DMCI.roller',
+    'odds': 'ursa.DMCI.odds',
+}
 
 
 class __DEFUNCT_MODULE(ParserModule):
@@ -35,39 +51,136 @@ class DMCIArgumentParser(ArgumentParser):
         pass
 
 
-dmci_parser = DMCIArgumentParser(prog=PARSER_PREFIX)
-dmci_subparsers = dmci_parser.add_subparsers(dest='module')
-
+module_targets: Dict[str, str] = dict(MODULE_MANIFEST)
 command_parsers: Dict[str, Tuple[ArgumentParser, ParserModule]] = dict()
+_entry_points_loaded: bool = False
+# modules compute off the event loop, so a heavy query can't stall the client or the GUI
+_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=COMMAND_WORKERS, thread_name_prefix="ursa-dmci")
+
+
+def register_module(name: str, target: str) -> None:
+    module_targets[name] = target
+    command_parsers.pop(name, None)
+
+
+def _load_entry_points(rescan: bool = False) -> None:
+    """
+    Register the modules installed packages advertise; ``rescan`` looks again, for packages
+    installed since.
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded and not rescan:
+        return
+
+    if rescan:
+        invalidate_caches()
+    _entry_points_loaded = True
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        module_targets.setdefault(entry_point.name, entry_point.value)
+
+
+def _build_parser(name: str, mod) -> Tuple[ArgumentParser, ParserModule]:
+    target = module_targets[name]
+    attr = target.partition(':')[2] or PARSER_NAME
+    parser_module: ParserModule = getattr(mod, attr, __DEFUNCT_MODULE)()
+    if not isinstance(parser_module, ParserModule):
+        parser_module = __DEFUNCT_MODULE()
 
-IMPORTS_DIR = dirname(__file__)
-for module in listdir(IMPORTS_DIR):
-    print(f"DEBUG: probing module {module}...")
-    if isfile(join(IMPORTS_DIR, module)) and module != basename(__file__):
-        mod_name = '.'.join(['ursa', 'DMCI', module[:-3]])
-        print(f"DEBUG: IMPORTING MODULE {mod_name}")
-        mod = import_module(mod_name)
-        parser_module: ParserModule = getattr(mod, PARSER_NAME, __DEFUNCT_MODULE)()
-        if not isinstance(parser_module, ParserModule):
-            parser_module = __DEFUNCT_MODULE()
-
-        new_parser: ArgumentParser = dmci_subparsers.add_parser(parser_module.parser_name())
-        parser_module.init(new_parser)
-        command_parsers[parser_module.parser_name()] = (new_parser, parser_module)
-
-
-def parse_command(command: str) -> Optional[str]:
-    command = command.lstrip(PARSER_PREFIX).split()
-    print(f"Parsers are: {command_parsers.keys()}")
-    print(f"command is ({command})")
+    new_parser: ArgumentParser = DMCIArgumentParser(prog=f"{PARSER_PREFIX}{name}")
+    parser_module.init(new_parser)
+    return new_parser, parser_module
+
+
+def load_module(name: str) -> Optional[Tuple[ArgumentParser, ParserModule]]:
+    loaded = command_parsers.get(name, None)
+    if loaded is not None:
+        return loaded
+
+    _load_entry_points()
+    target = module_targets.get(name, None)
+    if target is None:
+        return None
+
+    log.debug("importing module %s", target)
     try:
-        ns = dmci_parser.parse_args(command)
+        mod = import_module(target.partition(':')[0])
+        command_parsers[name] = _build_parser(name, mod)
+    except Exception:
+        # a broken module answers as defunct instead of taking command parsing down with it
+        log.exception("failed to load module %s", target)
+        command_parsers[name] = _build_parser(name, None)
+    return command_parsers[name]
+
+
+def reload_module(name: str) -> str:
+    _load_entry_points(rescan=True)
+    target = module_targets.get(name, None)
+    if target is None:
+        return f"No such module {name}!"
+
+    mod_name = target.partition(':')[0]
+    try:
+        mod = reload(modules[mod_name]) if mod_name in modules else import_module(mod_name)
+        parser = _build_parser(name, mod)
+    except Exception as e:
+        # keep serving the previously loaded version
+        log.exception("failed to reload module %s", target)
+        return f"Reloading {name} failed: {e}"
+
+    command_parsers[name] = parser
+    return f"Reloaded {name}."
+
+
+def module_names() -> List[str]:
+    _load_entry_points()
+    return sorted(module_targets.keys())
+
+
+def format_usage() -> str:
+    names = ','.join(module_names())
+    return f"usage: {PARSER_PREFIX} {{{names},{RELOAD_COMMAND}}} ...\n"
+
+
+def parse_command(command: str, allow_reload: bool = False) -> Optional[str]:
+    """
+    Run a DMCI command line. ``reload`` swaps code in the running process, so only callers
+    vouching for the bot's owner (or the GUI) pass ``allow_reload``.
+    """
+    command = command[len(PARSER_PREFIX):] if command.startswith(PARSER_PREFIX) else command
+    args = command.split()
+    log.debug("command is (%s)", args)
+    if not args:
+        return format_usage()
+
+    name = args.pop(0)
+    if name == RELOAD_COMMAND:
+        if not allow_reload:
+            return "Only the bot's owner can reload modules."
+        if len(args) != 1:
+            return f"usage: {PARSER_PREFIX}{RELOAD_COMMAND} MODULE"
+        return reload_module(args[0])
+
+    loaded = load_module(name)
+    if loaded is None:
+        return format_usage()
+
+    parser, parse_mod = loaded
+    try:
+        ns = parser.parse_args(args)
     except ArgumentError as e:
-        print(e.message)
+        log.debug("parse failed: %s", e.message)
         return e.message
 
-    if ns.module:
-        parse_mod: ParserModule = command_parsers.get(ns.module, (None, __DEFUNCT_MODULE()))[1]
-        return parse_mod.process(ns)
+    return parse_mod.process(ns)
 
-    return dmci_parser.format_usage()
+
+async def run_command(command: str, allow_reload: bool = False, timeout: float = COMMAND_TIMEOUT) -> Optional[str]:
+    """
+    ``parse_command`` on a worker thread, giving up after ``timeout`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_executor, parse_command, command, allow_reload), timeout)
+    except asyncio.TimeoutError:
+        log.warning("command %r timed out", command)
+        return f"Timed out after {timeout:g}s."
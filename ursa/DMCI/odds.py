@@ -0,0 +1,292 @@
+import re
+from argparse import Namespace, ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ..parser_module import ParserModule
+
+
+TERM_RE = re.compile(r'([+-])(?:(\d*)d(\d+)(?:k([hl])(\d+))?|(\d+))')
+MAX_DICE: int = 1000
+MAX_FACES: int = 10000
+# sum over an expression's terms of count * faces: bounds the distribution's length, so the work
+MAX_WORK: int = 2_000_000
+# below this many products, np.convolve beats an FFT and stays exact
+DIRECT_CONVOLVE: int = 1 << 16
+MC_SAMPLES: int = 1_000_000
+# total dice rolled by one Monte Carlo estimate; wide expressions get fewer samples
+MC_MAX_ROLLS: int = 20_000_000
+MC_CHUNK: int = 200_000
+# bytes of rolls held at once, per chunk
+MC_CHUNK_BYTES: int = 64 * 1024 * 1024
+# processes a Monte Carlo estimate is split over unless configured; 1 samples on the command's thread
+MC_WORKERS: int = 1
+PERCENTILES: Tuple[int, ...] = (10, 25, 50, 75, 90)
+
+# module state is looked up in globals() first, so a DMCI reload keeps the configuration and the pool
+mc_workers: int = globals().get('mc_workers', MC_WORKERS)
+_pool: Optional[ProcessPoolExecutor] = globals().get('_pool')
+
+
+def configure(workers: Optional[int] = None) -> None:
+    """
+    Split Monte Carlo estimates over ``workers`` processes.
+    """
+    global mc_workers
+    if workers is not None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        mc_workers = workers
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None or _pool._max_workers < workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        # spawned, as the decoder pool's are: the GUI and client threads don't survive a fork
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    return _pool
+
+
+class DiceTerm(object):
+    sign: int
+    count: int
+    faces: int
+    keep: Optional[Tuple[str, int]]
+
+    def __init__(self, sign: int, count: int, faces: int, keep: Optional[Tuple[str, int]] = None):
+        self.sign = sign
+        self.count = count
+        self.faces = faces
+        self.keep = keep
+
+    @property
+    def is_simple(self) -> bool:
+        return self.keep is None or self.keep[1] >= self.count
+
+    def __str__(self) -> str:
+        text = f"{'-' if self.sign < 0 else '+'}{self.count}d{self.faces}"
+        if not self.is_simple:
+            text += f"k{self.keep[0]}{self.keep[1]}"
+        return text
+
+
+class Distribution(object):
+    """
+    Probability mass function over the integers [offset, offset + len(pmf)).
+    """
+    offset: int
+    pmf: np.ndarray
+    exact: bool
+    # Monte Carlo samples behind an estimate
+    samples: int
+
+    def __init__(self, offset: int, pmf: np.ndarray, exact: bool, samples: int = 0):
+        self.offset = offset
+        self.pmf = pmf
+        self.exact = exact
+        self.samples = samples
+
+    @property
+    def mean(self) -> float:
+        return float(np.dot(np.arange(self.offset, self.offset + len(self.pmf)), self.pmf))
+
+    def at_least(self, target: int) -> float:
+        start = min(max(target - self.offset, 0), len(self.pmf))
+        return float(self.pmf[start:].sum())
+
+    def percentile(self, q: float) -> int:
+        cdf = np.cumsum(self.pmf)
+        return self.offset + min(int(np.searchsorted(cdf, q / 100 - 1e-12)), len(self.pmf) - 1)
+
+
+def parse_expression(expression: str) -> Tuple[List[DiceTerm], int]:
+    text = expression.lower().replace(' ', '')
+    if not text.startswith(('+', '-')):
+        text = '+' + text
+
+    terms: List[DiceTerm] = list()
+    constant = 0
+    pos = 0
+    while pos < len(text):
+        match = TERM_RE.match(text, pos)
+        if match is None:
+            raise ValueError(f"Invalid dice expression '{expression}'")
+
+        sign_s, count_s, faces_s, keep_s, keep_n_s, const_s = match.groups()
+        sign = -1 if sign_s == '-' else 1
+        if const_s is not None:
+            constant += sign * int(const_s)
+        else:
+            count = int(count_s or 1)
+            faces = int(faces_s)
+            if not 0 < count <= MAX_DICE or not 0 < faces <= MAX_FACES:
+                raise ValueError(f"Dice out of range in '{expression}'")
+            keep = None
+            if keep_s is not None:
+                keep = (keep_s, int(keep_n_s))
+                if keep[1] == 0:
+                    raise ValueError(f"Cannot keep zero dice in '{expression}'")
+            terms.append(DiceTerm(sign, count, faces, keep))
+
+        pos = match.end()
+
+    if sum(t.count * t.faces for t in terms) > MAX_WORK:
+        raise ValueError(f"Too many dice in '{expression}'")
+    return terms, constant
+
+
+def normalize_expression(expression: str) -> str:
+    terms, constant = parse_expression(expression)
+    text = ''.join(str(t) for t in terms)
+    if constant or not terms:
+        text += f"{constant:+d}"
+    return text.lstrip('+')
+
+
+def _convolve(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(a) * len(b) <= DIRECT_CONVOLVE:
+        return np.convolve(a, b)
+
+    size = len(a) + len(b) - 1
+    n = 1 << (size - 1).bit_length()
+    out = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)[:size]
+    # round-off leaves tiny negative masses
+    np.clip(out, 0, None, out=out)
+    return out / out.sum()
+
+
+def _power(die: np.ndarray, count: int) -> np.ndarray:
+    # pmf of the sum of count dice by repeated squaring: O(log count) convolutions
+    result = np.ones(1)
+    while count:
+        if count & 1:
+            result = _convolve(result, die)
+        count >>= 1
+        if count:
+            die = _convolve(die, die)
+    return result
+
+
+def _convolve_terms(terms: List[DiceTerm], constant: int) -> Distribution:
+    offset = constant
+    pmf = np.ones(1)
+    for term in terms:
+        term_pmf = _power(np.full(term.faces, 1 / term.faces), term.count)
+        if term.sign < 0:
+            term_pmf = term_pmf[::-1]
+            offset -= term.count * term.faces
+        else:
+            offset += term.count
+        pmf = _convolve(pmf, term_pmf)
+
+    return Distribution(offset, pmf, exact=True)
+
+
+def _mc_samples(terms: List[DiceTerm]) -> int:
+    return max(min(MC_SAMPLES, MC_MAX_ROLLS // sum(t.count for t in terms)), 1)
+
+
+def _sample_terms(terms: List[DiceTerm], constant: int, samples: int, seed) -> Tuple[int, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(0, dtype=np.int64)
+    low = 0
+    remaining = samples
+    # int64 rolls of the widest term, and the copy sorting them makes
+    chunk = max(min(MC_CHUNK, MC_CHUNK_BYTES // (16 * max(t.count for t in terms))), 1)
+    while remaining > 0:
+        n = min(remaining, chunk)
+        totals = np.full(n, constant, dtype=np.int64)
+        for term in terms:
+            rolls = rng.integers(1, term.faces + 1, size=(n, term.count))
+            if not term.is_simple:
+                rolls.sort(axis=1)
+                rolls = rolls[:, -term.keep[1]:] if term.keep[0] == 'h' else rolls[:, :term.keep[1]]
+            totals += term.sign * rolls.sum(axis=1)
+
+        chunk_low = int(totals.min())
+        chunk_counts = np.bincount(totals - chunk_low)
+        low, counts = _merge_counts(low, counts, chunk_low, chunk_counts)
+        remaining -= n
+
+    return low, counts
+
+
+def _merge_counts(low_a: int, counts_a: np.ndarray, low_b: int, counts_b: np.ndarray) -> Tuple[int, np.ndarray]:
+    if not len(counts_a):
+        return low_b, counts_b
+
+    low = min(low_a, low_b)
+    high = max(low_a + len(counts_a), low_b + len(counts_b))
+    merged = np.zeros(high - low, dtype=np.int64)
+    merged[low_a - low:low_a - low + len(counts_a)] += counts_a
+    merged[low_b - low:low_b - low + len(counts_b)] += counts_b
+    return low, merged
+
+
+def _monte_carlo(terms: List[DiceTerm], constant: int, workers: int = 1) -> Distribution:
+    samples = _mc_samples(terms)
+    # every worker gets at least one sample, and the shares add up to exactly samples
+    workers = max(min(workers, samples), 1)
+    seeds = np.random.SeedSequence().spawn(workers)
+    if workers > 1:
+        shares = [samples // workers + (i < samples % workers) for i in range(workers)]
+        results = list(_get_pool(workers).map(_sample_terms, [terms] * workers, [constant] * workers,
+                                              shares, seeds))
+    else:
+        results = [_sample_terms(terms, constant, samples, seeds[0])]
+
+    low, counts = 0, np.zeros(0, dtype=np.int64)
+    for chunk_low, chunk_counts in results:
+        low, counts = _merge_counts(low, counts, chunk_low, chunk_counts)
+
+    return Distribution(low, counts / counts.sum(), exact=False, samples=samples)
+
+
+@lru_cache(maxsize=256)
+def _cached_distribution(normalized: str, workers: int = 1) -> Distribution:
+    terms, constant = parse_expression(normalized)
+    if all(t.is_simple for t in terms):
+        return _convolve_terms(terms, constant)
+
+    return _monte_carlo(terms, constant, workers)
+
+
+def distribution(expression: str, workers: Optional[int] = None) -> Distribution:
+    """
+    :param workers: processes a Monte Carlo estimate is split over; the configured number if None
+    """
+    return _cached_distribution(normalize_expression(expression), workers or mc_workers)
+
+
+class Parser(ParserModule):
+    parser: ArgumentParser
+
+    def init(self, parser: ArgumentParser):
+        self.parser = parser
+        parser.add_argument('expression', type=str, help="dice expression, e.g. 3d6+2 or 4d6kh3")
+        parser.add_argument('-t', '--target', type=int, default=None, help="report the chance to roll at least this")
+
+    def parser_name(self) -> str:
+        return 'odds'
+
+    def process(self, ns: Namespace) -> str:
+        try:
+            expression = normalize_expression(ns.expression)
+            dist = _cached_distribution(expression, mc_workers)
+        except ValueError as e:
+            return str(e)
+
+        method = "exact" if dist.exact else f"monte carlo, {dist.samples} samples"
+        result = f"{expression} ({method})\n"
+        result += f"Mean: {dist.mean:.2f}\n"
+        result += ', '.join(f"p{q}: {dist.percentile(q)}" for q in PERCENTILES) + '\n'
+        if ns.target is not None:
+            result += '------\n'
+            result += f"P(>= {ns.target}): {dist.at_least(ns.target) * 100:.2f}%"
+        return result.rstrip('\n')
@@ -1,22 +1,29 @@
-from typing import Optional, Callable, Dict
+from typing import Optional, Callable, Dict, List
 
 from discord import VoiceClient
 
+from .metrics import PHASE_SWITCH_LATENCY
 from .playlist import Playlist
 
 
 class PhasedContext(object):
     playlists: Dict[str, Playlist]
+    # phase played when none is given, and once another phase runs out
+    default_playlist: Optional[str]
     current_phase: Optional[str]
 
-    def __init__(self, playlists: Dict[str, Playlist]):
+    def __init__(self, playlists: Dict[str, Playlist], default_playlist: Optional[str] = None):
         self.playlists = playlists
+        self.default_playlist = default_playlist if default_playlist is not None else next(iter(playlists), None)
         self.current_phase = None
 
     @classmethod
-    def from_dict(cls, kv: dict):
-        assert all([x in kv.keys() for x in ("playlists", "default_playlist")])
-        return cls(playlists=kv['playlists'])
+    def from_dict(cls, kv: Dict[str, List[list]]):
+        """
+        A context as the config has it: phase names to lists of ``[track, next track]``. The first
+        phase is the default.
+        """
+        return cls({name: Playlist.from_list(tracks) for name, tracks in kv.items()})
 
     @property
     def current_playlist(self) -> Playlist:
@@ -28,14 +35,15 @@ class PhasedContext(object):
 
     def play_list(self, list_name: str, client: VoiceClient, callback: Callable) -> bool:
         if list_name in self.playlists:
-            client.stop()
-            if self.current_phase:
-                self.current_playlist.reset()
+            with PHASE_SWITCH_LATENCY.time():
+                client.stop()
+                if self.current_phase:
+                    self.current_playlist.reset()
 
-            self.current_phase = list_name
-            return self.current_playlist.play_track(client, callback)
+                self.current_phase = list_name
+                return self.current_playlist.play_track(client, callback)
 
         return False
 
     def play_default(self, client: VoiceClient, callback: Callable) -> bool:
-        return self.play_list(next(iter(self.playlists.keys())), client, callback)
+        return self.play_list(self.default_playlist, client, callback)
@@ -6,40 +6,179 @@ from argparse import ArgumentParser, Namespace
 from copy import deepcopy
 from json import load
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set
 
 from PyQt5.QtWidgets import QApplication
-from discord import Intents, VoiceClient, TextChannel, Guild
-from discord.ext import commands
+from discord import Interaction, VoiceClient, TextChannel, Guild, Member, VoiceState, app_commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Bot, Context, Cog
 from qasync import QEventLoop
 
 from .PhasedContext import PhasedContext
 from .interface.main_window import MainWindow
-from .session import BaseSession, BackgroundSession
-from .ursa_config import INVITE_LINK
+from .session import BaseSession, BackgroundSession, SessionCursor
+from .analysis import TARGET_LUFS, track_analysis
+from .cache import track_cache
+from .DMCI import module_names, odds, run_command
+from .decoder import decoder_pool
+from .discord.commands import complete, did_you_mean
+from .discord.profile import client_options
+from .discord.runner import new_event_loop
+from .log import setup_logging
+from .metrics import serve_metrics
+from .playback import IDLE_CHECK_INTERVAL, IDLE_TIMEOUT, connect_voice
+from .scheduler import audio_scheduler
+from .search import TrigramIndex
+from .session_store import ACTIVE, DEFAULT_STORE, LEFT, SUSPENDED, SessionStore
+from .ursa_config import INVITE_LINK, settings
+
+log = logging.getLogger(__name__)
+
+# how often session positions are written to the session store
+SNAPSHOT_INTERVAL: float = 5.0
+# sessions reconnected at once when restoring after a restart
+RESTORE_CONCURRENCY: int = 8
 
 ursa_bot: Bot = Bot(
     command_prefix='>',
     description="Ursa Music Bot",
-    intents=Intents.default()
+    **client_options(settings.MESSAGE_CONTENT, settings.CACHE_PROFILE)
 )
 
 
+async def acknowledge(ctx: Context, delete: bool = True) -> None:
+    """
+    Remove a prefix command's message, or answer a slash command privately so it doesn't show as failed.
+    """
+    if ctx.interaction is None:
+        if delete:
+            await ctx.message.delete()
+    elif not ctx.interaction.response.is_done():
+        await ctx.interaction.response.send_message("Ok.", ephemeral=True)
+
+
 class Ursa(Cog):
     bot: Bot
-    sessions: Dict[Guild, BaseSession]
+    # guild id -> session
+    sessions: Dict[int, BaseSession]
     ctx_groups: Dict[str, PhasedContext]
-
-    def __init__(self, bot: Bot, config: Dict):
+    # autocomplete index: context names, and phase names per context
+    context_names: List[str]
+    phase_names: Dict[str, List[str]]
+    # the same names, for resolving misspelt or partial arguments
+    context_index: TrigramIndex[str]
+    phase_indexes: Dict[str, TrigramIndex[str]]
+    # guild id -> encoded SessionCursor of its last closed session
+    cursors: Dict[int, bytes]
+    # guilds whose session was suspended while idle; their next command brings it back
+    suspended: Set[int]
+    idle_timeout: float
+    store: SessionStore
+    restored: bool
+    # push the slash commands to Discord once ready; only needed when they change
+    sync_commands: bool
+
+    def __init__(self, bot: Bot, config: Dict, idle_timeout: float = IDLE_TIMEOUT,
+                 store: Optional[SessionStore] = None, sync_commands: bool = False):
         self.bot = bot
         self.sessions = dict()
         self.ctx_groups = dict()
+        self.cursors = dict()
+        self.suspended = set()
+        self.idle_timeout = idle_timeout
+        self.store = store or SessionStore()
+        self.restored = False
+        self.sync_commands = sync_commands
         for name, context_cfg in config.items():
             self.ctx_groups[name] = PhasedContext.from_dict(context_cfg)
+        self.context_names = sorted(self.ctx_groups.keys())
+        self.phase_names = {name: list(context.playlists.keys()) for name, context in self.ctx_groups.items()}
+        self.context_index = TrigramIndex((name, name) for name in self.context_names)
+        self.phase_indexes = {
+            name: TrigramIndex((phase, phase) for phase in phases) for name, phases in self.phase_names.items()
+        }
+
+    async def cog_load(self) -> None:
+        if self.idle_timeout > 0:
+            self.reap_idle.start()
+        self.save_sessions.start()
+
+    async def cog_unload(self) -> None:
+        self.reap_idle.cancel()
+        self.save_sessions.cancel()
+        self.snapshot_sessions()
+        self.store.close()
+
+    def snapshot_sessions(self) -> None:
+        for guild_id, session in self.sessions.items():
+            if isinstance(session, BackgroundSession) and not session.closed:
+                self.store.put(guild_id, ACTIVE, session.snapshot().encode())
+
+    @tasks.loop(seconds=SNAPSHOT_INTERVAL)
+    async def save_sessions(self):
+        self.snapshot_sessions()
+        await asyncio.to_thread(self.store.flush)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.restored:
+            return
+
+        # only once per process; later on_ready events are gateway reconnects
+        self.restored = True
+        if self.sync_commands:
+            # syncing is rate limited, so only when asked; >sync does it later
+            await self.sync_tree()
+        await self.restore_all()
+
+    async def sync_tree(self) -> int:
+        synced = await self.bot.tree.sync()
+        log.info("synced %d slash commands", len(synced))
+        return len(synced)
+
+    async def restore_all(self) -> None:
+        """
+        Bring back every session recorded in the store, reconnecting the active ones in parallel.
+        """
+        rows = await asyncio.to_thread(self.store.load)
+        semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+        async def restore(guild: Guild, cursor: SessionCursor):
+            async with semaphore:
+                try:
+                    session = await self.restore_session(guild, cursor)
+                except Exception:
+                    log.exception("could not restore the session in %s", guild)
+                    session = None
+                if session is None:
+                    self.cursors.pop(guild.id, None)
+                    self.store.delete(guild.id)
+
+        pending = list()
+        for guild_id, state, data in rows:
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild_id in self.sessions:
+                continue
+
+            self.cursors[guild_id] = data
+            if state == SUSPENDED:
+                self.suspended.add(guild_id)
+            elif state == ACTIVE:
+                pending.append(restore(guild, SessionCursor.decode(data)))
+        log.info("restoring %d sessions", len(pending))
+        await asyncio.gather(*pending)
+
+    async def cog_before_invoke(self, ctx: Context) -> None:
+        # a suspended session comes back for the next command in its text channel
+        if ctx.guild is None or ctx.guild.id not in self.suspended or ctx.command.name in ("leave", "context"):
+            return
+
+        cursor = SessionCursor.decode(self.cursors[ctx.guild.id])
+        if ctx.channel.id == cursor.text_channel_id:
+            await self.restore_session(ctx.guild, cursor)
 
     def get_session(self, guild: Guild) -> Optional[BaseSession]:
-        return self.sessions.get(guild, None)
+        return self.sessions.get(guild.id, None)
 
     def channel_is_valid(self, channel: TextChannel) -> bool:
         session: Optional[BaseSession] = self.get_session(channel.guild)
@@ -52,77 +191,192 @@ class Ursa(Cog):
         vc: VoiceClient = await ctx.author.voice.node.connect()
         context: PhasedContext = deepcopy(self.ctx_groups[context_name])
         session = BackgroundSession(ctx.guild, context_name, context, vc, ctx.channel)
-        self.sessions[ctx.guild] = session
+        self.suspended.discard(ctx.guild.id)
+        data = self.cursors.pop(ctx.guild.id, None)
+        cursor = None if data is None else SessionCursor.decode(data)
+        if cursor is not None and cursor.context_name == context_name:
+            session.resume_point = cursor.resume_point
+        self.sessions[ctx.guild.id] = session
         return session
 
-    @commands.command()
+    async def restore_session(self, guild: Guild, cursor: SessionCursor) -> Optional[BackgroundSession]:
+        """
+        Reconnect a suspended or saved session and carry on from its cursor.
+        """
+        self.suspended.discard(guild.id)
+        voice_channel = None if cursor.voice_channel_id is None else guild.get_channel(cursor.voice_channel_id)
+        text_channel = guild.get_channel(cursor.text_channel_id)
+        if voice_channel is None or text_channel is None or cursor.context_name not in self.ctx_groups:
+            return None
+
+        vc = await connect_voice(voice_channel)
+        if vc is None:
+            return None
+
+        log.info("restoring session in %s", guild)
+        self.cursors.pop(guild.id, None)
+        context: PhasedContext = deepcopy(self.ctx_groups[cursor.context_name])
+        session = BackgroundSession(guild, cursor.context_name, context, vc, text_channel)
+        session.resume_point = cursor.resume_point
+        self.sessions[guild.id] = session
+        if cursor.playing:
+            session.play_from_resume_point()
+        return session
+
+    def close_session(self, session: BaseSession, suspend: bool = False) -> None:
+        """
+        Close ``session``, keeping its cursor; a suspended one comes back by itself on the next command.
+        """
+        guild_id = session.guild.id
+        if isinstance(session, BackgroundSession):
+            cursor = session.suspend()
+            if cursor.phase is not None or suspend:
+                self.cursors[guild_id] = cursor.encode()
+                self.store.put(guild_id, SUSPENDED if suspend else LEFT, self.cursors[guild_id])
+            else:
+                self.store.delete(guild_id)
+            if suspend:
+                self.suspended.add(guild_id)
+        else:
+            session.close()
+            self.store.delete(guild_id)
+        if self.sessions.get(guild_id) is session:
+            del self.sessions[guild_id]
+
+    @tasks.loop(seconds=IDLE_CHECK_INTERVAL)
+    async def reap_idle(self):
+        for session in list(self.sessions.values()):
+            if session.closed or not session.is_idle(self.idle_timeout):
+                continue
+
+            log.info("suspending idle session in %s", session.guild)
+            self.close_session(session, suspend=True)
+            await session.voice_client.disconnect()
+
+    @commands.hybrid_command()
     async def leave(self, ctx: Context):
-        await ctx.message.delete()
+        await acknowledge(ctx)
+        self.suspended.discard(ctx.guild.id)
         if not self.channel_is_valid(ctx.channel):
             return
 
         session: BaseSession = self.get_session(ctx.guild)
-        print("DEBUG: -> command leave")
-        session.stop()
+        log.debug("-> command leave")
+        self.close_session(session)
         await ctx.voice_client.disconnect()
-        del self.sessions[ctx.guild]
 
-    @commands.command()
+    @commands.hybrid_command()
+    async def join(self, ctx: Context):
+        await acknowledge(ctx)
+        if not self.channel_is_valid(ctx.channel):
+            return
+
+        session: BaseSession = self.get_session(ctx.guild)
+        if ctx.author.voice is None:
+            return await session.send_message("User not in voice channel!")
+        log.debug("-> command join %s", ctx.author.voice.channel)
+        await session.move_to(ctx.author.voice.channel)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: Member, before: VoiceState, after: VoiceState):
+        if member.id != self.bot.user.id or before.channel is None or after.channel is not None:
+            return
+
+        session: Optional[BaseSession] = self.get_session(member.guild)
+        if session is None or session.closed:
+            return
+
+        # the connection dropped without >leave; get it back and carry on where it was
+        log.info("voice connection in %s dropped, reconnecting", member.guild)
+        vc = await connect_voice(before.channel)
+        if session.closed:
+            if vc is not None:
+                await vc.disconnect()
+            return
+
+        if vc is None:
+            log.error("could not reconnect to %s, closing its session", before.channel)
+            self.close_session(session)
+            return
+
+        session.reconnect(vc)
+
+    @commands.hybrid_command()
     async def stop(self, ctx: Context):
-        await ctx.message.delete()
+        await acknowledge(ctx)
         if not self.channel_is_valid(ctx.channel):
             return
 
-        print("DEBUG: -> command stop")
+        log.debug("-> command stop")
         session: BaseSession = self.get_session(ctx.guild)
         if session is None or not isinstance(session, BackgroundSession):
             # await ctx.channel.send("No Session.")
             return
 
-        session.is_stopped = True
-        vc = session.voice_client
-        if vc and (vc.is_playing() or vc.is_paused()):
-            vc.stop()
-
+        session.stop()
         session.context.reset()
 
-    @commands.command()
+    @commands.hybrid_command()
     async def pause(self, ctx: Context):
-        await ctx.message.delete()
+        await acknowledge(ctx)
         if not self.channel_is_valid(ctx.channel):
             return
 
         session: Optional[BaseSession] = self.get_session(ctx.guild)
         if not isinstance(session, BackgroundSession):
             return
-        print("DEBUG: -> command pause")
-        vc = session.voice_client
-        if vc and vc.is_playing():
-            vc.pause()
+        log.debug("-> command pause")
+        session.player.pause()
 
-    @commands.command()
+    @commands.hybrid_command()
     async def resume(self, ctx: Context):
-        await ctx.message.delete()
+        await acknowledge(ctx)
         if not self.channel_is_valid(ctx.channel):
             return
 
         session: BaseSession = self.get_session(ctx.guild)
         if not isinstance(session, BackgroundSession):
             return
-        print("DEBUG: -> command resume")
-        vc = session.voice_client
-        if vc and vc.is_paused():
-            vc.resume()
+        log.debug("-> command resume")
+        if session.player.is_paused():
+            session.player.resume()
+        elif session.is_stopped:
+            session.play_from_resume_point()
+
+    @commands.hybrid_command()
+    @app_commands.describe(seconds="how far into the track")
+    async def seek(self, ctx: Context, seconds: float):
+        await acknowledge(ctx)
+        if not self.channel_is_valid(ctx.channel):
+            return
 
-    @commands.command()
-    async def context(self, ctx: Context, context_name: str, phase_name: Optional[str]):
+        session: BaseSession = self.get_session(ctx.guild)
+        if not isinstance(session, BackgroundSession):
+            return
+        log.debug("-> command seek %s", seconds)
+        if not session.seek(seconds):
+            return await session.send_message("Nothing is playing!")
+
+    def resolve_phase(self, session: BackgroundSession, phase_name: str) -> str:
+        """
+        The phase of the session's context that ``phase_name`` names, allowing for case, typos and
+        partial names; ``phase_name`` itself when none clearly matches.
+        """
+        return self.phase_indexes[session.context_name].resolve(phase_name) or phase_name
+
+    @commands.hybrid_command()
+    @app_commands.describe(context_name="context to play", phase_name="phase to start in")
+    async def context(self, ctx: Context, context_name: str, phase_name: Optional[str] = None):
+        await acknowledge(ctx, delete=False)
         session: Optional[BaseSession] = self.get_session(ctx.guild)
-        print(f"DEBUG: -> command context {context_name} {phase_name}")
+        log.debug("-> command context %s %s", context_name, phase_name)
+        context_name = self.context_index.resolve(context_name) or context_name
         if session is None:
             # Connect
             context: Optional[PhasedContext] = self.ctx_groups.get(context_name, None)
             if context is None:
-                return await ctx.channel.send(f"No such context {context_name}!")
+                return await ctx.channel.send(
+                    f"No such context {context_name}!{did_you_mean(self.context_index, context_name)}")
 
             if ctx.author.voice is None:
                 return await ctx.channel.send("User not in voice channel!")
@@ -132,42 +386,53 @@ class Ursa(Cog):
             if not isinstance(session, BackgroundSession):
                 return
             if context_name not in self.ctx_groups:
-                return await session.send_message(f"No such context {context_name}!")
+                return await session.send_message(
+                    f"No such context {context_name}!{did_you_mean(self.context_index, context_name)}")
 
             session.set_context(context_name, deepcopy(self.ctx_groups[context_name]))
 
         if phase_name is None:
+            # a new session in the context a guild left picks up where it was
+            if session.play_from_resume_point():
+                return
             return session.play_default()
 
+        phase_name = self.resolve_phase(session, phase_name)
         if phase_name not in session.context.playlists:
-            return await session.send_message(f"No phase {phase_name} in context {session.context_name}!")
+            hint = did_you_mean(self.phase_indexes[session.context_name], phase_name)
+            return await session.send_message(f"No phase {phase_name} in context {session.context_name}!{hint}")
 
         session.play_list(phase_name)
 
-    @commands.command()
+    @commands.hybrid_command()
+    @app_commands.describe(phase_name="phase of the playing context")
     async def phase(self, ctx: Context, phase_name: str):
+        await acknowledge(ctx, delete=False)
         if not self.channel_is_valid(ctx.channel):
             return
 
         session: BaseSession = self.get_session(ctx.guild)
         if not isinstance(session, BackgroundSession):
             return
-        print(f"DEBUG: -> command phase {phase_name}")
+        log.debug("-> command phase %s", phase_name)
+        phase_name = self.resolve_phase(session, phase_name)
         if phase_name not in session.context.playlists:
-            print(f"No phase {phase_name} in context {session.context_name}!")
-            return await session.send_message(f"No phase {phase_name} in context {session.context_name}!")
+            hint = did_you_mean(self.phase_indexes[session.context_name], phase_name)
+            return await session.send_message(f"No phase {phase_name} in context {session.context_name}!{hint}")
 
         session.play_list(phase_name)
 
-    @commands.command(name="list")
+    @commands.hybrid_command(name="list")
+    @app_commands.describe(what="contexts or phases")
     async def list_items(self, ctx: Context, what: str):
+        await acknowledge(ctx, delete=False)
         if not self.channel_is_valid(ctx.channel):
             return
 
         session: BaseSession = self.get_session(ctx.guild)
         if not isinstance(session, BackgroundSession):
             return
-        print(f"DEBUG: -> command list {what}")
+        log.debug("-> command list %s", what)
         if what == "contexts":
             return await session.send_message(str(list(self.ctx_groups.keys())))
 
@@ -176,8 +441,9 @@ class Ursa(Cog):
 
         return await session.send_message("Valid options are [\"contexts\", \"phases\"]")
 
-    @commands.command()
+    @commands.hybrid_command()
     async def skip(self, ctx: Context):
+        await acknowledge(ctx, delete=False)
         if not self.channel_is_valid(ctx.channel):
             return
 
@@ -185,27 +451,88 @@ class Ursa(Cog):
         if not isinstance(session, BackgroundSession):
             return
 
-        print("DEBUG: -> command skip")
+        log.debug("-> command skip")
         session.next_track()
 
+    @commands.hybrid_command()
+    @app_commands.describe(module="DMCI module", args="its arguments, as after c!<module>")
+    async def dmci(self, ctx: Context, module: str, *, args: str = ""):
+        log.debug("-> command dmci %s %s", module, args)
+        async with ctx.typing():
+            resp = await run_command(f"{module} {args}", await self.bot.is_owner(ctx.author))
+        await ctx.send(resp or "None")
+
+    @context.autocomplete('context_name')
+    async def context_name_autocomplete(self, interaction: Interaction,
+                                        current: str) -> List[app_commands.Choice[str]]:
+        return complete(self.context_names, current, self.context_index)
+
+    @context.autocomplete('phase_name')
+    async def context_phase_autocomplete(self, interaction: Interaction,
+                                         current: str) -> List[app_commands.Choice[str]]:
+        context_name = self.context_index.resolve(interaction.namespace.context_name or "")
+        if context_name is None:
+            return list()
+        return complete(self.phase_names[context_name], current, self.phase_indexes[context_name])
+
+    @phase.autocomplete('phase_name')
+    async def phase_autocomplete(self, interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+        session: Optional[BaseSession] = self.sessions.get(interaction.guild_id)
+        if not isinstance(session, BackgroundSession):
+            return list()
+        return complete(self.phase_names[session.context_name], current, self.phase_indexes[session.context_name])
+
+    @list_items.autocomplete('what')
+    async def list_autocomplete(self, interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+        return complete(("contexts", "phases"), current)
+
+    @dmci.autocomplete('module')
+    async def dmci_module_autocomplete(self, interaction: Interaction,
+                                       current: str) -> List[app_commands.Choice[str]]:
+        return complete(module_names(), current)
+
+    @commands.command()
+    @commands.is_owner()
+    async def sync(self, ctx: Context):
+        log.debug("-> command sync")
+        await ctx.send(f"Synced {await self.sync_tree()} slash commands.")
+
     @commands.command()
     async def shutdown(self, ctx: Context):
-        print("DEBUG: -> command shutdown")
+        log.debug("-> command shutdown")
+        # sessions stay active in the store, so they come back on the next start
+        self.snapshot_sessions()
+        await asyncio.to_thread(self.store.flush)
         await ctx.send("shutting down!")
         await ursa_bot.close()
 
 
 @ursa_bot.event
 async def on_ready():
-    print(f"Logged in as {ursa_bot.user.name} ({ursa_bot.user.id})")
-    print(f"Invite link: {INVITE_LINK}")
+    log.info("Logged in as %s (%s)", ursa_bot.user.name, ursa_bot.user.id)
+    log.info("Invite link: %s", INVITE_LINK)
+
+
+async def start_bot(config: Dict, idle_timeout: float, store: SessionStore, sync_commands: bool = False) -> None:
+    async with ursa_bot:
+        await ursa_bot.add_cog(Ursa(ursa_bot, config, idle_timeout, store, sync_commands))
+        await ursa_bot.start(settings.TOKEN)
 
 
-#    while True:
-#        cmd = input()
-#        print(f"Received command: {cmd}")
-#        if cmd == "exit":
-#            exit(0)
+def run_bot(config: Dict, ns: Namespace) -> None:
+    """
+    Run headless: contexts and phases from the config, played by chat and slash commands.
+    """
+    loop = new_event_loop(ns.uvloop)
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(start_bot(config, ns.idle_timeout * 60, SessionStore(Path(ns.session_store)),
+                                          ns.sync_commands))
+    except KeyboardInterrupt:
+        # closing the bot unloads the cog, which saves the sessions
+        loop.run_until_complete(ursa_bot.close())
+    finally:
+        loop.close()
 
 
 def main() -> int:
@@ -213,8 +540,47 @@ def main() -> int:
     parser: ArgumentParser = ArgumentParser()
     parser.add_argument('-c', '--config', default=(Path.home() / ".config" / "ursa.json").as_posix(),
                         type=str, help="config file for Ursa", dest='config')
-    # parser.add_argument('-g', '--gui', action="store_true", default=False, help="Use pyqt gui method")
-
+    parser.add_argument('-l', '--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="minimum level of log messages to emit", dest='log_level')
+    parser.add_argument('-m', '--metrics-port', default=None, type=int,
+                        help="serve Prometheus metrics on this local port", dest='metrics_port')
+    parser.add_argument('--cache-dir', default=None, type=str,
+                        help="prefetch tracks into this local directory (for slow or network mounts)", dest='cache_dir')
+    parser.add_argument('--cache-size', default=2048, type=int,
+                        help="size limit of the track cache in MiB", dest='cache_size')
+    parser.add_argument('--max-decoders', default=None, type=int,
+                        help="cap on audio decoders running at once", dest='max_decoders')
+    parser.add_argument('--decoder', default='auto', choices=['auto', 'ffmpeg'],
+                        help="decode in-process with PyAV when installed (auto), or always with FFmpeg",
+                        dest='decoder')
+    parser.add_argument('--transport', default='pipe', choices=['pipe', 'shm'],
+                        help="decode local files in-process (pipe) or in worker processes over shared memory (shm)",
+                        dest='transport')
+    parser.add_argument('--scheduler-threads', default=1, type=int,
+                        help="threads sending audio for all voice clients; 0 for discord.py's thread per stream",
+                        dest='scheduler_threads')
+    parser.add_argument('--bot', action='store_true', default=False,
+                        help="run as a headless bot playing the config's contexts by command, without the GUI",
+                        dest='bot')
+    parser.add_argument('--sync-commands', action='store_true', default=False,
+                        help="register the slash commands with Discord on login (after installing or upgrading)",
+                        dest='sync_commands')
+    parser.add_argument('--uvloop', action='store_true', default=False,
+                        help="run the Discord client's event loop on uvloop (if installed)", dest='uvloop')
+    parser.add_argument('--idle-timeout', default=IDLE_TIMEOUT / 60, type=float, metavar='MINUTES',
+                        help="suspend voice sessions idle this long, until their next command (0 to never)",
+                        dest='idle_timeout')
+    parser.add_argument('--session-store', default=DEFAULT_STORE.as_posix(), type=str,
+                        help="where the bot's sessions are saved, to be restored after a restart (with --bot)",
+                        dest='session_store')
+    parser.add_argument('--normalize', nargs='?', default=None, const=TARGET_LUFS, type=float, metavar='LUFS',
+                        help=f"normalize track loudness (default target {TARGET_LUFS} LUFS); "
+                             f"each track is measured once in the background", dest='normalize')
+    parser.add_argument('--trim-loops', action='store_true', default=False,
+                        help="play self-looping tracks between detected loop points, without edge silence",
+                        dest='trim_loops')
+    parser.add_argument('--odds-workers', default=odds.MC_WORKERS, type=int,
+                        help="processes c!odds splits its Monte Carlo estimates over", dest='odds_workers')
     ns: Namespace = parser.parse_args(argv)
 
     try:
@@ -223,20 +589,32 @@ def main() -> int:
         config: Dict = dict()
 
     assert isinstance(config, dict)
-    logging.basicConfig(level=logging.INFO)
+    setup_logging(getattr(logging, ns.log_level))
+    if ns.metrics_port is not None:
+        serve_metrics(ns.metrics_port)
+    if ns.cache_dir is not None:
+        track_cache.configure(Path(ns.cache_dir), ns.cache_size * 1024 ** 2, enabled=True)
+    decoder_pool.configure(max_decoders=ns.max_decoders, use_pyav=ns.decoder == 'auto', transport=ns.transport)
+    decoder_pool.warm_up()
+    audio_scheduler.configure(threads=ns.scheduler_threads)
+    if ns.normalize is not None:
+        track_analysis.configure(target=ns.normalize, normalize=True)
+    if ns.trim_loops:
+        track_analysis.configure(trim=True)
+    odds.configure(workers=ns.odds_workers)
+
+    if ns.bot:
+        run_bot(config, ns)
+        return 0
 
-    # if ns.gui:
     app = QApplication(sys.argv)
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
-    gui = MainWindow()
+    gui = MainWindow(idle_timeout=ns.idle_timeout * 60, use_uvloop=ns.uvloop, sync_commands=ns.sync_commands)
     gui.tracks_dock.load_model(config)
     gui.show()
     loop.run_forever()
-    # else:
-    #     ursa_bot.add_cog(Ursa(ursa_bot, config))
-    #     ursa_bot.run(settings.TOKEN)
 
     return 0
 
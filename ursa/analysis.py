@@ -0,0 +1,382 @@
+import json
+import logging
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryFile
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+import numpy as np
+
+from .cache import content_key
+from .decoder import FFMPEG_OUTPUT, SAMPLING_RATE, audio_graph, av, decoder_pool, filter_frames
+from .metrics import Counter
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STORE: Path = Path.home() / ".cache" / "ursa" / "analysis.json"
+# EBU R128 integrated loudness to normalize to
+TARGET_LUFS: float = -18.0
+MAX_GAIN_DB: float = 12.0
+# anything quieter is treated as silence and left alone
+SILENCE_LUFS: float = -60.0
+# samples below this peak level count as silence when trimming
+SILENCE_DBFS: float = -60.0
+# how far from each end of the audible part to look for loop points, in samples at 48 kHz
+LOOP_SEARCH: int = 4800
+# bump when analyse_file starts producing new fields, so old entries are measured again
+ANALYSIS_VERSION: int = 2
+ANALYSIS_WORKERS: int = 1
+# write the store after this many new results, or when the queue drains
+SAVE_EVERY: int = 50
+# bytes of PCM read from FFmpeg at a time (whole stereo s16 samples)
+READ_CHUNK: int = 256 * 1024
+LOUDNESS_RE = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+
+TRACKS_ANALYSED = Counter("ursa_tracks_analysed_total", "Tracks measured by the analysis pass")
+
+
+def loop_points(head: np.ndarray, tail: np.ndarray, start: int, end: int,
+                search: int = LOOP_SEARCH) -> Tuple[int, int]:
+    """
+    Pick loop points within ``[start, end)`` at rising zero crossings: the first one near
+    ``start``, and the latest of those near ``end`` whose level and slope best continue into it.
+    Playing ``[loop_start, loop_end)`` repeatedly then has no click at the seam.
+
+    ``head`` and ``tail`` are the mono samples (int32) from ``start`` and up to ``end``: at least
+    ``search`` + 1 and ``search`` of them respectively, or all of them if there are fewer.
+    """
+    length = end - start
+    if length < 2:
+        return start, end
+
+    head = head[:min(search + 1, length)]
+    tail = tail[-min(search, length):]
+    offset = length - tail.size
+    head_rising = np.flatnonzero((head[:-1] < 0) & (head[1:] >= 0)) + 1
+    head_rising = head_rising[head_rising < search]
+    if not head_rising.size:
+        return start, end
+
+    first = head_rising[0]
+    tail_rising = np.flatnonzero((tail[:-1] < 0) & (tail[1:] >= 0)) + 1
+    tail_rising = tail_rising[offset + tail_rising > first]
+    if not tail_rising.size:
+        return start, end
+
+    head_slope = np.diff(head, append=head[-1])
+    tail_slope = np.diff(tail, append=tail[-1])
+    score = np.abs(tail[tail_rising] - head[first]) + np.abs(tail_slope[tail_rising] - head_slope[first])
+    # of equally good seams, the latest keeps the most of the track
+    best = score.size - 1 - int(np.argmin(score[::-1]))
+    return start + int(first), start + offset + int(tail_rising[best])
+
+
+class PcmScan(object):
+    """
+    Silence bounds of PCM (samples x channels, int16) fed to it a chunk at a time, keeping only
+    the mono samples ``loop_points`` needs after the start and before the end, not the track.
+    """
+    threshold: float
+    search: int
+    samples: int
+    start: Optional[int]
+    end: int
+    head: np.ndarray
+    tail: np.ndarray
+    recent: np.ndarray
+
+    def __init__(self, threshold_dbfs: float = SILENCE_DBFS, search: int = LOOP_SEARCH):
+        self.threshold = 32768 * 10 ** (threshold_dbfs / 20)
+        self.search = search
+        self.samples = 0
+        self.start = None
+        self.end = 0
+        self.head = self.tail = self.recent = np.zeros(0, dtype=np.int32)
+
+    def feed(self, pcm: np.ndarray) -> None:
+        wide = pcm.astype(np.int32)
+        audible = np.flatnonzero(np.abs(wide).max(axis=1) > self.threshold)
+        mono = wide.sum(axis=1)
+        offset = self.samples
+        self.samples += mono.size
+
+        if audible.size:
+            if self.start is None:
+                self.start = offset + int(audible[0])
+            last = int(audible[-1]) + 1
+            self.end = offset + last
+            self.tail = np.concatenate((self.recent, mono[:last][-self.search:]))[-self.search:]
+        if self.start is not None and self.head.size <= self.search:
+            begin = max(self.start - offset, 0)
+            self.head = np.concatenate((self.head, mono[begin:begin + self.search + 1 - self.head.size]))
+        # the samples before the next chunk, in case its end is audible
+        self.recent = np.concatenate((self.recent, mono[-self.search:]))[-self.search:]
+
+    def bounds(self) -> Tuple[int, int]:
+        """
+        First and one-past-last sample above the threshold so far.
+        """
+        if self.start is None:
+            return 0, 0
+
+        return self.start, self.end
+
+    def loop_points(self) -> Tuple[int, int]:
+        start, end = self.bounds()
+        return loop_points(self.head, self.tail, start, end, self.search)
+
+
+def _pyav_chunks(path: str, result: Dict[str, float]) -> Iterator[np.ndarray]:
+    # ebur128 tags each frame it passes with the integrated loudness so far
+    with av.open(path, 'r') as container:
+        stream = container.streams.audio[0]
+        graph = audio_graph(stream, ('ebur128', 'metadata=1'))
+        resampler = av.AudioResampler(format='s16', layout='stereo', rate=SAMPLING_RATE)
+
+        def measured(frame) -> Iterator[np.ndarray]:
+            for out in filter_frames(graph, frame):
+                loudness = out.metadata.get('lavfi.r128.I')
+                if loudness is not None:
+                    result["loudness"] = float(loudness)
+                for pcm in resampler.resample(out):
+                    yield pcm.to_ndarray().reshape(-1, 2)
+
+        for frame in container.decode(stream):
+            yield from measured(frame)
+        yield from measured(None)
+        for pcm in resampler.resample(None):
+            yield pcm.to_ndarray().reshape(-1, 2)
+
+
+def _ffmpeg_chunks(path: str, executable: str, result: Dict[str, float]) -> Iterator[np.ndarray]:
+    args = [executable, '-hide_banner', '-nostats', '-i', path, '-af', 'ebur128=framelog=quiet'] + FFMPEG_OUTPUT
+    args[args.index('-loglevel') + 1] = 'info'
+    # the summary is on stderr at the very end; a file can't fill up and stall FFmpeg like a pipe
+    with TemporaryFile() as stderr:
+        process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            chunk = process.stdout.read(READ_CHUNK)
+            while chunk:
+                yield np.frombuffer(chunk[:len(chunk) - len(chunk) % 4], dtype=np.int16).reshape(-1, 2)
+                chunk = process.stdout.read(READ_CHUNK)
+        except BaseException:
+            # closed early or failed; FFmpeg may still be decoding
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            # at EOF, FFmpeg is still writing the summary the loudness is read from
+            process.wait()
+
+        stderr.seek(0)
+        matches = LOUDNESS_RE.findall(stderr.read().decode(errors='replace'))
+        if not process.returncode and matches:
+            result["loudness"] = float(matches[-1])
+
+
+def analyse_file(path: str, executable: str = "ffmpeg", use_pyav: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Decode ``path`` once and measure its integrated loudness (LUFS, FFmpeg's ebur128 filter),
+    silence boundaries and loop points, all in samples at 48 kHz. Decodes with PyAV when
+    ``use_pyav``, otherwise with the FFmpeg binary, and scans the PCM as it comes.
+    """
+    result: Dict[str, float] = dict()
+    chunks = _pyav_chunks(path, result) if use_pyav and av is not None else _ffmpeg_chunks(path, executable, result)
+    scan = PcmScan()
+    try:
+        for pcm in chunks:
+            scan.feed(pcm)
+    except Exception as e:
+        log.warning("could not analyse %s: %s", path, e)
+        return None
+    if "loudness" not in result:
+        log.warning("could not analyse %s", path)
+        return None
+
+    start, end = scan.bounds()
+    loop_start, loop_end = scan.loop_points()
+    return {
+        "version": ANALYSIS_VERSION,
+        "loudness": result["loudness"],
+        "samples": scan.samples,
+        "start": start,
+        "end": end,
+        "loop_start": loop_start,
+        "loop_end": loop_end,
+    }
+
+
+class TrackAnalysis(object):
+    """
+    Persistent per-file analysis results (see ``analyse_file``), measured once in the
+    background and looked up when a track is opened, to normalize its loudness and/or trim
+    a self-looping track to its loop points.
+
+    Results are keyed by the file's path, size and mtime, like the track cache, so an edited
+    file is measured again. Files that fail to analyse are recorded as such, and only tried
+    again once they change.
+    """
+    store: Path
+    target: float
+    normalize: bool
+    trim: bool
+    executable: str
+    entries: Dict[str, Dict[str, Any]]
+    pending: Set[str]
+    lock: Lock
+    executor: Optional[ThreadPoolExecutor]
+    _loaded: bool
+    _unsaved: int
+
+    def __init__(self, store: Path = DEFAULT_STORE, target: float = TARGET_LUFS, normalize: bool = True,
+                 trim: bool = True, executable: str = "ffmpeg"):
+        self.store = store
+        self.target = target
+        self.normalize = normalize
+        self.trim = trim
+        self.executable = executable
+        self.entries = dict()
+        self.pending = set()
+        self.lock = Lock()
+        self.executor = None
+        self._loaded = False
+        self._unsaved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.normalize or self.trim
+
+    def configure(self, store: Optional[Path] = None, target: Optional[float] = None,
+                  normalize: Optional[bool] = None, trim: Optional[bool] = None) -> None:
+        with self.lock:
+            if store is not None and store != self.store:
+                self.store = store
+                self.entries.clear()
+                self._loaded = False
+            if target is not None:
+                self.target = target
+            if normalize is not None:
+                self.normalize = normalize
+            if trim is not None:
+                self.trim = trim
+
+    def _load(self) -> None:
+        # caller holds self.lock
+        if self._loaded:
+            return
+
+        self._loaded = True
+        try:
+            with open(self.store, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("ignoring unreadable analysis store %s: %s", self.store, e)
+
+    def _save(self) -> None:
+        # caller holds self.lock
+        self.store.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.store.with_name(self.store.name + ".part")
+        with open(partial, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(partial, self.store)
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Analysis of ``path``, or None (and queue it) if it has not been analysed yet, or None
+        if it could not be analysed.
+        """
+        if not self.enabled or "://" in path:
+            return None
+
+        key = content_key(path)
+        if key is None:
+            return None
+
+        with self.lock:
+            self._load()
+            entry = self.entries.get(key)
+        if entry is None or entry.get("version") != ANALYSIS_VERSION:
+            self.analyse([path])
+            return None
+        if entry.get("failed"):
+            return None
+
+        return entry
+
+    def gain(self, path: str) -> float:
+        """
+        Gain in dB that brings ``path`` to the target loudness; 0 while it is not yet measured.
+        """
+        entry = self.get(path) if self.normalize else None
+        if entry is None:
+            return 0.0
+
+        loudness = entry.get("loudness")
+        if loudness is None or loudness < SILENCE_LUFS:
+            return 0.0
+
+        return max(-MAX_GAIN_DB, min(MAX_GAIN_DB, self.target - loudness))
+
+    def bounds(self, path: str, looping: bool) -> Tuple[int, Optional[int]]:
+        """
+        Sample range of ``path`` to play: its loop points when it repeats itself, otherwise
+        all of it. (0, None) while it is not yet analysed.
+        """
+        entry = self.get(path) if self.trim and looping else None
+        if entry is None or entry["loop_end"] <= entry["loop_start"]:
+            return 0, None
+
+        return entry["loop_start"], entry["loop_end"]
+
+    def analyse(self, paths: Iterable[str]) -> None:
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self._load()
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="ursa-analysis")
+            for path in paths:
+                key = content_key(path)
+                if key is None or key in self.pending:
+                    continue
+                if self.entries.get(key, dict()).get("version") == ANALYSIS_VERSION:
+                    continue
+                self.pending.add(key)
+                self.executor.submit(self._analyse, path, key)
+
+    def _analyse(self, path: str, key: str) -> None:
+        try:
+            entry = analyse_file(path, self.executable, decoder_pool.use_pyav)
+            if entry is None:
+                # don't queue (and log) it again on every open, only once the file changes
+                with self.lock:
+                    self.entries[key] = {"version": ANALYSIS_VERSION, "failed": True}
+                    self._unsaved += 1
+                return
+
+            TRACKS_ANALYSED.inc()
+            log.debug("%s: %.1f LUFS, audible %d-%d, loop %d-%d", path, entry["loudness"], entry["start"],
+                      entry["end"], entry["loop_start"], entry["loop_end"])
+            with self.lock:
+                self.entries[key] = entry
+                self._unsaved += 1
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+                if self._unsaved and (self._unsaved >= SAVE_EVERY or not self.pending):
+                    self._unsaved = 0
+                    try:
+                        self._save()
+                    except OSError as e:
+                        log.warning("could not write analysis store %s: %s", self.store, e)
+
+
+# disabled until configured, e.g. with --normalize or --trim-loops
+track_analysis = TrackAnalysis(normalize=False, trim=False)
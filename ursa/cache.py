@@ -0,0 +1,204 @@
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from pathlib import Path
+from shutil import copyfileobj
+from threading import Lock
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from .metrics import Counter
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR: Path = Path.home() / ".cache" / "ursa" / "tracks"
+DEFAULT_MAX_BYTES: int = 2 * 1024 ** 3
+# files bigger than this are not copied; only their head is read to warm the OS page cache
+MAX_FILE_BYTES: int = 256 * 1024 ** 2
+HEAD_BYTES: int = 4 * 1024 ** 2
+READAHEAD_DEPTH: int = 2
+COPY_BLOCK: int = 1024 * 1024
+PREFETCH_WORKERS: int = 2
+
+CACHE_HITS = Counter("ursa_track_cache_hits_total", "Track opens served from the local prefetch cache")
+CACHE_MISSES = Counter("ursa_track_cache_misses_total", "Track opens that went to the original path")
+
+
+def content_key(path: str) -> Optional[str]:
+    """
+    Identify a file by its absolute path, size and mtime, so a changed file gets a new key.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+
+
+def readahead(tracks: Sequence[Tuple[str, int]], start: int, depth: int = READAHEAD_DEPTH) -> List[str]:
+    """
+    Walk a playlist's successor graph breadth-first from ``start``.
+
+    :param tracks: (path, next track number) pairs; -1 means any track may follow
+    :param start: index of the track about to play
+    :param depth: how many transitions ahead to look
+    :return: paths in the order they should be fetched, nearest first
+    """
+    if start not in range(len(tracks)):
+        return list()
+
+    order = [start]
+    seen = {start}
+    frontier = [start]
+    for _ in range(depth):
+        next_frontier = list()
+        for index in frontier:
+            next_no = tracks[index][1]
+            successors = range(len(tracks)) if next_no == -1 else [next_no]
+            for succ in successors:
+                if succ in range(len(tracks)) and succ not in seen:
+                    seen.add(succ)
+                    order.append(succ)
+                    next_frontier.append(succ)
+        frontier = next_frontier
+
+    return [tracks[i][0] for i in order]
+
+
+class TrackCache(object):
+    """
+    Size-bounded LRU copy of slow (e.g. network-mounted) track files on local disk.
+
+    Entries are keyed by the source path, size and mtime, so a changed source is
+    simply a miss and the stale copy ages out.
+    """
+    directory: Path
+    max_bytes: int
+    enabled: bool
+    entries: 'OrderedDict[str, int]'
+    pending: Set[str]
+    lock: Lock
+    executor: Optional[ThreadPoolExecutor]
+    _scanned: bool
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 enabled: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.pending = set()
+        self.lock = Lock()
+        self.executor = None
+        self._scanned = False
+
+    def configure(self, directory: Optional[Path] = None, max_bytes: Optional[int] = None,
+                  enabled: Optional[bool] = None) -> None:
+        with self.lock:
+            if directory is not None and directory != self.directory:
+                self.directory = directory
+                self.entries.clear()
+                self._scanned = False
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if enabled is not None:
+                self.enabled = enabled
+
+    def _scan(self) -> None:
+        # caller holds self.lock
+        if self._scanned:
+            return
+
+        self._scanned = True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [f for f in self.directory.iterdir() if f.is_file() and not f.name.endswith(".part")]
+        for f in sorted(files, key=lambda x: x.stat().st_atime):
+            self.entries[f.name] = f.stat().st_size
+
+    def _key(self, path: str) -> Optional[str]:
+        digest = content_key(path)
+        if digest is None:
+            return None
+
+        return digest + Path(path).suffix
+
+    def resolve(self, path: str) -> str:
+        """
+        Return the cached copy of ``path`` if there is one, otherwise ``path`` itself.
+        """
+        if not self.enabled or "://" in path:
+            return path
+
+        key = self._key(path)
+        with self.lock:
+            self._scan()
+            if key is not None and key in self.entries:
+                self.entries.move_to_end(key)
+                CACHE_HITS.inc()
+                return (self.directory / key).as_posix()
+
+        CACHE_MISSES.inc()
+        return path
+
+    def prefetch(self, paths: Iterable[str]) -> None:
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self._scan()
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="ursa-prefetch")
+            for path in paths:
+                if "://" in path or path in self.pending:
+                    continue
+                self.pending.add(path)
+                self.executor.submit(self._fetch, path)
+
+    def _fetch(self, path: str) -> None:
+        try:
+            key = self._key(path)
+            if key is None:
+                return
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    return
+
+            size = os.path.getsize(path)
+            if size > MAX_FILE_BYTES or size > self.max_bytes:
+                with open(path, 'rb') as src:
+                    src.read(HEAD_BYTES)
+                log.debug("warmed head of %s", path)
+                return
+
+            target = self.directory / key
+            partial = target.with_name(target.name + ".part")
+            with open(path, 'rb') as src, open(partial, 'wb') as dst:
+                copyfileobj(src, dst, COPY_BLOCK)
+            os.replace(partial, target)
+            with self.lock:
+                self.entries[key] = size
+                self._evict()
+            log.debug("cached %s as %s", path, key)
+        except OSError as e:
+            log.warning("prefetch of %s failed: %s", path, e)
+        finally:
+            with self.lock:
+                self.pending.discard(path)
+
+    def _evict(self) -> None:
+        # caller holds self.lock
+        total = sum(self.entries.values())
+        while total > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            total -= size
+            try:
+                (self.directory / key).unlink()
+            except OSError:
+                pass
+
+
+# disabled until configured, e.g. with --cache-dir
+track_cache = TrackCache(enabled=False)
@@ -0,0 +1,711 @@
+import atexit
+import ctypes
+import logging
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from threading import BoundedSemaphore, Event, Lock, Thread
+from time import perf_counter
+from typing import BinaryIO, Callable, Deque, Iterator, List, Optional, Tuple, Union
+
+from discord import AudioSource
+from discord.opus import Encoder
+
+from .metrics import Counter, FFMPEG_SPAWN, Gauge
+from .shared_ring import SharedPCMRing
+from .streaming import RingBuffer
+
+try:
+    import av
+except ImportError:
+    av = None
+
+log = logging.getLogger(__name__)
+
+FRAME_SIZE: int = Encoder.FRAME_SIZE
+SAMPLING_RATE: int = Encoder.SAMPLING_RATE
+# bytes per stereo s16 sample
+SAMPLE_SIZE: int = Encoder.SAMPLE_SIZE
+# cap on decoders running at once on this host; further jobs wait for a slot
+MAX_DECODERS: int = 64
+# idle FFmpeg processes kept spawned and waiting on stdin
+WARM_PROCESSES: int = 2
+# about two seconds of PCM decoded ahead of the reader
+PCM_BUFFER_BYTES: int = FRAME_SIZE * 100
+FEED_CHUNK: int = 64 * 1024
+# starts later than this (10 s) seek the input; earlier ones decode from the top and trim,
+# which is sample-accurate for any input rate
+SEEK_MIN_SAMPLES: int = 10 * SAMPLING_RATE
+# looping sources keep tracks up to this size (about six minutes) decoded in memory
+MAX_LOOP_BYTES: int = 64 * 1024 ** 2
+# containers that usually need a seekable input, so cannot be fed through stdin
+SEEKABLE_SUFFIXES = frozenset({".mp4", ".m4a", ".m4b", ".mov", ".3gp"})
+FFMPEG_OUTPUT: List[str] = ['-f', 's16le', '-ar', str(SAMPLING_RATE), '-ac', '2', '-loglevel', 'warning', 'pipe:1']
+
+DECODERS_ACTIVE = Gauge("ursa_decoders_active", "Decoders currently holding a pool slot")
+DECODER_WAITS = Counter("ursa_decoder_waits_total", "Decode jobs that had to wait for a free pool slot")
+DECODER_UNDERRUNS = Counter("ursa_decoder_underruns_total", "Reads that found no decoded PCM ready")
+LOOP_WRAPS = Counter("ursa_loop_wraps_total", "Times a looping source started over without a new play()")
+WARM_HITS = Counter("ursa_decoder_warm_hits_total", "FFmpeg decode jobs served by a pre-spawned process")
+
+Source = Union[str, BinaryIO]
+TRANSPORTS = ("pipe", "shm")
+
+
+def audio_graph(stream, *filters: Tuple[str, str]):
+    """
+    A PyAV filter graph running ``stream``'s decoded frames through ``filters`` ((name, args)
+    pairs), in FFmpeg's C code rather than per frame in Python.
+    """
+    graph = av.filter.Graph()
+    node = graph.add_abuffer(template=stream)
+    for name, args in filters:
+        next_node = graph.add(name, args)
+        node.link_to(next_node)
+        node = next_node
+    node.link_to(graph.add('abuffersink'))
+    graph.configure()
+    return graph
+
+
+def filter_frames(graph, frame) -> Iterator:
+    """
+    Push ``frame`` (None at the end of the stream) through ``graph`` and yield what comes out.
+    """
+    graph.push(frame)
+    while True:
+        try:
+            yield graph.pull()
+        except (av.error.BlockingIOError, av.error.EOFError):
+            return
+
+
+def _pyav_pcm(source: Source, gain: float = 0.0, start: int = 0, end: Optional[int] = None) -> Iterator[memoryview]:
+    with av.open(source, 'r') as container:
+        # None until the first decoded frame tells us where the seek landed
+        position = 0
+        if start >= SEEK_MIN_SAMPLES and isinstance(source, str):
+            container.seek(start * av.time_base // SAMPLING_RATE)
+            position = None
+        # gain is applied by FFmpeg's volume filter before resampling, which clips to s16
+        graph = audio_graph(container.streams.audio[0], ('volume', f'{gain:.2f}dB')) if gain else None
+
+        def resampled():
+            nonlocal position
+            resampler = av.AudioResampler(format='s16', layout='stereo', rate=SAMPLING_RATE)
+            for frame in container.decode(audio=0):
+                if position is None:
+                    position = 0 if frame.time is None else round(frame.time * SAMPLING_RATE)
+                for out in (frame,) if graph is None else filter_frames(graph, frame):
+                    yield from resampler.resample(out)
+            if graph is not None:
+                for out in filter_frames(graph, None):
+                    yield from resampler.resample(out)
+            yield from resampler.resample(None)
+
+        for out in resampled():
+            # trim to [start, end) in samples
+            first = max(start - position, 0)
+            last = out.samples if end is None else min(end - position, out.samples)
+            position += out.samples
+            if last > first:
+                yield memoryview(out.planes[0])[first * SAMPLE_SIZE:last * SAMPLE_SIZE]
+            if end is not None and position >= end:
+                return
+
+
+def _ffmpeg_args(executable: str, path: str, gain: float = 0.0, start: int = 0, end: Optional[int] = None) -> List[str]:
+    args = [executable, '-hide_banner']
+    offset = 0
+    if start >= SEEK_MIN_SAMPLES:
+        # input seeking, so starting late in a track costs no more than starting at the top
+        offset = start
+        args += ['-ss', f'{start / SAMPLING_RATE:.6f}']
+
+    filters = list()
+    if start > offset or end is not None:
+        # resample first so the sample positions are at 48 kHz, like the analysis
+        trim = f"start_sample={start - offset}" + ("" if end is None else f":end_sample={end - offset}")
+        filters += [f"aresample={SAMPLING_RATE}", f"atrim={trim}"]
+    if gain:
+        filters.append(f"volume={gain:.2f}dB")
+
+    args += ['-i', path]
+    if filters:
+        args += ['-af', ",".join(filters)]
+    return args + FFMPEG_OUTPUT
+
+
+def _decode_worker(name: str, path: str, executable: str, use_pyav: bool, gain: float = 0.0, start: int = 0,
+                   end: Optional[int] = None) -> None:
+    # runs in a decoder process; the voice side owns the ring
+    ring = SharedPCMRing(name=name)
+    try:
+        if use_pyav and av is not None:
+            for pcm in _pyav_pcm(path, gain, start, end):
+                if not ring.write(pcm):
+                    return
+            return
+
+        process = subprocess.Popen(_ffmpeg_args(executable, path, gain, start, end), stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE)
+        try:
+            chunk = bytearray(FEED_CHUNK)
+            view = memoryview(chunk)
+            n = process.stdout.readinto(chunk)
+            while n and ring.write(view[:n]):
+                n = process.stdout.readinto(chunk)
+        finally:
+            process.kill()
+            process.wait()
+            process.stdout.close()
+    finally:
+        ring.finish()
+        ring.release()
+
+
+class PooledAudioSource(AudioSource, ABC):
+    """
+    Base of the pool's sources. ``read`` fills and returns the same preallocated ctypes
+    ``frame`` every time instead of a new ``bytes`` object; discord.py's encoder only needs
+    a buffer it can ``ctypes.cast``, and is done with it before the next read.
+    """
+    pool: 'DecoderPool'
+    source: Source
+    gain: float
+    start: int
+    end: Optional[int]
+    frame: ctypes.Array
+    consumed: int
+    _slot: bool
+    _closed: bool
+    _lock: Lock
+
+    def __init__(self, pool: 'DecoderPool', source: Source, gain: float = 0.0, start: int = 0,
+                 end: Optional[int] = None):
+        self.pool = pool
+        self.source = source
+        self.gain = gain
+        self.start = start
+        self.end = end
+        self.frame = (ctypes.c_char * FRAME_SIZE)()
+        self.consumed = 0
+        self._slot = False
+        self._closed = False
+        self._lock = Lock()
+
+    def _acquire(self) -> bool:
+        self.pool.acquire()
+        with self._lock:
+            if self._closed:
+                self.pool.release()
+                return False
+            self._slot = True
+            return True
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._slot:
+                self._slot = False
+                self.pool.release()
+
+    def _frame(self, n: int) -> Union[bytes, ctypes.Array]:
+        # a short read is the end of the track; pad it with silence rather than drop the tail
+        if not n:
+            return b''
+        if n < FRAME_SIZE:
+            ctypes.memset(ctypes.addressof(self.frame) + n, 0, FRAME_SIZE - n)
+        return self.frame
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.gain) or bool(self.start) or self.end is not None
+
+    def is_opus(self) -> bool:
+        return False
+
+    @abstractmethod
+    def readinto(self, buffer: ctypes.Array) -> int:
+        """
+        Fill ``buffer`` with PCM; fewer bytes than its length means the end of the track.
+        """
+        pass
+
+    def read(self) -> Union[bytes, ctypes.Array]:
+        n = self.readinto(self.frame)
+        self.consumed += n
+        return self._frame(n)
+
+    @property
+    def position(self) -> int:
+        """
+        Samples (at 48 kHz) from the top of the track to the end of the last frame read.
+        """
+        return self.start + self.consumed // SAMPLE_SIZE
+
+    def cleanup(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._release()
+
+
+class FFmpegPoolSource(PooledAudioSource):
+    """
+    Reads PCM from an FFmpeg process taken from the pool's warm set.
+
+    The input is fed into the process' stdin from a worker thread, so the process can
+    be spawned before the track is known. Tracks that need a gain filter, or a seekable
+    input, get a process of their own instead.
+    """
+    process: Optional[subprocess.Popen]
+    ready: Event
+    thread: Thread
+
+    def __init__(self, pool: 'DecoderPool', source: Source, gain: float = 0.0, start: int = 0,
+                 end: Optional[int] = None):
+        super().__init__(pool, source, gain, start, end)
+        self.process = None
+        self.ready = Event()
+        self.thread = Thread(target=self._run, name="ursa-ffmpeg-feed", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        try:
+            if not self._acquire():
+                return
+
+            start = perf_counter()
+            # seeking needs the file itself rather than stdin
+            seekable = isinstance(self.source, str) and (Path(self.source).suffix.lower() in SEEKABLE_SUFFIXES
+                                                         or self.start >= SEEK_MIN_SAMPLES)
+            if seekable:
+                process = self.pool.spawn(self.source, self.gain, self.start, self.end)
+            elif self.filtered:
+                process = self.pool.spawn("pipe:0", self.gain, self.start, self.end)
+            else:
+                process = self.pool.take()
+            FFMPEG_SPAWN.observe(perf_counter() - start)
+            with self._lock:
+                if self._closed:
+                    self.pool.kill(process)
+                    return
+                self.process = process
+            self.ready.set()
+            if not seekable:
+                self._feed()
+        except Exception:
+            log.exception("decoder feed for %s failed", self.source)
+        finally:
+            self.ready.set()
+
+    def _feed(self) -> None:
+        stdin = self.process.stdin
+        try:
+            if isinstance(self.source, str):
+                with open(self.source, 'rb') as f:
+                    shutil.copyfileobj(f, stdin, FEED_CHUNK)
+            else:
+                while not self._closed:
+                    chunk = self.source.read(FEED_CHUNK)
+                    if not chunk:
+                        break
+                    stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # the process was killed by cleanup()
+            pass
+        except OSError as e:
+            log.warning("could not read %s: %s", self.source, e)
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def readinto(self, buffer: ctypes.Array) -> int:
+        self.ready.wait()
+        process = self.process
+        if process is None:
+            return 0
+
+        try:
+            return process.stdout.readinto(buffer)
+        except ValueError:
+            # stdout closed by cleanup()
+            return 0
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        with self._lock:
+            process, self.process = self.process, None
+        if process is not None:
+            self.pool.kill(process)
+
+
+class PyAVSource(PooledAudioSource):
+    """
+    Decodes in-process with PyAV on a worker thread into a PCM RingBuffer.
+    """
+    ring: RingBuffer
+    thread: Thread
+
+    def __init__(self, pool: 'DecoderPool', source: Source, gain: float = 0.0, start: int = 0,
+                 end: Optional[int] = None):
+        super().__init__(pool, source, gain, start, end)
+        self.ring = RingBuffer(PCM_BUFFER_BYTES, FRAME_SIZE, DECODER_UNDERRUNS)
+        self.thread = Thread(target=self._run, name="ursa-pyav-decode", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        try:
+            if not self._acquire():
+                return
+
+            start = perf_counter()
+            for pcm in _pyav_pcm(self.source, self.gain, self.start, self.end):
+                if start is not None:
+                    FFMPEG_SPAWN.observe(perf_counter() - start)
+                    start = None
+                if not self.ring.write(pcm):
+                    return
+        except Exception as e:
+            log.warning("could not decode %s: %s", self.source, e)
+        finally:
+            self.ring.finish()
+            self._release()
+
+    def readinto(self, buffer: ctypes.Array) -> int:
+        return self.ring.readinto(buffer)
+
+    def cleanup(self) -> None:
+        self.ring.close()
+        super().cleanup()
+
+
+class SharedMemorySource(PooledAudioSource):
+    """
+    Reads PCM that a pool worker process decodes into a SharedPCMRing. The job is only
+    submitted once a pool slot is free, like the other sources' decoders.
+    """
+    ring: SharedPCMRing
+    future: Optional[Future]
+    thread: Thread
+    _read_lock: Lock
+
+    def __init__(self, pool: 'DecoderPool', source: str, gain: float = 0.0, start: int = 0,
+                 end: Optional[int] = None):
+        super().__init__(pool, source, gain, start, end)
+        self._read_lock = Lock()
+        self.ring = SharedPCMRing(PCM_BUFFER_BYTES)
+        self.future = None
+        self.thread = Thread(target=self._run, name="ursa-shm-submit", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        if not self._acquire():
+            return
+
+        try:
+            future = self.pool.submit(_decode_worker, self.ring.name, self.source, self.pool.executable,
+                                      self.pool.use_pyav, self.gain, self.start, self.end)
+        except Exception:
+            log.exception("could not submit %s to a decoder process", self.source)
+            self.ring.finish()
+            self._release()
+            return
+
+        with self._lock:
+            self.future = future
+            closed = self._closed
+        if closed:
+            future.cancel()
+        # the slot is held until the worker is done with the ring
+        future.add_done_callback(lambda f: self._release())
+
+    def readinto(self, buffer: ctypes.Array) -> int:
+        with self._read_lock:
+            return self.ring.readinto(buffer)
+
+    def cleanup(self) -> None:
+        with self._lock:
+            future = self.future
+        if future is not None:
+            future.cancel()
+        # stop the worker and any blocked read first, then unmap once no read is running
+        self.ring.close()
+        with self._read_lock:
+            self.ring.release()
+        super().cleanup()
+
+
+class LoopingSource(PooledAudioSource):
+    """
+    Plays a track over and over, for tracks that loop into themselves, without ever
+    reporting its end (so no ``after=``/``play()`` round trip per loop).
+
+    The first pass is decoded by a pool source and kept in memory; later passes are served
+    from that buffer, wrapping mid-frame so the loop is sample-accurate. Tracks larger than
+    ``MAX_LOOP_BYTES`` are decoded again on each pass instead.
+
+    Starting at ``position`` (past ``start``) plays the rest of that pass first; the first
+    full pass after it is the one kept.
+    """
+    inner: Optional[PooledAudioSource]
+    pcm: Optional[bytearray]
+    offset: int
+    partial: bool
+    pass_start: int
+    pass_bytes: int
+    _anchor: Optional[ctypes.Array]
+    _base: int
+
+    def __init__(self, pool: 'DecoderPool', source: str, gain: float = 0.0, start: int = 0,
+                 end: Optional[int] = None, position: int = 0):
+        super().__init__(pool, source, gain, start, end)
+        self.partial = position > start and (end is None or position < end)
+        self.pass_start = position if self.partial else start
+        self.inner = pool.open(source, gain, self.pass_start, end)
+        self.pcm = bytearray()
+        self.offset = 0
+        self.pass_bytes = 0
+        self._anchor = None
+        self._base = 0
+
+    @property
+    def position(self) -> int:
+        if self.inner is None:
+            return self.start + self.offset // SAMPLE_SIZE
+
+        return self.pass_start + self.pass_bytes // SAMPLE_SIZE
+
+    def _rewind(self) -> bool:
+        self.inner.cleanup()
+        self.inner = None
+        if not self.pass_bytes:
+            # nothing decodable; end rather than spin
+            return False
+
+        LOOP_WRAPS.inc()
+        if self.partial:
+            # the first full pass starts now
+            self.partial = False
+            self.inner = self.pool.open(self.source, self.gain, self.start, self.end)
+            self.pass_start = self.start
+            self.pass_bytes = 0
+        elif self.pcm is not None:
+            # pins pcm, which is never resized again
+            self._anchor = (ctypes.c_char * len(self.pcm)).from_buffer(self.pcm)
+            self._base = ctypes.addressof(self._anchor)
+        else:
+            self.inner = self.pool.open(self.source, self.gain, self.start, self.end)
+            self.pass_bytes = 0
+        return True
+
+    def _record(self, buffer: ctypes.Array, n: int) -> None:
+        self.pass_bytes += n
+        if self.pcm is None or self.partial:
+            return
+        if len(self.pcm) + n > MAX_LOOP_BYTES:
+            log.info("%s is too long to loop from memory; decoding it on every pass", self.source)
+            self.pcm = None
+            return
+
+        self.pcm += memoryview(buffer).cast('B')[:n]
+
+    def readinto(self, buffer: ctypes.Array) -> int:
+        size = len(buffer)
+        got = 0
+        while got < size and not self._closed:
+            # only a frame that straddles the loop point needs a view at an offset
+            target = buffer if not got else (ctypes.c_char * (size - got)).from_buffer(buffer, got)
+            if self.inner is None:
+                n = min(len(target), len(self.pcm) - self.offset)
+                ctypes.memmove(ctypes.addressof(target), self._base + self.offset, n)
+                self.offset = (self.offset + n) % len(self.pcm)
+                if not self.offset:
+                    LOOP_WRAPS.inc()
+            else:
+                n = self.inner.readinto(target)
+                self._record(target, n)
+                if n < len(target) and not self._rewind():
+                    return got + n
+            got += n
+        return got
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        if self.inner is not None:
+            self.inner.cleanup()
+            self.inner = None
+
+
+class DecoderPool(object):
+    """
+    Hands out PCM AudioSources backed by a bounded set of decoders.
+
+    With the default ``pipe`` transport and PyAV installed, tracks are decoded in-process.
+    Otherwise a few FFmpeg processes are kept spawned and idle, so starting a track does
+    not pay for fork/exec on the critical path; a replacement is spawned in the background
+    each time one is taken.
+
+    With the ``shm`` transport, local files are decoded by long-lived worker processes
+    (PyAV or FFmpeg) that write into a shared-memory ring read by the voice thread.
+    """
+    executable: str
+    max_decoders: int
+    warm_count: int
+    use_pyav: bool
+    transport: str
+    slots: BoundedSemaphore
+    warm: Deque[subprocess.Popen]
+    lock: Lock
+    spawner: Optional[ThreadPoolExecutor]
+    workers: Optional[ProcessPoolExecutor]
+
+    def __init__(self, executable: str = "ffmpeg", max_decoders: int = MAX_DECODERS,
+                 warm_count: int = WARM_PROCESSES, use_pyav: bool = True, transport: str = "pipe"):
+        self.executable = executable
+        self.max_decoders = max_decoders
+        self.warm_count = warm_count
+        self.use_pyav = use_pyav and av is not None
+        self.transport = transport
+        self.slots = BoundedSemaphore(max_decoders)
+        self.warm = deque()
+        self.lock = Lock()
+        self.spawner = None
+        self.workers = None
+
+    def configure(self, max_decoders: Optional[int] = None, warm_count: Optional[int] = None,
+                  use_pyav: Optional[bool] = None, transport: Optional[str] = None) -> None:
+        with self.lock:
+            if max_decoders is not None and max_decoders != self.max_decoders:
+                # only safe before the first decode job
+                self.max_decoders = max_decoders
+                self.slots = BoundedSemaphore(max_decoders)
+            if warm_count is not None:
+                self.warm_count = warm_count
+            if use_pyav is not None:
+                self.use_pyav = use_pyav and av is not None
+            if transport is not None:
+                if transport not in TRANSPORTS:
+                    raise ValueError(f"unknown transport {transport!r}")
+                self.transport = transport
+
+    def open(self, source: Source, gain: float = 0.0, start: int = 0, end: Optional[int] = None) -> PooledAudioSource:
+        """
+        Start decoding ``source`` (a path or a binary file object), amplified by ``gain`` dB and
+        trimmed to samples ``[start, end)``. Never blocks; if every slot is taken the returned
+        source waits for one on its own thread.
+        """
+        if self.transport == "shm" and isinstance(source, str):
+            # file objects cannot be handed to another process
+            return SharedMemorySource(self, source, gain, start, end)
+        if self.use_pyav:
+            return PyAVSource(self, source, gain, start, end)
+
+        return FFmpegPoolSource(self, source, gain, start, end)
+
+    def open_loop(self, source: str, gain: float = 0.0, start: int = 0, end: Optional[int] = None,
+                  position: int = 0) -> LoopingSource:
+        """
+        Like ``open``, but the returned source repeats ``[start, end)`` until it is stopped,
+        beginning at ``position`` if that lies within it.
+        """
+        return LoopingSource(self, source, gain, start, end, position)
+
+    def acquire(self) -> None:
+        if not self.slots.acquire(blocking=False):
+            DECODER_WAITS.inc()
+            log.warning("all %d decoders busy; waiting for a free slot", self.max_decoders)
+            self.slots.acquire()
+        DECODERS_ACTIVE.inc()
+
+    def release(self) -> None:
+        DECODERS_ACTIVE.dec()
+        self.slots.release()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        with self.lock:
+            if self.workers is None:
+                # spawn rather than fork: the parent runs Qt and several threads
+                self.workers = ProcessPoolExecutor(max_workers=self.max_decoders, mp_context=get_context("spawn"))
+            return self.workers.submit(fn, *args)
+
+    def spawn(self, path: str = "pipe:0", gain: float = 0.0, start: int = 0,
+              end: Optional[int] = None) -> subprocess.Popen:
+        args = _ffmpeg_args(self.executable, path, gain, start, end)
+        stdin = subprocess.PIPE if path == "pipe:0" else subprocess.DEVNULL
+        return subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE)
+
+    def take(self) -> subprocess.Popen:
+        process = None
+        with self.lock:
+            while self.warm:
+                candidate = self.warm.popleft()
+                if candidate.poll() is None:
+                    process = candidate
+                    break
+            self._replenish()
+
+        if process is None:
+            return self.spawn()
+
+        WARM_HITS.inc()
+        return process
+
+    def _replenish(self) -> None:
+        # caller holds self.lock
+        if self.spawner is None:
+            self.spawner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ursa-ffmpeg-spawn")
+        self.spawner.submit(self._spawn_warm)
+
+    def _spawn_warm(self) -> None:
+        with self.lock:
+            if len(self.warm) >= self.warm_count:
+                return
+
+        try:
+            process = self.spawn()
+        except OSError as e:
+            log.error("could not spawn %s: %s", self.executable, e)
+            return
+
+        with self.lock:
+            self.warm.append(process)
+
+    def warm_up(self) -> None:
+        if self.use_pyav or self.transport == "shm":
+            return
+
+        with self.lock:
+            for _ in range(self.warm_count - len(self.warm)):
+                self._replenish()
+
+    @staticmethod
+    def kill(process: subprocess.Popen) -> None:
+        try:
+            process.kill()
+            process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            log.warning("ffmpeg process %d did not exit", process.pid)
+        for pipe in (process.stdin, process.stdout):
+            if pipe is not None:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+    def shutdown(self) -> None:
+        with self.lock:
+            warm, self.warm = list(self.warm), deque()
+        for process in warm:
+            self.kill(process)
+        if self.workers is not None:
+            self.workers.shutdown(wait=False, cancel_futures=True)
+
+
+decoder_pool = DecoderPool()
+atexit.register(decoder_pool.shutdown)
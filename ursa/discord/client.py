@@ -1,36 +1,168 @@
+import logging
+from typing import FrozenSet, Iterable, Optional, Set, Tuple
+
 from PyQt5.QtCore import QObject, pyqtSignal
-from discord import Client, Message, Intents
+from discord import Client, Guild, Interaction, InteractionType, Message, Member, TextChannel, User, \
+    VoiceChannel, VoiceState, app_commands
+from discord.abc import GuildChannel
+
+from .commands import dmci_command
+from .runner import EventChannel
+from .profile import DEFAULT_PROFILE, client_options
+
+log = logging.getLogger(__name__)
 
 
 class ClientEventProxy(QObject):
+    """
+    Re-emits the events an ``UrsaClient`` posts to its ``EventChannel`` as Qt signals; connect
+    ``deliver`` to the channel on the GUI's loop.
+    """
     on_connect = pyqtSignal()
     on_ready = pyqtSignal()
     on_message = pyqtSignal(Message)
+    # a slash command ran: its command line and response
+    on_command = pyqtSignal(str, str)
     on_disconnect = pyqtSignal()
+    # our own voice connection went away, deliberately or not; carries the channel it was in
+    on_voice_dropped = pyqtSignal(VoiceChannel)
+    on_guild_join = pyqtSignal(Guild)
+    on_guild_remove = pyqtSignal(Guild)
+    on_guild_channel_create = pyqtSignal(GuildChannel)
+    on_guild_channel_delete = pyqtSignal(GuildChannel)
+    on_guild_channel_update = pyqtSignal(GuildChannel, GuildChannel)
+    # the GUI's player moved on to another track, on the client thread; carries its file name
+    on_track_changed = pyqtSignal(str)
 
     def __init__(self, parent=None):
         super().__init__(parent)
 
+    def deliver(self, event: str, args: Tuple) -> None:
+        getattr(self, event).emit(*args)
+
+
+class UrsaCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        if self.client.accepts_interaction(interaction):
+            return True
+
+        if interaction.type is InteractionType.application_command:
+            await interaction.response.send_message("Not in this channel.", ephemeral=True)
+        return False
+
+    async def on_error(self, interaction: Interaction, error: app_commands.AppCommandError) -> None:
+        if isinstance(error, app_commands.CheckFailure):
+            return
+        await super().on_error(interaction, error)
+
 
 class UrsaClient(Client):
-    event_proxy: ClientEventProxy
+    events: EventChannel
+    interact_guilds: Set[int]
+    interact_channels: Set[int]
+    command_prefixes: Tuple[str, ...]
+    tree: UrsaCommandTree
+    # push the slash commands to Discord on login; only needed when they change
+    sync_commands: bool
+    # the application's owner, or its team's members; fetched on first use
+    owner_ids: Optional[FrozenSet[int]]
+
+    def __init__(self, command_prefixes: Tuple[str, ...] = (), message_content: bool = True,
+                 cache_profile: str = DEFAULT_PROFILE, sync_commands: bool = False, **options):
+        super().__init__(**options, **client_options(message_content, cache_profile))
+        self.events = EventChannel()
+        self.interact_guilds = set()
+        self.interact_channels = set()
+        self.command_prefixes = command_prefixes
+        self.sync_commands = sync_commands
+        self.owner_ids = None
+        self.tree = UrsaCommandTree(self)
+        self.tree.add_command(dmci_command)
+
+    async def setup_hook(self) -> None:
+        # syncing is rate limited, so not on every start
+        if self.sync_commands:
+            synced = await self.tree.sync()
+            log.info("synced %d slash commands", len(synced))
+
+    async def is_owner(self, user: User) -> bool:
+        if self.owner_ids is None:
+            app = await self.application_info()
+            if app.team is not None:
+                self.owner_ids = frozenset(member.id for member in app.team.members)
+            else:
+                self.owner_ids = frozenset((app.owner.id,))
+        return user.id in self.owner_ids
+
+    def set_interact_filter(self, channels: Iterable[TextChannel]) -> None:
+        channels = list(channels)
+        self.interact_guilds = set(c.guild.id for c in channels)
+        self.interact_channels = set(c.id for c in channels)
+
+    def accepts_message(self, message: Message) -> bool:
+        if message.author.bot:
+            return False
 
-    def __init__(self, **options):
-        super().__init__(**options, intents=Intents.default() | Intents(message_content=True))
-        self.event_proxy = ClientEventProxy()
+        if message.guild is not None:
+            if message.guild.id not in self.interact_guilds or message.channel.id not in self.interact_channels:
+                return False
+
+        if self.command_prefixes and not message.content.startswith(self.command_prefixes):
+            return False
+
+        return True
+
+    def accepts_interaction(self, interaction: Interaction) -> bool:
+        if interaction.guild_id is None:
+            return True
+        return interaction.guild_id in self.interact_guilds and interaction.channel_id in self.interact_channels
 
     async def on_connect(self):
-        print("DEBUG -> on_connect")
-        self.event_proxy.on_connect.emit()
+        log.debug("on_connect")
+        self.events.post('on_connect')
 
     async def on_ready(self):
-        print("DEBUG -> on_ready")
-        self.event_proxy.on_ready.emit()
+        log.debug("on_ready")
+        self.events.post('on_ready')
 
     async def on_message(self, message: Message):
-        print(f"DEBUG -> on_message: {message.content}")
-        self.event_proxy.on_message.emit(message)
+        # drop everything that isn't for us before it crosses to the GUI thread
+        if not self.accepts_message(message):
+            return
+
+        log.debug("on_message: %s", message.content)
+        self.events.post('on_message', message)
+
+    async def on_app_command_completion(self, interaction: Interaction, command: app_commands.Command):
+        line = ' '.join(str(value) for value in vars(interaction.namespace).values())
+        log.debug("on_app_command_completion: /%s %s", command.qualified_name, line)
+        self.events.post('on_command', f"/{command.qualified_name} {line}",
+                         interaction.extras.get('response') or "None")
+
+    async def on_voice_state_update(self, member: Member, before: VoiceState, after: VoiceState):
+        if member.id == self.user.id and before.channel is not None and after.channel is None:
+            log.debug("on_voice_state_update: left %s", before.channel)
+            self.events.post('on_voice_dropped', before.channel)
+
+    async def on_guild_join(self, guild: Guild):
+        self.events.post('on_guild_join', guild)
+
+    async def on_guild_available(self, guild: Guild):
+        # back from an outage; to the GUI that is the same as joining
+        self.events.post('on_guild_join', guild)
+
+    async def on_guild_remove(self, guild: Guild):
+        self.events.post('on_guild_remove', guild)
+
+    async def on_guild_channel_create(self, channel: GuildChannel):
+        self.events.post('on_guild_channel_create', channel)
+
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        self.events.post('on_guild_channel_delete', channel)
+
+    async def on_guild_channel_update(self, before: GuildChannel, after: GuildChannel):
+        self.events.post('on_guild_channel_update', before, after)
 
     async def on_disconnect(self):
-        print("DEBUG -> on_disconnect")
-        self.event_proxy.on_disconnect.emit()
+        log.debug("on_disconnect")
+        self.events.post('on_disconnect')
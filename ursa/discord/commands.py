@@ -0,0 +1,56 @@
+import logging
+from typing import Iterable, List, Optional
+
+from discord import Interaction, app_commands
+
+from ..DMCI import module_names, run_command
+from ..search import TrigramIndex
+
+log = logging.getLogger(__name__)
+
+# Discord shows at most this many autocomplete choices
+MAX_CHOICES: int = 25
+
+
+def complete(names: Iterable[str], current: str,
+             index: Optional[TrigramIndex[str]] = None) -> List[app_commands.Choice[str]]:
+    """
+    Autocomplete choices among ``names`` for what has been typed so far: prefix matches first,
+    then anything containing it, then (given the names' ``index``) anything like it.
+    """
+    folded_current = current.casefold()
+    prefixed, contained = list(), list()
+    for name in names:
+        folded = name.casefold()
+        if folded.startswith(folded_current):
+            prefixed.append(name)
+        elif folded_current in folded:
+            contained.append(name)
+    matches = prefixed + contained
+    if not matches and index is not None:
+        matches = [name for _, name in index.similar(current, limit=MAX_CHOICES)]
+    return [app_commands.Choice(name=name, value=name) for name in matches[:MAX_CHOICES]]
+
+
+def did_you_mean(index: TrigramIndex[str], name: str) -> str:
+    """
+    A hint naming the indexed names most like a ``name`` that didn't resolve, or nothing.
+    """
+    similar = [f"`{key}`" for _, key in index.similar(name, limit=3)]
+    return f" Did you mean {', '.join(similar)}?" if similar else ""
+
+
+@app_commands.command(name="dmci", description="Run a DMCI module")
+@app_commands.describe(module="DMCI module", args="its arguments, as after c!<module>")
+async def dmci_command(interaction: Interaction, module: str, args: str = ""):
+    # modules may take longer than the 3 seconds an interaction has to answer
+    await interaction.response.defer(thinking=True)
+    resp = await run_command(f"{module} {args}", await interaction.client.is_owner(interaction.user))
+    # picked up by UrsaClient.on_app_command_completion for the GUI
+    interaction.extras['response'] = resp
+    await interaction.followup.send(resp or "None")
+
+
+@dmci_command.autocomplete('module')
+async def dmci_module_autocomplete(interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+    return complete(module_names(), current)
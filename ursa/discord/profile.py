@@ -0,0 +1,44 @@
+from typing import Any, Dict, Tuple
+
+from discord import Intents, MemberCacheFlags
+
+DEFAULT_PROFILE: str = "default"
+# caches only what Ursa reads: guilds, channels and voice states
+LEAN_PROFILE: str = "lean"
+CACHE_PROFILES: Tuple[str, ...] = (DEFAULT_PROFILE, LEAN_PROFILE)
+
+
+def gateway_intents(message_content: bool = True, profile: str = DEFAULT_PROFILE) -> Intents:
+    """
+    Intents Ursa runs with. Without message content, message and typing events are not
+    subscribed to at all; commands then only arrive as interactions.
+    """
+    if profile == LEAN_PROFILE:
+        intents = Intents.none()
+        intents.guilds = intents.voice_states = True
+        intents.guild_messages = intents.dm_messages = intents.message_content = message_content
+        return intents
+
+    intents = Intents.default()
+    if message_content:
+        intents.message_content = True
+    else:
+        intents.guild_messages = intents.dm_messages = False
+        intents.guild_typing = intents.dm_typing = False
+    return intents
+
+
+def client_options(message_content: bool = True, profile: str = DEFAULT_PROFILE) -> Dict[str, Any]:
+    """
+    Keyword arguments for ``discord.Client`` (or ``Bot``) under a cache profile.
+    """
+    if profile not in CACHE_PROFILES:
+        raise ValueError(f"unknown cache profile {profile}, expected one of {CACHE_PROFILES}")
+
+    options: Dict[str, Any] = dict(intents=gateway_intents(message_content, profile))
+    if profile == LEAN_PROFILE:
+        member_cache_flags = MemberCacheFlags.none()
+        # members in voice, so has_listeners can tell bots apart
+        member_cache_flags.voice = True
+        options.update(max_messages=None, member_cache_flags=member_cache_flags, chunk_guilds_at_startup=False)
+    return options
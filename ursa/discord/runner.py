@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from asyncio import AbstractEventLoop
+from concurrent.futures import Future
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Coroutine, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# consumer(event name, args)
+EventConsumer = Callable[[str, Tuple], None]
+
+
+def new_event_loop(use_uvloop: bool = False) -> AbstractEventLoop:
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            log.warning("uvloop is not installed, using the default event loop")
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+class EventChannel(object):
+    """
+    Carries client events, in order, from the client's thread to a consumer running on another
+    event loop. Events posted while nothing is connected are dropped.
+    """
+    lock: Lock
+    loop: Optional[AbstractEventLoop]
+    consumer: Optional[EventConsumer]
+
+    def __init__(self):
+        self.lock = Lock()
+        self.loop = None
+        self.consumer = None
+
+    def connect(self, consumer: EventConsumer, loop: AbstractEventLoop) -> None:
+        with self.lock:
+            self.consumer = consumer
+            self.loop = loop
+
+    def disconnect(self) -> None:
+        with self.lock:
+            self.consumer = None
+            self.loop = None
+
+    def post(self, event: str, *args) -> None:
+        with self.lock:
+            consumer, loop = self.consumer, self.loop
+        if consumer is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(consumer, event, args)
+
+
+class ClientThread(object):
+    """
+    A dedicated thread running an event loop for the Discord client, so the gateway, voice
+    websockets and audio scheduling never wait on whatever else the main loop is doing (in the
+    GUI, painting).
+
+    Everything touching discord.py objects runs there: ``submit`` a coroutine from any thread,
+    or ``await call(...)`` it (or ``apply`` a plain function) from another loop.
+    """
+    use_uvloop: bool
+    loop: Optional[AbstractEventLoop]
+    thread: Optional[Thread]
+    _started: Event
+
+    def __init__(self, use_uvloop: bool = False):
+        self.use_uvloop = use_uvloop
+        self.loop = None
+        self.thread = None
+        self._started = Event()
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+
+        self.thread = Thread(target=self._run, name="ursa-client", daemon=True)
+        self.thread.start()
+        self._started.wait()
+
+    def _run(self):
+        self.loop = new_event_loop(self.use_uvloop)
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def submit(self, coro: Coroutine) -> Future:
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def call(self, coro: Coroutine) -> Any:
+        """
+        Run ``coro`` on the client thread and wait for it from the caller's loop.
+        """
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def apply(self, callback: Callable, *args) -> Any:
+        """
+        Run the plain function ``callback(*args)`` on the client thread and wait for its result.
+        """
+        async def run():
+            return callback(*args)
+
+        return await self.call(run())
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+        self._started.clear()
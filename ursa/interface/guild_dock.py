@@ -1,6 +1,6 @@
 from typing import Optional
 
-from PyQt5.QtCore import pyqtSlot
+from PyQt5.QtCore import QModelIndex, pyqtSlot
 from PyQt5.QtWidgets import QFrame
 
 from ..models.guilds import GuildsModel, GuildNode
@@ -9,11 +9,16 @@ from ..ui.guild_dock import Ui_GuildDock
 
 class GuildDock(QFrame, Ui_GuildDock):
     model: Optional[GuildsModel]
+    # shown while no guild is selected
+    empty_text_model: GuildNode.TextChannelsModel
+    empty_voice_model: GuildNode.VoiceChannelsModel
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setupUi(self)
         self.model = None
+        self.empty_text_model = GuildNode.TextChannelsModel(list(), parent=self)
+        self.empty_voice_model = GuildNode.VoiceChannelsModel(list(), parent=self)
 
         # CONNECTIONS
         self.guild_combo.currentIndexChanged.connect(self.set_guild_models)
@@ -22,17 +27,31 @@ class GuildDock(QFrame, Ui_GuildDock):
     def load_guilds(self, guild_model: GuildsModel):
         self.model = guild_model
         self.guild_combo.setModel(self.model)
+        self.model.rowsAboutToBeRemoved.connect(self.guilds_removed)
 
     @pyqtSlot()
     def unload_model(self):
+        if self.model is not None:
+            self.model.rowsAboutToBeRemoved.disconnect(self.guilds_removed)
         self.model = None
-        self.text_channel_list.setModel(GuildNode.TextChannelsModel(list(), parent=self))
+        self.clear_guild_models()
+
+    def clear_guild_models(self):
+        self.text_channel_list.setModel(self.empty_text_model)
+        self.v_radio_view.set_model(self.empty_voice_model)
+
+    @pyqtSlot(QModelIndex, int, int)
+    def guilds_removed(self, parent: QModelIndex, first: int, last: int):
+        # a removed guild's channel models are deleted with it; stop showing them first
+        if first <= self.guild_combo.currentIndex() <= last:
+            self.clear_guild_models()
 
     @pyqtSlot(int)
     def set_guild_models(self, index: int):
-        if self.model is None:
+        if self.model is None or index < 0:
             return
 
+        # the guild's channel models are built here, the first time it is selected
         guild: GuildNode = self.model.guilds[index]
         assert isinstance(guild, GuildNode)
         self.text_channel_list.setModel(guild.text_model)
@@ -1,20 +1,26 @@
-from asyncio import Lock
+import logging
+from asyncio import Lock, get_running_loop
 from enum import Enum
 from os.path import basename
-from sys import stderr
-from typing import Optional, Set
+from typing import Optional
 
-from PyQt5.QtCore import pyqtSlot, QModelIndex, pyqtSignal
+from PyQt5.QtCore import pyqtSlot, QModelIndex, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QMainWindow
-from discord import Message, TextChannel, VoiceClient
+from discord import Message, VoiceChannel, VoiceClient
 from qasync import asyncSlot
 
-from ..DMCI import parse_command, PARSER_PREFIX
+from ..DMCI import run_command, PARSER_PREFIX
 from ..models.guilds import GuildsModel, VoiceChannelNode
 from ..models.tracks import TrackNode, AbstractAudioHandle
 from ..ui.main_window import Ui_MainWindow
 from ..ursa_config import INVITE_LINK, settings
-from ..discord.client import UrsaClient
+from ..discord.client import ClientEventProxy, UrsaClient
+from ..discord.runner import ClientThread
+from ..cache import track_cache
+from ..metrics import MeteredSource
+from ..playback import IDLE_CHECK_INTERVAL, IDLE_TIMEOUT, PlaybackController, connect_voice
+
+log = logging.getLogger(__name__)
 
 
 class SourceType(Enum):
@@ -24,40 +30,60 @@ class SourceType(Enum):
 
 
 class MainWindow(QMainWindow, Ui_MainWindow):
+    # the client and everything voice runs on client_thread; its events come back through event_proxy
+    client_thread: ClientThread
     discord_client: UrsaClient
+    event_proxy: ClientEventProxy
     guilds_model: Optional[GuildsModel]
-    interact_filter: Set[TextChannel]
     connected_voice: Optional[VoiceClient]
+    # lives on client_thread, as do the current track and handle, which only it changes
+    player: Optional[PlaybackController]
+    # serializes connecting and disconnecting voice, on the GUI's loop
     voice_lock: Lock
     source: SourceType
-    current_track: Optional[QModelIndex]
+    current_track: Optional[TrackNode]
     current_audio_handle: Optional[AbstractAudioHandle]
     current_loop_count: int
-    callback_suppress_once: bool
+    idle_timeout: float
+    idle_timer: QTimer
+    # where an idle voice connection was, until the next play brings it back
+    suspended_voice: Optional[VoiceChannel]
+    # sync slash commands when the client next logs in
+    sync_commands: bool
 
     # SIGNALS
     trackChanged = pyqtSignal(str)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, idle_timeout: float = IDLE_TIMEOUT, use_uvloop: bool = False,
+                 sync_commands: bool = False):
         super().__init__(parent)
         self.setupUi(self)
         self.guilds_container.setHidden(True)
         self.tracks_container.setHidden(True)
-        self.discord_client = UrsaClient()
-        self.discord_client.event_proxy.setParent(self)
-        self.interact_filter = set()
+        self.metrics_container.setHidden(True)
+        self.client_thread = ClientThread(use_uvloop)
+        self.guilds_model = None
+        self.sync_commands = sync_commands
+        self.discord_client = self.new_client()
+        self.event_proxy = ClientEventProxy(self)
         self.connected_voice = None
+        self.player = None
         self.voice_lock = Lock()
         self.source = SourceType.SOURCE_NONE
         self.current_track = None
+        self.current_audio_handle = None
         self.current_loop_count = 0
-        self.callback_suppress_once = False
+        self.idle_timeout = idle_timeout
+        self.idle_timer = QTimer(self)
+        self.suspended_voice = None
 
         # CONNECTIONS
-        self.discord_client.event_proxy.on_connect.connect(self.client_connected)
-        self.discord_client.event_proxy.on_ready.connect(self.client_ready)
-        self.discord_client.event_proxy.on_message.connect(self.client_message)
-        self.discord_client.event_proxy.on_disconnect.connect(self.client_disconnected)
+        self.event_proxy.on_connect.connect(self.client_connected)
+        self.event_proxy.on_ready.connect(self.client_ready)
+        self.event_proxy.on_message.connect(self.client_message)
+        self.event_proxy.on_command.connect(self.client_command)
+        self.event_proxy.on_disconnect.connect(self.client_disconnected)
+        self.event_proxy.on_voice_dropped.connect(self.voice_dropped)
         self.connect_discord_button.clicked.connect(self.connect_discord)
         self.disconnect_button.clicked.connect(self.disconnect_discord)
         self.guilds_dock.v_radio_view.toggled.connect(self.disconnect_voice)
@@ -67,29 +93,107 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.tracks_dock.request_track_stop.connect(self.stop_track)
         self.source_none_button.toggled.connect(self.set_source_none)
         self.source_tracks_button.toggled.connect(self.set_source_tracks)
+        self.event_proxy.on_track_changed.connect(self.trackChanged)
         self.trackChanged.connect(self.tracks_dock.set_track_label)
+        self.idle_timer.timeout.connect(self.suspend_if_idle)
+        if self.idle_timeout > 0:
+            self.idle_timer.start(int(IDLE_CHECK_INTERVAL * 1000))
 
     @pyqtSlot()
     def update_interact_filter(self):
-        self.interact_filter = set(x.channel for x in self.guilds_model.text_channels_interact_iter())
+        self.discord_client.set_interact_filter(x.channel for x in self.guilds_model.text_channels_interact_iter())
 
     @asyncSlot(VoiceChannelNode)
     async def switch_voice_channel(self, node: VoiceChannelNode):
         async with self.voice_lock:
+            self.suspended_voice = None
             if self.connected_voice is not None:
-                await self.connected_voice.disconnect(force=True)
+                if self.connected_voice.guild == node.channel.guild and self.connected_voice.is_connected():
+                    # same guild: move the connection, and whatever is playing carries on
+                    if self.connected_voice.channel != node.channel:
+                        await self.client_thread.call(self.connected_voice.move_to(node.channel))
+                    return
 
-            new_vc = await node.channel.connect()
+                await self.client_thread.call(self.close_player(self.player))
+                await self.client_thread.call(self.connected_voice.disconnect(force=True))
+
+            new_vc = await self.client_thread.call(node.channel.connect())
             assert isinstance(new_vc, VoiceClient)
             self.connected_voice = new_vc
+            self.player = await self.client_thread.call(self.new_player(new_vc))
+
+    @staticmethod
+    async def new_player(voice_client: VoiceClient) -> PlaybackController:
+        # on the client thread, so its queue, task and after= hand-offs are on the client's loop
+        return PlaybackController(voice_client, label="gui")
+
+    async def close_player(self, player: PlaybackController, release: bool = False) -> None:
+        # client thread
+        async with player.lock:
+            player.close()
+            if release and self.current_audio_handle:
+                self.current_audio_handle.cleanup()
+                self.current_audio_handle = None
+
+    @asyncSlot(VoiceChannel)
+    async def voice_dropped(self, channel: VoiceChannel):
+        async with self.voice_lock:
+            # a deliberate disconnect has already cleared connected_voice
+            if self.connected_voice is None or self.connected_voice.guild != channel.guild \
+                    or self.connected_voice.is_connected():
+                return
+
+            log.info("voice connection to %s dropped, reconnecting", channel)
+            new_vc = await self.client_thread.call(connect_voice(channel))
+            if new_vc is None:
+                log.error("could not reconnect to %s", channel)
+                await self.client_thread.call(self.close_player(self.player))
+                self.connected_voice = None
+                self.player = None
+                return
+
+            self.connected_voice = new_vc
+            if await self.client_thread.apply(self.player.rebind, new_vc):
+                return
+
+            # discord.py's player went with the old connection; start the track again
+            await self.client_thread.call(self.restart_track(self.player))
+
+    @asyncSlot()
+    async def suspend_if_idle(self):
+        async with self.voice_lock:
+            # voice states belong to the client thread
+            if self.connected_voice is None or not await self.client_thread.apply(self.player.is_idle,
+                                                                                 self.idle_timeout):
+                return
+
+            # hand back the decoder and the voice connection; the next play reconnects
+            log.info("suspending idle voice connection to %s", self.connected_voice.channel)
+            self.suspended_voice = self.connected_voice.channel
+            await self.client_thread.call(self.close_player(self.player, release=True))
+            voice_client, self.connected_voice, self.player = self.connected_voice, None, None
+            await self.client_thread.call(voice_client.disconnect(force=True))
+
+    async def wake_voice(self) -> bool:
+        async with self.voice_lock:
+            if self.connected_voice is None and self.suspended_voice is not None:
+                channel, self.suspended_voice = self.suspended_voice, None
+                new_vc = await self.client_thread.call(connect_voice(channel))
+                if new_vc is not None:
+                    self.connected_voice = new_vc
+                    self.player = await self.client_thread.call(self.new_player(new_vc))
+            return self.connected_voice is not None
 
     @asyncSlot()
     async def disconnect_voice(self):
         async with self.voice_lock:
+            self.suspended_voice = None
             if self.connected_voice is not None:
-                await self.connected_voice.disconnect(force=True)
+                await self.client_thread.call(self.close_player(self.player))
+                await self.client_thread.call(self.connected_voice.disconnect(force=True))
 
             self.connected_voice = None
+            self.player = None
 
     @pyqtSlot()
     def client_connected(self):
@@ -99,9 +203,18 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
     @pyqtSlot()
     def client_ready(self):
-        self.guilds_model = GuildsModel(self.discord_client, parent=self)
-        self.guilds_dock.load_guilds(self.guilds_model)
-        self.guilds_model.interactables_changed.connect(self.update_interact_filter)
+        if self.guilds_model is not None:
+            # a new gateway session: catch up on whatever changed while disconnected
+            self.guilds_model.sync_guilds(self.discord_client.guilds)
+        else:
+            self.guilds_model = GuildsModel(self.discord_client, parent=self)
+            self.guilds_dock.load_guilds(self.guilds_model)
+            self.guilds_model.interactables_changed.connect(self.update_interact_filter)
+            self.event_proxy.on_guild_join.connect(self.guilds_model.add_guild)
+            self.event_proxy.on_guild_remove.connect(self.guilds_model.remove_guild)
+            self.event_proxy.on_guild_channel_create.connect(self.guilds_model.add_channel)
+            self.event_proxy.on_guild_channel_delete.connect(self.guilds_model.remove_channel)
+            self.event_proxy.on_guild_channel_update.connect(self.guilds_model.update_channel)
         self.ready_label.setText("True")
         self.ready_label.style().unpolish(self.ready_label)
         self.ready_label.style().polish(self.ready_label)
@@ -109,12 +222,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
     @asyncSlot(Message)
     async def client_message(self, message: Message):
-        if message.author.bot:
-            return
-
-        if message.guild is not None and message.channel not in self.interact_filter:
-            return
-
+        # UrsaClient has already dropped bot, non-interactable and non-command messages
         if message.guild is not None:
             self.message_content.setText(f'"{str(message.content)}" from {message.author}'
                                          f' on {message.guild.name}:{message.channel}')
@@ -124,18 +232,23 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         # parse if it is a command...
         content = str(message.content)
         if content.startswith(PARSER_PREFIX):
-            resp = parse_command(content)
+            allow_reload = await self.client_thread.call(self.discord_client.is_owner(message.author))
+            resp = await run_command(content, allow_reload)
             if resp is not None:
                 self.response_content.setText(resp)
-                await message.reply(resp)
+                await self.client_thread.call(message.reply(resp))
                 return
 
         self.response_content.setText("None")
 
+    @pyqtSlot(str, str)
+    def client_command(self, command: str, response: str):
+        self.message_content.setText(command)
+        self.response_content.setText(response)
+
     @pyqtSlot()
     def client_disconnected(self):
-        self.guilds_model = None
-        self.guilds_dock.unload_model()
+        # the guild list stays; discord.py reconnects by itself and on_ready catches it up
         self.connection_label.setText("DISCONNECTED")
         self.connection_label.style().unpolish(self.connection_label)
         self.connection_label.style().polish(self.connection_label)
@@ -143,23 +256,31 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.ready_label.style().unpolish(self.ready_label)
         self.ready_label.style().polish(self.ready_label)
 
+    def new_client(self) -> UrsaClient:
+        return UrsaClient(command_prefixes=(PARSER_PREFIX,), message_content=settings.MESSAGE_CONTENT,
+                          cache_profile=settings.CACHE_PROFILE, sync_commands=self.sync_commands)
+
     @asyncSlot()
     async def connect_discord(self):
         if self.discord_client.is_closed():
-            self.discord_client = UrsaClient()
-            self.discord_client.event_proxy.setParent(self)
-            self.discord_client.event_proxy.on_connect.connect(self.client_connected)
-            self.discord_client.event_proxy.on_ready.connect(self.client_ready)
-            self.discord_client.event_proxy.on_message.connect(self.client_message)
-            self.discord_client.event_proxy.on_disconnect.connect(self.client_disconnected)
-        await self.discord_client.start(settings.TOKEN)
+            self.discord_client = self.new_client()
+        # once per process is enough
+        self.sync_commands = False
+        self.discord_client.events.connect(self.event_proxy.deliver, get_running_loop())
+        await self.client_thread.call(self.discord_client.start(settings.TOKEN))
 
     @asyncSlot()
     async def disconnect_discord(self):
         if self.connected_voice is not None:
-            await self.connected_voice.disconnect(force=True)
+            await self.client_thread.call(self.close_player(self.player))
+            await self.client_thread.call(self.connected_voice.disconnect(force=True))
             self.connected_voice = None
-        await self.discord_client.close()
+            self.player = None
+        await self.client_thread.call(self.discord_client.close())
+        if self.guilds_model is not None:
+            self.guilds_dock.unload_model()
+            self.guilds_model.deleteLater()
+            self.guilds_model = None
 
     @asyncSlot(bool)
     async def set_source_none(self, enabled: bool):
@@ -178,17 +299,45 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.source = SourceType.SOURCE_TRACKS
 
-    def tracks_callback(self, error):
-        if self.callback_suppress_once:
-            self.callback_suppress_once = False
-            print("DEBUG: callback suppressed")
+    # Playback runs on the client thread, under the player's lock, like its after= callbacks;
+    # only the track label goes back to the GUI, as an event.
+
+    async def start_track(self, player: PlaybackController, track: TrackNode) -> None:
+        # client thread, player lock held
+        self.current_audio_handle = track.get_audio_handle()
+        await self.current_audio_handle.prepare()
+        source = self.current_audio_handle.get_pcm()
+        if not source:
+            log.error("There was an error getting the pcm for %s!", track.track_path)
             return
 
+        log.debug("Playing track %s", track.track_path)
+        player.play(MeteredSource(source, player.guild.id), after=self.tracks_callback)
+        self.current_track = track
+        self.discord_client.events.post('on_track_changed', basename(track.track_path))
+        track_cache.prefetch(track.parent.readahead(track.parent.tracks.index(track)))
+
+    def stop_current(self, player: PlaybackController) -> None:
+        # client thread, player lock held
+        self.current_track = None
+        if player.is_playing() or player.is_paused():
+            player.stop()
+            if self.current_audio_handle:
+                self.current_audio_handle.cleanup()
+                self.current_audio_handle = None
+
+    async def tracks_callback(self, error):
+        # runs on the client thread via self.player; callbacks for stopped/replaced sources never get here
+        if error is not None:
+            log.error("player error: %s", error)
+
         if self.current_track is None:
-            print("DEBUG: suppressing callback as there is no current track")
+            log.debug("suppressing callback as there is no current track")
+            return
 
-        if self.connected_voice is None:
-            print("DEBUG: callback failed; no voice channel connected")
+        player = self.player
+        if player is None:
+            log.debug("callback failed; no voice channel connected")
             return
 
         # self.current_loop_count += 1
@@ -196,64 +345,60 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.current_audio_handle.cleanup()
             self.current_audio_handle = None
 
-        self.current_track = self.tracks_dock.model.get_next_track(self.current_track)
-        if not self.current_track:
-            print("DEBUG: get_next_track() returned no track!")
+        track = self.current_track.next_track()
+        self.current_track = None
+        if track is None:
+            log.debug("next_track() returned no track!")
             return
 
-        track: TrackNode = self.current_track.internalPointer()
-        self.current_audio_handle = track.get_audio_handle()
-        source = self.current_audio_handle.get_pcm()
-        if not source:
-            print(f"There was an error getting the pcm for {track.track_path}!", file=stderr)
-            return
+        await self.start_track(player, track)
 
-        print(f"DEBUG: callback playing track {track.track_path}")
-        self.connected_voice.play(source, after=self.tracks_callback)
-        self.trackChanged.emit(basename(track.track_path))
+    async def play_on(self, player: PlaybackController, track: TrackNode) -> None:
+        # client thread
+        async with player.lock:
+            if player.is_paused():
+                player.resume()
+                return
+
+            self.stop_current(player)
+            # self.current_loop_count = 0
+            await self.start_track(player, track)
+
+    async def restart_track(self, player: PlaybackController) -> None:
+        # client thread
+        async with player.lock:
+            track = self.current_track
+            if track is not None:
+                self.stop_current(player)
+                await self.start_track(player, track)
+
+    async def pause_on(self, player: PlaybackController) -> None:
+        # client thread
+        async with player.lock:
+            player.pause()
+
+    async def stop_on(self, player: PlaybackController) -> None:
+        # client thread
+        async with player.lock:
+            self.stop_current(player)
 
     @asyncSlot(QModelIndex)
     async def play_track(self, track_index: QModelIndex):
-        if self.source != SourceType.SOURCE_TRACKS or self.connected_voice is None:
+        if self.source != SourceType.SOURCE_TRACKS or not await self.wake_voice():
             return
 
-        if self.connected_voice.is_paused():
-            self.connected_voice.resume()
-            return
-
-        track: TrackNode = track_index.internalPointer()
-        await self.stop_track()
-        async with self.voice_lock:
-            # self.current_loop_count = 0
-            self.current_audio_handle = track.get_audio_handle()
-            source = self.current_audio_handle.get_pcm()
-            if not source:
-                print(f"There was an error getting the pcm for {track.track_path}!", file=stderr)
-                return
-
-            print(f"DEBUG: Playing track {track.track_path}")
-            self.connected_voice.play(source, after=self.tracks_callback)
-            self.trackChanged.emit(basename(track.track_path))
-            self.current_track = track_index
+        await self.client_thread.call(self.play_on(self.player, track_index.internalPointer()))
 
     @asyncSlot()
     async def pause_track(self):
         if self.source != SourceType.SOURCE_TRACKS or self.connected_voice is None:
             return
 
-        async with self.voice_lock:
-            if self.connected_voice.is_playing():
-                self.connected_voice.pause()
+        await self.client_thread.call(self.pause_on(self.player))
 
     @asyncSlot()
     async def stop_track(self):
         if self.source != SourceType.SOURCE_TRACKS or self.connected_voice is None:
             return
 
-        self.current_track = None
-        # self.callback_suppress_once = True
-        if self.connected_voice.is_playing() or self.connected_voice.is_paused():
-            self.connected_voice.stop()
-            if self.current_audio_handle:
-                self.current_audio_handle.cleanup()
-                self.current_audio_handle = None
+        await self.client_thread.call(self.stop_on(self.player))
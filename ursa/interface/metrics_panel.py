@@ -0,0 +1,46 @@
+from typing import Optional
+
+from PyQt5.QtCore import QTimer, pyqtSlot
+from PyQt5.QtWidgets import QFrame
+
+from ..metrics import ACTIVE_STREAMS, FFMPEG_SPAWN, FRAMES_LATE, FRAMES_READ, PHASE_SWITCH_LATENCY, \
+    TRANSITION_LATENCY
+from ..ui.metrics_panel import Ui_MetricsPanel
+
+REFRESH_INTERVAL_MS: int = 1000
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if value == float("inf"):
+        return "slow"
+
+    return f"{value * 1000:.1f} ms"
+
+
+class MetricsPanel(QFrame, Ui_MetricsPanel):
+    timer: QTimer
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setupUi(self)
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL_MS)
+
+        # CONNECTIONS
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    @pyqtSlot()
+    def refresh(self):
+        if not self.isVisible():
+            return
+
+        self.active_streams_value.setText(str(int(ACTIVE_STREAMS.total())))
+        self.transitions_value.setText(str(TRANSITION_LATENCY.count()))
+        self.transition_p50_value.setText(_format_seconds(TRANSITION_LATENCY.quantile(0.5)))
+        self.transition_p95_value.setText(_format_seconds(TRANSITION_LATENCY.quantile(0.95)))
+        self.phase_switch_value.setText(_format_seconds(PHASE_SWITCH_LATENCY.mean()))
+        self.ffmpeg_spawn_value.setText(_format_seconds(FFMPEG_SPAWN.mean()))
+        self.frames_late_value.setText(f"{int(FRAMES_LATE.total())} / {int(FRAMES_READ.total())}")
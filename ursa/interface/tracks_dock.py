@@ -1,12 +1,20 @@
+import logging
 import random
 from typing import Dict, List, Union
 
 from PyQt5.QtCore import pyqtSlot, QModelIndex, pyqtSignal
-from PyQt5.QtWidgets import QFrame
+from PyQt5.QtWidgets import QFrame, QLineEdit
 
-from ..models.tracks import TracksModel, TrackNode, ContextNode, PhaseNode
+from ..analysis import track_analysis
+from ..models.tracks import TracksModel, TracksFilterModel, TrackNode, ContextNode, PhaseNode
+from ..search import MAX_MATCHES, MIN_QUERY
 from ..ui.tracks_dock import Ui_TracksDock
 
+log = logging.getLogger(__name__)
+
+# expand the filtered tree only while it stays this small
+EXPAND_LIMIT: int = 500
+
 
 class TracksDock(QFrame, Ui_TracksDock):
     request_track_play = pyqtSignal(QModelIndex)
@@ -14,23 +22,50 @@ class TracksDock(QFrame, Ui_TracksDock):
     request_track_stop = pyqtSignal()
 
     model: TracksModel
+    filter_model: TracksFilterModel
+    filter_edit: QLineEdit
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setupUi(self)
         self.model = TracksModel(parent=self)
-        self.treeView.setModel(self.model)
+        self.filter_model = TracksFilterModel(self)
+        self.filter_model.setSourceModel(self.model)
+        self.treeView.setModel(self.filter_model)
+
+        self.filter_edit = QLineEdit(self)
+        self.filter_edit.setPlaceholderText(f"Filter contexts, phases and tracks ({MIN_QUERY}+ letters)")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.verticalLayout.insertWidget(0, self.filter_edit)
 
         # CONNECTIONS
+        self.filter_edit.textChanged.connect(self.filter_tracks)
+        self.model.index_rebuilt.connect(self.show_filtered)
         self.add_button.clicked.connect(self.add_node)
         self.delete_button.clicked.connect(self.delete_node)
         self.play_button.clicked.connect(self.play_track)
         self.pause_button.clicked.connect(self.pause_track)
         self.stop_button.clicked.connect(self.stop_track)
 
+    def selected_indexes(self) -> List[QModelIndex]:
+        return [self.filter_model.mapToSource(index) for index in self.treeView.selectedIndexes()]
+
+    @pyqtSlot(str)
+    def filter_tracks(self, query: str):
+        self.filter_model.set_query(query)
+        self.show_filtered()
+
+    @pyqtSlot()
+    def show_filtered(self):
+        self.filter_edit.setToolTip(f"Showing the first {MAX_MATCHES} matches; type more to narrow them down"
+                                    if self.filter_model.truncated else "")
+        visible = self.filter_model.visible
+        if visible is not None and len(visible) <= EXPAND_LIMIT:
+            self.treeView.expandAll()
+
     @pyqtSlot()
     def add_node(self):
-        selected_indexes = self.treeView.selectedIndexes()
+        selected_indexes = self.selected_indexes()
         parent_index = selected_indexes[0] if len(selected_indexes) else QModelIndex()
         parent_node = self.model.get_item(parent_index)
         row = parent_node.child_count()
@@ -39,13 +74,13 @@ class TracksDock(QFrame, Ui_TracksDock):
 
     @pyqtSlot()
     def delete_node(self):
-        indexes = self.treeView.selectedIndexes()
+        indexes = self.selected_indexes()
         for index in indexes:
             self.model.removeRow(index.row(), index.parent())
 
     @pyqtSlot()
     def play_track(self):
-        indexes = self.treeView.selectedIndexes()
+        indexes = self.selected_indexes()
         if not len(indexes):
             return
 
@@ -70,7 +105,7 @@ class TracksDock(QFrame, Ui_TracksDock):
                 index = self.model.index(0, 0, index)
 
         track: TrackNode = index.internalPointer()
-        print(f"DEBUG: Forwarding request for track {track.track_path}")
+        log.debug("Forwarding request for track %s", track.track_path)
         self.request_track_play.emit(index)
 
     @pyqtSlot()
@@ -84,6 +119,7 @@ class TracksDock(QFrame, Ui_TracksDock):
     @pyqtSlot(dict)
     def load_model(self, data: Dict[str, Dict[str, List[List[Union[str, int]]]]]):
         root_node = self.model.RootNode()
+        paths: List[str] = list()
         for ctx_name, ctx_data in data.items():
             ctx = ContextNode(ctx_name)
             for phase_name, phase_data in ctx_data.items():
@@ -91,9 +127,11 @@ class TracksDock(QFrame, Ui_TracksDock):
                 for trk_name, trk_loop in phase_data:
                     trk = TrackNode(trk_name, trk_loop, phase)
                     phase.append_child(trk)
+                    paths.append(trk_name)
                 ctx.append_child(phase)
             root_node.contexts.append(ctx)
         self.model.set_root(root_node)
+        track_analysis.analyse(p for p in paths if "://" not in p)
 
     @pyqtSlot(str)
     def set_track_label(self, track: str):
@@ -1,6 +1,6 @@
 from typing import Optional, List
 
-from PyQt5.QtCore import pyqtSlot, pyqtSignal
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QModelIndex
 from PyQt5.QtWidgets import QGroupBox, QRadioButton
 
 from ..models.guilds import GuildNode, VoiceChannelNode
@@ -8,48 +8,116 @@ from ..ui.vradioview import Ui_VRadioView
 
 
 class VRadioButton(QRadioButton):
-    node: VoiceChannelNode
+    node: Optional[VoiceChannelNode]
 
-    def __init__(self, channel: VoiceChannelNode, parent=None):
+    def __init__(self, channel: Optional[VoiceChannelNode] = None, parent=None):
         super().__init__(parent)
+        self.node = None
+        if channel is not None:
+            self.bind(channel)
+
+    def bind(self, channel: Optional[VoiceChannelNode]) -> None:
         self.node = channel
-        self.setText(self.node.channel.name)
+        self.setText("" if channel is None else channel.channel.name)
+
+    def set_checked(self, checked: bool) -> None:
+        # an auto-exclusive radio button can't be unchecked directly
+        self.setAutoExclusive(False)
+        self.setChecked(checked)
+        self.setAutoExclusive(True)
 
 
 class VRadioView(QGroupBox, Ui_VRadioView):
+    """
+    One radio button per row of a ``VoiceChannelsModel``, following its row signals. Buttons are
+    pooled: rows that go away hand theirs to ``spare`` for the next rows to come, so switching
+    guilds only relabels existing buttons.
+    """
     selectionChanged = pyqtSignal(VoiceChannelNode)
 
     channels_model: Optional[GuildNode.VoiceChannelsModel]
     current_node: Optional[VoiceChannelNode]
-    options: List[QRadioButton]
+    # buttons showing a row, in row order; and hidden ones waiting for reuse
+    options: List[VRadioButton]
+    spare: List[VRadioButton]
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setupUi(self)
+        self.channels_model = None
         self.current_node = None
         self.options = list()
+        self.spare = list()
 
         self.toggled.connect(self.clear_selection)
 
-    def _clear_ui(self):
-        for opt in self.options:
-            self.verticalLayout.removeWidget(opt)
-
-        self.options.clear()
-
-    def _populate_ui(self):
-        for node in self.channels_model.voice_channels:
-            button = VRadioButton(node, self)
-            self.verticalLayout.addWidget(button)
+    def _take_button(self, node: VoiceChannelNode) -> VRadioButton:
+        if self.spare:
+            button = self.spare.pop()
+        else:
+            button = VRadioButton(parent=self)
             button.clicked.connect(self.notify_selection_changed)
-            self.options.append(button)
+        button.bind(node)
+        button.set_checked(node is self.current_node)
+        return button
+
+    def _release_button(self, button: VRadioButton) -> None:
+        self.verticalLayout.removeWidget(button)
+        button.hide()
+        button.bind(None)
+        button.set_checked(False)
+        self.spare.append(button)
+
+    def _insert_rows(self, first: int, last: int) -> None:
+        for row in range(first, last + 1):
+            button = self._take_button(self.channels_model.voice_channels[row])
+            self.verticalLayout.insertWidget(row, button)
+            self.options.insert(row, button)
+            button.show()
+
+    def _remove_rows(self, first: int, last: int) -> None:
+        for button in self.options[first:last + 1]:
+            self._release_button(button)
+        del self.options[first:last + 1]
+
+    def _rebind_all(self) -> None:
+        nodes = list() if self.channels_model is None else self.channels_model.voice_channels
+        if len(self.options) > len(nodes):
+            self._remove_rows(len(nodes), len(self.options) - 1)
+
+        # relabel the buttons already in place, then add any rows beyond them
+        for button, node in zip(self.options, nodes):
+            button.bind(node)
+            button.set_checked(node is self.current_node)
+        if len(nodes) > len(self.options):
+            self._insert_rows(len(self.options), len(nodes) - 1)
+
+    @pyqtSlot(QModelIndex, int, int)
+    def rows_inserted(self, parent: QModelIndex, first: int, last: int):
+        self._insert_rows(first, last)
+
+    @pyqtSlot(QModelIndex, int, int)
+    def rows_removed(self, parent: QModelIndex, first: int, last: int):
+        if any(button.node is self.current_node for button in self.options[first:last + 1]):
+            self.current_node = None
+        self._remove_rows(first, last)
+
+    @pyqtSlot(QModelIndex, int, int, QModelIndex, int)
+    def rows_moved(self, parent: QModelIndex, first: int, last: int, destination: QModelIndex, row: int):
+        # the model has already moved its rows; the buttons just follow it
+        self._rebind_all()
+
+    @pyqtSlot(QModelIndex, QModelIndex)
+    def data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self.options[row].bind(self.channels_model.voice_channels[row])
 
     @pyqtSlot(bool)
     def notify_selection_changed(self, state: bool):
         sender = self.sender()
         assert isinstance(sender, VRadioButton)
 
-        if not state or sender.node is self.current_node:
+        if not state or sender.node is None or sender.node is self.current_node:
             return
 
         self.current_node = sender.node
@@ -57,13 +125,27 @@ class VRadioView(QGroupBox, Ui_VRadioView):
 
     @pyqtSlot()
     def set_model(self, model: GuildNode.VoiceChannelsModel):
-        self._clear_ui()
+        if model is self.channels_model:
+            return
+
+        if self.channels_model is not None:
+            self.channels_model.rowsInserted.disconnect(self.rows_inserted)
+            self.channels_model.rowsRemoved.disconnect(self.rows_removed)
+            self.channels_model.rowsMoved.disconnect(self.rows_moved)
+            self.channels_model.modelReset.disconnect(self._rebind_all)
+            self.channels_model.dataChanged.disconnect(self.data_changed)
+
         self.channels_model = model
-        self._populate_ui()
+        self.channels_model.rowsInserted.connect(self.rows_inserted)
+        self.channels_model.rowsRemoved.connect(self.rows_removed)
+        self.channels_model.rowsMoved.connect(self.rows_moved)
+        self.channels_model.modelReset.connect(self._rebind_all)
+        self.channels_model.dataChanged.connect(self.data_changed)
+        self._rebind_all()
 
     @pyqtSlot()
     def clear_selection(self):
         for opt in self.options:
-            opt.setChecked(False)
+            opt.set_checked(False)
 
         self.current_node = None
@@ -0,0 +1,69 @@
+import atexit
+import logging
+from logging import Formatter, Handler, LogRecord, StreamHandler
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional
+
+LOG_FORMAT: str = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# attributes every LogRecord carries; anything else was passed through ``extra=``
+_RECORD_ATTRS = frozenset(vars(LogRecord("", 0, "", 0, "", (), None)).keys()) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+class StructuredFormatter(Formatter):
+    """
+    Appends any ``extra=`` fields to the formatted line as ``key=value`` pairs.
+    """
+    def format(self, record: LogRecord) -> str:
+        line = super().format(record)
+        fields = [f"{k}={v!r}" for k, v in vars(record).items() if k not in _RECORD_ATTRS]
+        if fields:
+            line += " " + " ".join(fields)
+        return line
+
+
+class LazyQueueHandler(QueueHandler):
+    # The stock QueueHandler formats the record on the calling thread so it can be pickled.
+    # Our queue never leaves the process, so leave all formatting to the listener thread.
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
+def setup_logging(level: int = logging.INFO, handler: Optional[Handler] = None) -> QueueListener:
+    """
+    Route all logging through an in-process queue serviced by a background thread,
+    so that emitting a record never blocks on stdout/stderr.
+
+    :param level: root log level; records below it are dropped before any formatting
+    :param handler: sink for formatted records, defaults to stderr
+    :return: the running listener
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    if handler is None:
+        handler = StreamHandler()
+    handler.setFormatter(StructuredFormatter(LOG_FORMAT))
+
+    queue = SimpleQueue()
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(LazyQueueHandler(queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,238 @@
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from discord import AudioSource
+from discord.opus import Encoder
+
+log = logging.getLogger(__name__)
+
+LabelKey = Tuple[str, ...]
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FRAME_SECONDS: float = Encoder.FRAME_LENGTH / 1000
+
+
+class Metric(object):
+    kind: str = "untyped"
+    name: str
+    help: str
+    label_names: Tuple[str, ...]
+    lock: Lock
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.lock = Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def _format_labels(self, key: LabelKey, extra: str = "") -> str:
+        pairs = [f'{n}="{v}"' for n, v in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        return iter(())
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+    values: Dict[LabelKey, float]
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.values = dict()
+        super().__init__(name, help_text, label_names)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{self._format_labels(key)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    buckets: Tuple[float, ...]
+    counts: Dict[LabelKey, List[int]]
+    sums: Dict[LabelKey, float]
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = dict()
+        self.sums = dict()
+        super().__init__(name, help_text, label_names)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.counts.get(key)
+            if counts is None:
+                counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+            counts[i] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def count(self) -> int:
+        return sum(sum(c) for c in self.counts.values())
+
+    def mean(self) -> Optional[float]:
+        n = self.count()
+        return sum(self.sums.values()) / n if n else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Upper bucket bound of the q-th quantile across all label sets.
+        """
+        with self.lock:
+            merged = [sum(col) for col in zip(*self.counts.values())]
+        total = sum(merged)
+        if not total:
+            return None
+
+        acc = 0
+        for bound, n in zip(self.buckets + (float("inf"),), merged):
+            acc += n
+            if acc >= q * total:
+                return bound
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            items = [(k, list(c), self.sums[k]) for k, c in self.counts.items()]
+        for key, counts, total in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                yield f"{self.name}_bucket{self._format_labels(key, le)} {acc}"
+            yield f"{self.name}_sum{self._format_labels(key)} {total}"
+            yield f"{self.name}_count{self._format_labels(key)} {acc}"
+
+
+class MetricsRegistry(object):
+    metrics: Dict[str, Metric]
+
+    def __init__(self):
+        self.metrics = dict()
+
+    def register(self, metric: Metric) -> None:
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TRANSITION_LATENCY = Histogram("ursa_transition_seconds",
+                               "Time from a track ending (after= callback) to the next VoiceClient.play", ["path"])
+PHASE_SWITCH_LATENCY = Histogram("ursa_phase_switch_seconds", "Time taken by PhasedContext.play_list")
+FFMPEG_SPAWN = Histogram("ursa_ffmpeg_spawn_seconds", "Time taken to start an FFmpeg or PyAV decoder")
+FRAMES_READ = Counter("ursa_frames_read_total", "PCM frames read from audio sources", ["guild"])
+FRAMES_LATE = Counter("ursa_frames_late_total",
+                      "PCM frames whose read took longer than one frame (decoder underrun)", ["guild"])
+ACTIVE_STREAMS = Gauge("ursa_active_streams", "Audio sources currently attached to a voice client", ["guild"])
+
+
+class MeteredSource(AudioSource):
+    """
+    Pass-through AudioSource that counts frames, late reads and active streams.
+    """
+    source: AudioSource
+    guild: int
+    active: bool
+
+    def __init__(self, source: AudioSource, guild: int):
+        self.source = source
+        self.guild = guild
+        self.active = True
+        ACTIVE_STREAMS.inc(guild=guild)
+
+    def read(self) -> bytes:
+        start = perf_counter()
+        data = self.source.read()
+        if perf_counter() - start > FRAME_SECONDS:
+            FRAMES_LATE.inc(guild=self.guild)
+        FRAMES_READ.inc(guild=self.guild)
+        return data
+
+    @property
+    def position(self) -> int:
+        return getattr(self.source, "position", 0)
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self) -> None:
+        if self.active:
+            self.active = False
+            ACTIVE_STREAMS.dec(guild=self.guild)
+        self.source.cleanup()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug(format, *args)
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    Thread(target=server.serve_forever, name="ursa-metrics", daemon=True).start()
+    log.info("serving metrics on http://%s:%d/metrics", host, server.server_port)
+    return server
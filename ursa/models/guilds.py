@@ -1,10 +1,96 @@
-from typing import Set, List, Union, Any, Iterator, Dict
+from abc import abstractmethod
+from bisect import bisect, bisect_left
+from typing import Set, List, Union, Any, Iterator, Dict, Iterable, Optional
 
 from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal, pyqtSlot
 from discord import Guild, Client
+from discord.abc import GuildChannel
 from discord.channel import TextChannel, VoiceChannel
 
 
+def _channel_order(channel: GuildChannel) -> tuple:
+    return channel.position, channel.id
+
+
+class ChannelListModel(QAbstractListModel):
+    """
+    Shared row handling of the text and voice channel models, kept in channel order. The order
+    each channel was placed by is kept by id, so finding a channel's row is a bisection; discord.py
+    updates channels in place, so their current position can't be trusted for that.
+    """
+    # channel id -> the (position, id) its row was placed by
+    orders: Dict[int, tuple]
+
+    @abstractmethod
+    def nodes(self) -> list:
+        pass
+
+    @abstractmethod
+    def new_node(self, channel: GuildChannel):
+        pass
+
+    def index_channels(self) -> None:
+        self.orders = {node.channel.id: _channel_order(node.channel) for node in self.nodes()}
+
+    def _node_order(self, node) -> tuple:
+        return self.orders[node.channel.id]
+
+    def row_of(self, channel_id: int) -> int:
+        order = self.orders.get(channel_id)
+        if order is None:
+            return -1
+        return bisect_left(self.nodes(), order, key=self._node_order)
+
+    def insert_channel(self, channel: GuildChannel) -> None:
+        if channel.id in self.orders:
+            self.update_channel(channel)
+            return
+
+        nodes = self.nodes()
+        order = _channel_order(channel)
+        row = bisect(nodes, order, key=self._node_order)
+        self.beginInsertRows(QModelIndex(), row, row)
+        nodes.insert(row, self.new_node(channel))
+        self.orders[channel.id] = order
+        self.endInsertRows()
+
+    def remove_channel(self, channel_id: int):
+        row = self.row_of(channel_id)
+        if row < 0:
+            return None
+
+        self.beginRemoveRows(QModelIndex(), row, row)
+        node = self.nodes().pop(row)
+        del self.orders[channel_id]
+        self.endRemoveRows()
+        return node
+
+    def update_channel(self, channel: GuildChannel) -> None:
+        nodes = self.nodes()
+        row = self.row_of(channel.id)
+        if row < 0:
+            return
+
+        nodes[row].channel = channel
+        order = _channel_order(channel)
+        others = nodes[:row] + nodes[row + 1:]
+        target = bisect(others, order, key=self._node_order)
+        self.orders[channel.id] = order
+        if target != row:
+            # Qt counts the destination in rows before the move
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), target if target < row else target + 1)
+            nodes.insert(target, nodes.pop(row))
+            self.endMoveRows()
+            row = target
+        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def reset_channels(self, channels: List[GuildChannel]) -> None:
+        self.beginResetModel()
+        self.nodes()[:] = [self.new_node(channel) for channel in sorted(channels, key=_channel_order)]
+        self.index_channels()
+        self.endResetModel()
+
+
 class TextChannelNode(object):
     parent: 'GuildNode'
     channel: TextChannel
@@ -36,19 +122,24 @@ class VoiceChannelNode(object):
 class GuildNode(object):
     guild: Guild
     guild_name: str
+    # ids of the text channels ticked for interaction, shared by every guild of a GuildsModel
+    interact: Set[int]
 
-    class TextChannelsModel(QAbstractListModel):
+    class TextChannelsModel(ChannelListModel):
         interactables_changed = pyqtSignal()
 
         text_channels: List[TextChannelNode]
+        interact: Set[int]
 
-        def __init__(self, channels: List[TextChannel], interact: Set[str] = None, parent=None):
+        def __init__(self, channels: List[TextChannel], interact: Set[int] = None, parent=None):
             super().__init__(parent)
             if interact is None:
-                interact = list()
+                interact = set()
 
-            self.text_channels = [TextChannelNode(t, t in interact, self)
-                                  for t in channels]
+            self.interact = interact
+            self.text_channels = [TextChannelNode(t, t.id in interact, self)
+                                  for t in sorted(channels, key=_channel_order)]
+            self.index_channels()
 
         def flags(self, index: QModelIndex) -> Qt.ItemFlags:
             if not index.isValid():
@@ -77,29 +168,47 @@ class GuildNode(object):
                 return False
 
             if role == Qt.CheckStateRole:
-                self.text_channels[index.row()].interact = value
+                node = self.text_channels[index.row()]
+                node.interact = value
+                if value:
+                    self.interact.add(node.channel.id)
+                else:
+                    self.interact.discard(node.channel.id)
                 self.interactables_changed.emit()
             else:
                 return False
 
             return True
 
+        def nodes(self) -> List[TextChannelNode]:
+            return self.text_channels
+
+        def new_node(self, channel: TextChannel) -> TextChannelNode:
+            return TextChannelNode(channel, channel.id in self.interact, self)
+
+        def remove_channel(self, channel_id: int) -> Optional[TextChannelNode]:
+            node = super().remove_channel(channel_id)
+            if node is not None and node.interact:
+                self.interact.discard(channel_id)
+                self.interactables_changed.emit()
+            return node
+
         def iter_interact_nodes(self) -> Iterator[TextChannelNode]:
             for channel in self.text_channels:
                 if channel.interact:
                     yield channel
 
-        def iter_interactable(self) -> Iterator[str]:
+        def iter_interactable(self) -> Iterator[int]:
             for channel in self.text_channels:
                 if channel.interact:
-                    yield channel.channel.name
+                    yield channel.channel.id
 
-        def get_interactables(self) -> Set[str]:
+        def get_interactables(self) -> Set[int]:
             return set(self.iter_interactable())
 
-    text_model: TextChannelsModel
+    _text_model: Optional[TextChannelsModel]
 
-    class VoiceChannelsModel(QAbstractListModel):
+    class VoiceChannelsModel(ChannelListModel):
         voice_channels: List[VoiceChannelNode]
 
         def __init__(self, channels: List[VoiceChannel] = None, parent=None):
@@ -107,7 +216,8 @@ class GuildNode(object):
             if channels is None:
                 channels = list()
 
-            self.voice_channels = [VoiceChannelNode(v, self) for v in channels]
+            self.voice_channels = [VoiceChannelNode(v, self) for v in sorted(channels, key=_channel_order)]
+            self.index_channels()
 
         def rowCount(self, parent: QModelIndex = ...) -> int:
             return len(self.voice_channels)
@@ -121,30 +231,102 @@ class GuildNode(object):
             if role == Qt.EditRole:
                 return self.voice_channels[index.row()].channel
 
-    voice_model: VoiceChannelsModel
+        def nodes(self) -> List[VoiceChannelNode]:
+            return self.voice_channels
+
+        def new_node(self, channel: VoiceChannel) -> VoiceChannelNode:
+            return VoiceChannelNode(channel, self)
 
-    def __init__(self, guild: Guild, interact_channels: Set[str] = None, parent=None):
+    _voice_model: Optional[VoiceChannelsModel]
+
+    def __init__(self, guild: Guild, interact_channels: Set[int] = None, parent=None):
         if interact_channels is None:
             interact_channels = set()
         self.parent = parent
         self.guild = guild
         self.guild_name = guild.name
-        self.text_model = self.TextChannelsModel(self.guild.text_channels, interact_channels, parent)
-        self.voice_model = self.VoiceChannelsModel(self.guild.voice_channels, parent)
+        self.interact = interact_channels
+        # built on first use, i.e. when the guild is selected
+        self._text_model = None
+        self._voice_model = None
+
+    @property
+    def text_model(self) -> TextChannelsModel:
+        if self._text_model is None:
+            self._text_model = self.TextChannelsModel(self.guild.text_channels, self.interact, self.parent)
+            if isinstance(self.parent, GuildsModel):
+                self._text_model.interactables_changed.connect(self.parent.relay_changed_interact)
+        return self._text_model
+
+    @property
+    def voice_model(self) -> VoiceChannelsModel:
+        if self._voice_model is None:
+            self._voice_model = self.VoiceChannelsModel(self.guild.voice_channels, self.parent)
+        return self._voice_model
+
+    def has_models(self) -> bool:
+        return self._text_model is not None
+
+    def release(self) -> None:
+        """
+        Delete the channel models, once the guild is gone from the ``GuildsModel`` they are parented to.
+        """
+        if self._text_model is not None:
+            if isinstance(self.parent, GuildsModel):
+                self._text_model.interactables_changed.disconnect(self.parent.relay_changed_interact)
+            self._text_model.deleteLater()
+            self._text_model = None
+        if self._voice_model is not None:
+            self._voice_model.deleteLater()
+            self._voice_model = None
+
+    def set_guild(self, guild: Guild) -> None:
+        """
+        Point at a new ``Guild`` object for the same guild, e.g. after a reconnect.
+        """
+        self.guild = guild
+        self.guild_name = guild.name
+        if self._text_model is not None:
+            self._text_model.reset_channels(guild.text_channels)
+        if self._voice_model is not None:
+            self._voice_model.reset_channels(guild.voice_channels)
+
+    def add_channel(self, channel: GuildChannel) -> None:
+        if isinstance(channel, TextChannel) and self._text_model is not None:
+            self._text_model.insert_channel(channel)
+        elif isinstance(channel, VoiceChannel) and self._voice_model is not None:
+            self._voice_model.insert_channel(channel)
+
+    def remove_channel(self, channel: GuildChannel) -> None:
+        if isinstance(channel, TextChannel):
+            if self._text_model is not None:
+                self._text_model.remove_channel(channel.id)
+            else:
+                self.interact.discard(channel.id)
+        elif isinstance(channel, VoiceChannel) and self._voice_model is not None:
+            self._voice_model.remove_channel(channel.id)
+
+    def update_channel(self, after: GuildChannel) -> None:
+        if isinstance(after, TextChannel) and self._text_model is not None:
+            self._text_model.update_channel(after)
+        elif isinstance(after, VoiceChannel) and self._voice_model is not None:
+            self._voice_model.update_channel(after)
 
 
 class GuildsModel(QAbstractListModel):
     interactables_changed = pyqtSignal()
 
     guilds: List[GuildNode]
+    # ids of the guilds in the model, and of the text channels ticked for interaction
+    guild_ids: Set[int]
+    interact: Set[int]
 
     def __init__(self, client: Client, parent=None):
         super().__init__(parent)
         self.guilds = list()
-        for guild in client.guilds:
-            node = GuildNode(guild, parent=self)
-            node.text_model.interactables_changed.connect(self.relay_changed_interact)
-            self.guilds.append(node)
+        self.guild_ids = set()
+        self.interact = set()
+        self.sync_guilds(client.guilds)
 
     def rowCount(self, parent: QModelIndex = ...) -> int:
         return len(self.guilds)
@@ -158,17 +340,95 @@ class GuildsModel(QAbstractListModel):
         if role == Qt.EditRole:
             return self.guilds[index.row()].guild
 
+    def row_of(self, guild_id: int) -> int:
+        if guild_id not in self.guild_ids:
+            return -1
+
+        for row, node in enumerate(self.guilds):
+            if node.guild.id == guild_id:
+                return row
+        return -1
+
+    def node_of(self, guild_id: int) -> Optional[GuildNode]:
+        row = self.row_of(guild_id)
+        return None if row < 0 else self.guilds[row]
+
+    def sync_guilds(self, guilds: Iterable[Guild]) -> None:
+        """
+        Bring the model in line with ``guilds``: new guilds are appended, missing ones removed, and
+        known ones pointed at their (possibly new) ``Guild`` objects.
+        """
+        # without chunking at startup, guilds still in an outage are listed before their channels arrive
+        current = {guild.id: guild for guild in guilds if not guild.unavailable}
+        for node in list(self.guilds):
+            if node.guild.id not in current:
+                self.remove_guild(node.guild)
+        for guild in current.values():
+            node = self.node_of(guild.id)
+            if node is None:
+                self.add_guild(guild)
+            elif node.guild is not guild:
+                node.set_guild(guild)
+
+    @pyqtSlot(Guild)
+    def add_guild(self, guild: Guild) -> None:
+        if guild.id in self.guild_ids or guild.unavailable:
+            return
+
+        row = len(self.guilds)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.guilds.append(GuildNode(guild, self.interact, parent=self))
+        self.guild_ids.add(guild.id)
+        self.endInsertRows()
+
+    @pyqtSlot(Guild)
+    def remove_guild(self, guild: Guild) -> None:
+        row = self.row_of(guild.id)
+        if row < 0:
+            return
+
+        self.beginRemoveRows(QModelIndex(), row, row)
+        node = self.guilds.pop(row)
+        self.guild_ids.discard(guild.id)
+        self.endRemoveRows()
+        node.release()
+        ticked = self.interact & {channel.id for channel in node.guild.text_channels}
+        if ticked:
+            self.interact -= ticked
+            self.interactables_changed.emit()
+
+    @pyqtSlot(GuildChannel)
+    def add_channel(self, channel: GuildChannel) -> None:
+        node = self.node_of(channel.guild.id)
+        if node is not None:
+            node.add_channel(channel)
+
+    @pyqtSlot(GuildChannel)
+    def remove_channel(self, channel: GuildChannel) -> None:
+        node = self.node_of(channel.guild.id)
+        if node is not None:
+            node.remove_channel(channel)
+
+    @pyqtSlot(GuildChannel, GuildChannel)
+    def update_channel(self, before: GuildChannel, after: GuildChannel) -> None:
+        node = self.node_of(after.guild.id)
+        if node is not None:
+            node.update_channel(after)
+
     @pyqtSlot()
     def relay_changed_interact(self):
         self.interactables_changed.emit()
 
     def text_channels_interact_iter(self) -> Iterator[TextChannelNode]:
         for guild in self.guilds:
-            yield from guild.text_model.iter_interact_nodes()
+            # only a guild that has been selected can have ticked channels
+            if guild.has_models():
+                yield from guild.text_model.iter_interact_nodes()
 
-    def text_channels_interact(self) -> Dict[str, Set[str]]:
+    def text_channels_interact(self) -> Dict[int, Set[int]]:
         data = dict()
         for guild in self.guilds:
-            data[guild.guild_name] = guild.text_model.get_interactables()
+            if guild.has_models():
+                data[guild.guild.id] = guild.text_model.get_interactables()
 
         return data
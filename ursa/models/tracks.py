@@ -7,16 +7,29 @@ CONTEXT
 |-> PHASE
 |   |-> TRACK   0
 """
+import asyncio
+import logging
+import posixpath
 import random
 from abc import ABC, abstractmethod
-from select import select
-from subprocess import Popen, DEVNULL, PIPE
-from typing import Any, List, Optional, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Iterator, List, Optional, Set, Tuple, Union
 
-from PyQt5.QtCore import Qt, QModelIndex
-from discord import FFmpegPCMAudio
+from PyQt5.QtCore import Qt, QModelIndex, QSortFilterProxyModel, pyqtSignal, pyqtSlot
+from discord import AudioSource
 
 from . import AbstractEditableTreeNode, AbstractTreeNode, AbstractEditableTreeModel
+from ..analysis import track_analysis
+from ..cache import readahead, track_cache
+from ..decoder import decoder_pool
+from ..search import MAX_MATCHES, MIN_QUERY, TrigramIndex
+from ..streaming import HttpStream, PREFILL_BYTES, CONNECT_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+# works out the trigrams of a reset model's names, away from the GUI thread
+_index_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ursa-index")
 
 
 class TracksBaseNode(AbstractEditableTreeNode, ABC):
@@ -29,6 +42,15 @@ class TracksBaseNode(AbstractEditableTreeNode, ABC):
     def column_count(self) -> int:
         return 2
 
+    @abstractmethod
+    def search_text(self) -> str:
+        pass
+
+    def walk(self) -> Iterator['TracksBaseNode']:
+        yield self
+        for row in range(self.child_count()):
+            yield from self.child(row).walk()
+
 
 class AbstractAudioHandle(ABC):
     source: str
@@ -38,47 +60,57 @@ class AbstractAudioHandle(ABC):
         self.source = source
         self.parent = parent
 
+    async def prepare(self) -> None:
+        # wait, without blocking the loop, until the handle can be played without stuttering
+        pass
+
     @abstractmethod
     def cleanup(self) -> None:
         pass
 
     @abstractmethod
-    def get_pcm(self) -> Optional[FFmpegPCMAudio]:
+    def get_pcm(self) -> Optional[AudioSource]:
         pass
 
 
 class LocalAudioHandle(AbstractAudioHandle):
-    handle: Optional[FFmpegPCMAudio]
+    handle: Optional[AudioSource]
 
     def __init__(self, source: str, parent: 'TrackNode'):
         super().__init__(source, parent)
-        self.handle = FFmpegPCMAudio(self.source)
+        looping = parent.is_self_loop()
+        start, end = track_analysis.bounds(self.source, looping)
+        open_source = decoder_pool.open_loop if looping else decoder_pool.open
+        self.handle = open_source(track_cache.resolve(self.source), track_analysis.gain(self.source), start, end)
 
     def cleanup(self) -> None:
         self.handle.cleanup()
         self.handle = None
 
-    def get_pcm(self) -> Optional[FFmpegPCMAudio]:
+    def get_pcm(self) -> Optional[AudioSource]:
         return self.handle
 
-# youtube-dl doesn't work anymore, so this is useless...
-class YoutubeAudioHandle(AbstractAudioHandle):
-    downstream: Popen
-    handle: Optional[FFmpegPCMAudio]
+
+class HttpAudioHandle(AbstractAudioHandle):
+    stream: HttpStream
+    handle: Optional[AudioSource]
 
     def __init__(self, source: str, parent: 'TrackNode'):
         super().__init__(source, parent)
-        # self.downstream: Popen = Popen(["youtube-dl", source, "-o", "-"],
-        self.downstream: Popen = Popen(f"youtube-dl {source} --buffer-size 16K -o - | buffer -m 16m",
-                                       shell=True, stdin=DEVNULL, stdout=PIPE)
-        select([self.downstream.stdout], list(), list(), 5)
-        self.handle = FFmpegPCMAudio(self.downstream.stdout, pipe=True)
+        self.stream = HttpStream(self.source)
+        self.handle = decoder_pool.open(self.stream.ring)
+
+    async def prepare(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.stream.ring.wait_for, PREFILL_BYTES, CONNECT_TIMEOUT)
 
     def cleanup(self) -> None:
-        self.downstream.terminate()
+        self.stream.close()
+        if self.handle is not None:
+            self.handle.cleanup()
         self.handle = None
 
-    def get_pcm(self) -> Optional[FFmpegPCMAudio]:
+    def get_pcm(self) -> Optional[AudioSource]:
         return self.handle
 
 
@@ -92,11 +124,30 @@ class TrackNode(TracksBaseNode):
         self.loop_count = loop_count
 
     def get_audio_handle(self) -> AbstractAudioHandle:
-        if self.track_path.startswith("https://youtu.be/"):
-            return YoutubeAudioHandle(self.track_path, self)
+        if self.track_path.startswith(("http://", "https://")):
+            return HttpAudioHandle(self.track_path, self)
 
         return LocalAudioHandle(self.track_path, self)
 
+    def is_self_loop(self) -> bool:
+        return isinstance(self.parent, PhaseNode) and self.parent.tracks.index(self) == self.loop_count
+
+    def next_track(self) -> Optional['TrackNode']:
+        """
+        The track played after this one: the one its loop count names, a random one for -1,
+        or None if that is out of range. Plain data, so usable off the Qt thread.
+        """
+        siblings = self.parent.child_count()
+        next_track_id = self.loop_count
+        if next_track_id == -1:
+            next_track_id = random.randint(0, siblings - 1)
+
+        if next_track_id not in range(siblings):
+            log.debug("index out-of-range; no more tracks")
+            return None
+
+        return self.parent.child(next_track_id)
+
     def insert_children(self, position: int, count: int) -> bool:
         return False
 
@@ -126,6 +177,10 @@ class TrackNode(TracksBaseNode):
     def child_count(self) -> int:
         return 0
 
+    def search_text(self) -> str:
+        # the file name, or the last part of a URL
+        return posixpath.basename(self.track_path.replace("\\", "/").rstrip("/"))
+
     def data(self, column: int) -> Any:
         if column:
             return self.loop_count
@@ -176,6 +231,12 @@ class PhaseNode(TracksBaseNode):
     def child_count(self) -> int:
         return len(self.tracks)
 
+    def search_text(self) -> str:
+        return self.name
+
+    def readahead(self, row: int) -> List[str]:
+        return readahead([(t.track_path, t.loop_count) for t in self.tracks], row)
+
     def data(self, column: int) -> Optional[str]:
         if column == 0:
             return self.name
@@ -224,6 +285,9 @@ class ContextNode(TracksBaseNode):
     def child_count(self) -> int:
         return len(self.phases)
 
+    def search_text(self) -> str:
+        return self.name
+
     def data(self, column: int) -> Optional[str]:
         if column:
             return None
@@ -269,10 +333,31 @@ class TracksModel(AbstractEditableTreeModel):
 
             return False
 
+    # a rebuilt search_index is in place
+    index_rebuilt = pyqtSignal()
+    # (generation, future of the TrigramIndex), from the index thread
+    index_built = pyqtSignal(int, Future)
+
     root_node: RootNode
+    # contexts, phases and tracks by name; follows every change to the model
+    search_index: TrigramIndex[TracksBaseNode]
+    # counts rebuilds, so an index built for an older tree is dropped
+    index_generation: int
+    # edits made while a rebuild runs, to replay onto its index: (node, name, or None once removed)
+    index_backlog: Optional[List[Tuple[TracksBaseNode, Optional[str]]]]
 
     def __init__(self, contexts: List[ContextNode] = None, parent=None):
         super().__init__(self.RootNode(contexts), parent)
+        self.search_index = TrigramIndex()
+        self.index_generation = 0
+        self.index_backlog = None
+        self.index_built.connect(self.install_index)
+        self.rebuild_index()
+
+        self.modelReset.connect(self.rebuild_index)
+        self.rowsInserted.connect(self.index_rows)
+        self.rowsAboutToBeRemoved.connect(self.unindex_rows)
+        self.dataChanged.connect(self.reindex_rows)
 
     def setHeaderData(self, section: int, orientation: Qt.Orientation, value: Any, role: int = ...) -> bool:
         # Read only
@@ -295,6 +380,75 @@ class TracksModel(AbstractEditableTreeModel):
         self.root_node = root_node
         self.endResetModel()
 
+    @pyqtSlot()
+    def rebuild_index(self):
+        """
+        Index the whole tree again on the index thread. The names are read here, where the tree
+        lives; until the index is in place (see ``index_rebuilt``), lookups only see later edits.
+        """
+        items = [(node, node.search_text()) for context in self.root_node.contexts for node in context.walk()]
+        self.index_generation += 1
+        self.index_backlog = list()
+        self.search_index = TrigramIndex()
+        generation = self.index_generation
+        future = _index_executor.submit(TrigramIndex, items)
+        # emitted on the index thread, delivered on this one
+        future.add_done_callback(lambda done: self.index_built.emit(generation, done))
+
+    @pyqtSlot(int, Future)
+    def install_index(self, generation: int, future: Future):
+        if generation != self.index_generation:
+            return
+
+        try:
+            index = future.result()
+        except Exception:
+            log.exception("indexing the tracks failed")
+            return
+        for node, text in self.index_backlog:
+            if text is None:
+                index.remove(node)
+            else:
+                index.add(node, text)
+        self.search_index = index
+        self.index_backlog = None
+        self.index_rebuilt.emit()
+
+    def update_index(self, node: TracksBaseNode, text: Optional[str]) -> None:
+        """
+        Index ``node`` under ``text``, or drop it with None.
+        """
+        if text is None:
+            self.search_index.remove(node)
+        else:
+            self.search_index.add(node, text)
+        if self.index_backlog is not None:
+            self.index_backlog.append((node, text))
+
+    @pyqtSlot(QModelIndex, int, int)
+    def index_rows(self, parent: QModelIndex, first: int, last: int):
+        parent_node = self.get_item(parent)
+        for row in range(first, last + 1):
+            for node in parent_node.child(row).walk():
+                self.update_index(node, node.search_text())
+
+    @pyqtSlot(QModelIndex, int, int)
+    def unindex_rows(self, parent: QModelIndex, first: int, last: int):
+        parent_node = self.get_item(parent)
+        for row in range(first, last + 1):
+            for node in parent_node.child(row).walk():
+                self.update_index(node, None)
+
+    @pyqtSlot(QModelIndex, QModelIndex)
+    def reindex_rows(self, top_left: QModelIndex, bottom_right: QModelIndex):
+        if top_left.column() > 0:
+            return
+
+        parent_node = self.get_item(top_left.parent())
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            node = parent_node.child(row)
+            self.update_index(node, node.search_text())
+
     def get_next_track(self, index: QModelIndex, loop_n: int = -1) -> Optional[QModelIndex]:
         """
         Returns the next valid track if the conditions are valid to do so.
@@ -307,15 +461,91 @@ class TracksModel(AbstractEditableTreeModel):
         """
         current_node = self.get_item(index)
         if not isinstance(current_node, TrackNode):
-            print("DEBUG: Node is not a track!")
+            log.debug("Node is not a track!")
             return
 
-        next_track_id = current_node.loop_count
-        if next_track_id == -1:
-            next_track_id = random.randint(0, current_node.parent.child_count() - 1)
+        next_node = current_node.next_track()
+        if next_node is None:
+            return
+
+        return self.index(current_node.parent.tracks.index(next_node), 0, index.parent())
+
+
+class TracksFilterModel(QSortFilterProxyModel):
+    """
+    Shows the rows of a ``TracksModel`` whose name contains a query, with their ancestors and
+    descendants. The set of rows to show is looked up in the model's trigram index once per query
+    (or edit), so filtering a row is a set lookup and rows under collapsed nodes are never visited.
+    A query matching more than ``MAX_MATCHES`` names shows only that many, and sets ``truncated``.
+    """
+    query: str
+    visible: Optional[Set[TracksBaseNode]]
+    truncated: bool
 
-        if next_track_id not in range(current_node.parent.child_count()):
-            print("DEBUG: index out-of-range; no more tracks")
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.query = ""
+        self.visible = None
+        self.truncated = False
+
+    def setSourceModel(self, model: TracksModel) -> None:
+        if self.sourceModel() is not None:
+            self.sourceModel().modelReset.disconnect(self.refresh)
+            self.sourceModel().index_rebuilt.disconnect(self.refresh)
+            self.sourceModel().rowsInserted.disconnect(self.show_rows)
+            self.sourceModel().dataChanged.disconnect(self.rename_rows)
+
+        super().setSourceModel(model)
+        # connected after the proxy's own handlers, and after the model updated its index
+        model.modelReset.connect(self.refresh)
+        model.index_rebuilt.connect(self.refresh)
+        model.rowsInserted.connect(self.show_rows)
+        model.dataChanged.connect(self.rename_rows)
+        self.refresh()
+
+    def set_query(self, query: str) -> None:
+        self.query = query.strip()
+        self.refresh()
+
+    @pyqtSlot()
+    def refresh(self):
+        model: TracksModel = self.sourceModel()
+        if model is None or len(self.query) < MIN_QUERY:
+            self.visible = None
+            self.truncated = False
+        else:
+            # one more than shown, to tell whether there were more
+            matches = model.search_index.find(self.query, limit=MAX_MATCHES + 1)
+            self.truncated = len(matches) > MAX_MATCHES
+            if self.truncated:
+                matches = set(islice(matches, MAX_MATCHES))
+            self.visible = set()
+            for node in matches:
+                self.visible.update(node.walk())
+                parent = node.parent
+                while isinstance(parent, TracksBaseNode) and parent not in self.visible:
+                    self.visible.add(parent)
+                    parent = parent.parent
+        self.invalidateFilter()
+
+    @pyqtSlot(QModelIndex, int, int)
+    def show_rows(self, parent: QModelIndex, first: int, last: int):
+        # keep new rows in sight while they are being named
+        if self.visible is None:
             return
 
-        return self.index(next_track_id, 0, index.parent())
+        parent_node = self.sourceModel().get_item(parent)
+        for row in range(first, last + 1):
+            self.visible.update(parent_node.child(row).walk())
+        self.invalidateFilter()
+
+    @pyqtSlot(QModelIndex, QModelIndex)
+    def rename_rows(self, top_left: QModelIndex, bottom_right: QModelIndex):
+        if top_left.column() == 0 and self.visible is not None:
+            self.refresh()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if self.visible is None:
+            return True
+
+        return self.sourceModel().index(source_row, 0, source_parent).internalPointer() in self.visible
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from asyncio import AbstractEventLoop, Lock, Queue, Task
+from inspect import isawaitable
+from time import monotonic, perf_counter
+from typing import Any, Callable, Optional, Tuple
+
+from discord import AudioSource, ClientException, Guild, VoiceChannel, VoiceClient
+
+from .metrics import TRANSITION_LATENCY
+from .scheduler import ScheduledStream, audio_scheduler
+
+log = logging.getLogger(__name__)
+
+RECONNECT_ATTEMPTS: int = 3
+RECONNECT_BACKOFF: float = 2.0
+# seconds without listeners, or without anything playing, before a voice connection counts as idle
+IDLE_TIMEOUT: float = 600.0
+IDLE_CHECK_INTERVAL: float = 30.0
+
+# (generation or None, callback, args, time the source ended or None)
+PlaybackCommand = Tuple[Optional[int], Callable, Tuple[Any, ...], Optional[float]]
+
+
+async def connect_voice(channel: VoiceChannel, attempts: int = RECONNECT_ATTEMPTS) -> Optional[VoiceClient]:
+    """
+    Connect to ``channel``, retrying with backoff. None if every attempt failed.
+    """
+    for attempt in range(attempts):
+        try:
+            return await channel.connect()
+        except (asyncio.TimeoutError, ClientException, OSError) as e:
+            log.warning("could not connect to %s (attempt %d of %d): %s", channel, attempt + 1, attempts, e)
+            if attempt + 1 < attempts:
+                await asyncio.sleep(RECONNECT_BACKOFF * 2 ** attempt)
+    return None
+
+
+def has_listeners(voice_client: VoiceClient) -> bool:
+    """
+    Whether anyone but bots is in ``voice_client``'s channel. Uses voice states rather than
+    the member list, so it works without the members intent. The client updates those on its
+    own loop, so call it there.
+    """
+    channel = voice_client.channel
+    if channel is None:
+        return False
+
+    for user_id in channel.voice_states:
+        member = channel.guild.get_member(user_id)
+        if user_id != voice_client.user.id and (member is None or not member.bot):
+            return True
+    return False
+
+
+class PlaybackController(object):
+    """
+    Owns a guild's VoiceClient and serializes every playback state change on the event loop.
+
+    discord.py runs ``after=`` callbacks on its audio player thread. The controller only
+    forwards them into a per-guild command queue with ``loop.call_soon_threadsafe``; a task
+    on the loop then runs them under ``lock``. Callbacks belonging to a source that has
+    since been stopped or replaced are dropped.
+
+    It exposes the subset of the VoiceClient interface used by Track, Playlist and
+    PhasedContext, so it can be passed wherever they expect a client. Sources are sent by
+    ``audio_scheduler`` when it is enabled, otherwise by discord.py's own player thread.
+    """
+    voice_client: VoiceClient
+    label: str
+    loop: AbstractEventLoop
+    lock: Lock
+    queue: Queue
+    generation: int
+    source: Optional[AudioSource]
+    stream: Optional[ScheduledStream]
+    idle_since: Optional[float]
+    task: Optional[Task]
+
+    def __init__(self, voice_client: VoiceClient, label: str = "gui", lock: Optional[Lock] = None):
+        self.voice_client = voice_client
+        self.label = label
+        self.loop = asyncio.get_running_loop()
+        self.lock = lock or Lock()
+        self.queue = Queue()
+        self.generation = 0
+        self.source = None
+        self.stream = None
+        self.idle_since = None
+        self.task = self.loop.create_task(self._run())
+
+    @property
+    def guild(self) -> Guild:
+        return self.voice_client.guild
+
+    @property
+    def output(self):
+        # whatever is sending the current source: a scheduled stream or the voice client itself
+        return self.stream if self.stream is not None else self.voice_client
+
+    def is_playing(self) -> bool:
+        return self.output.is_playing()
+
+    def is_paused(self) -> bool:
+        return self.output.is_paused()
+
+    @property
+    def position(self) -> int:
+        """
+        Sample (at 48 kHz) the current or last source has played up to, if it keeps track.
+        """
+        if self.stream is not None and self.stream.source is self.source:
+            return self.stream.position
+        return getattr(self.source, "position", 0)
+
+    def play(self, source: AudioSource, *, after: Optional[Callable] = None) -> None:
+        self.generation += 1
+        generation = self.generation
+
+        def hand_off(error: Optional[Exception]):
+            # runs on discord's audio player thread; do nothing here but enqueue
+            if after is not None:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, (generation, after, (error,), perf_counter()))
+
+        self.source = source
+        if audio_scheduler.enabled:
+            self.stream = audio_scheduler.play(self.voice_client, source, after=hand_off)
+        else:
+            self.voice_client.play(source, after=hand_off)
+
+    def stop(self) -> None:
+        self.generation += 1
+        output = self.output
+        if output.is_playing() or output.is_paused():
+            output.stop()
+
+    def pause(self) -> None:
+        if self.output.is_playing():
+            self.output.pause()
+
+    def resume(self) -> None:
+        if self.output.is_paused():
+            self.output.resume()
+
+    def rebind(self, voice_client: VoiceClient) -> bool:
+        """
+        Play on ``voice_client`` from now on, e.g. after the old connection dropped.
+        Returns True if the current source carried on, False if it had to be stopped.
+        """
+        if self.stream is not None and (self.stream.is_playing() or self.stream.is_paused()):
+            audio_scheduler.retarget(self.stream, voice_client)
+            self.voice_client = voice_client
+            return True
+
+        # discord.py's player belongs to the old connection
+        self.stop()
+        self.stream = None
+        self.voice_client = voice_client
+        return False
+
+    def is_idle(self, timeout: float = IDLE_TIMEOUT) -> bool:
+        """
+        True once nobody has been listening, or nothing playing, for ``timeout`` seconds.
+        Meant to be polled, on the voice client's loop (see ``has_listeners``).
+        """
+        if self.is_playing() and has_listeners(self.voice_client):
+            self.idle_since = None
+            return False
+
+        now = monotonic()
+        if self.idle_since is None:
+            self.idle_since = now
+        return now - self.idle_since >= timeout
+
+    def submit(self, callback: Callable, *args) -> None:
+        """
+        Queue ``callback(*args)`` to run on the loop under ``lock``. Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (None, callback, args, None))
+
+    def close(self) -> None:
+        self.stop()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        while True:
+            generation, callback, args, ended_at = await self.queue.get()
+            if generation is not None and generation != self.generation:
+                log.debug("dropping stale callback for generation %d", generation)
+                continue
+
+            async with self.lock:
+                before = self.generation
+                try:
+                    result = callback(*args)
+                    if isawaitable(result):
+                        await result
+                except Exception:
+                    log.exception("playback callback failed")
+
+                if ended_at is not None and self.generation != before:
+                    TRANSITION_LATENCY.observe(perf_counter() - ended_at, path=self.label)
@@ -3,6 +3,7 @@ from typing import List, Callable
 
 from discord import VoiceClient
 
+from .cache import readahead, track_cache
 from .track import Track
 
 
@@ -25,6 +26,9 @@ class Playlist(object):
     def reset(self) -> None:
         self.current_index = 0
 
+    def readahead(self) -> List[str]:
+        return readahead([(t.track_name, t.next_track_no) for t in self.playlist], self.current_index)
+
     def play_track(self, client: VoiceClient, callback: Callable) -> bool:
         c_track = self.playlist[self.current_index]
         next_index = c_track.next_track_no
@@ -36,4 +40,14 @@ class Playlist(object):
             return False
 
         self.current_index = next_index
-        return self.playlist[self.current_index].play_track(client, callback)
+        return self.play_current(client, callback)
+
+    def play_current(self, client: VoiceClient, callback: Callable, position: int = 0) -> bool:
+        """
+        Play the current track again, from ``position`` (a sample at 48 kHz).
+        """
+        track = self.current_track
+        played = track.play_track(client, callback, looping=track.next_track_no == self.current_index,
+                                  position=position)
+        track_cache.prefetch(self.readahead())
+        return played
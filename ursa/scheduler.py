@@ -0,0 +1,470 @@
+import asyncio
+import ctypes
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep
+from typing import Any, Callable, Deque, Dict, List, Optional, Union
+
+from discord import AudioSource, ClientException
+from discord.enums import SpeakingState
+from discord.opus import Encoder
+from discord.utils import MISSING
+
+from .metrics import FRAME_SECONDS, Counter, Gauge, Histogram
+
+log = logging.getLogger(__name__)
+
+# a shard that falls further behind than this drops the backlog instead of bursting to catch up
+MAX_CATCH_UP: int = 5
+SILENCE_FRAMES: int = 5
+# frames read ahead of the clock for each stream, and how low the queue gets before a refill
+PREFETCH_FRAMES: int = 10
+PREFETCH_LOW: int = 5
+PREFETCH_WORKERS: int = 4
+# an empty Opus frame, as discord.py sends after a stream ends
+OPUS_SILENCE: bytes = b'\xf8\xff\xfe'
+LATENESS_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+SCHEDULED_STREAMS = Gauge("ursa_scheduled_streams", "Streams sent by the audio scheduler", ["shard"])
+TICK_LATENESS = Histogram("ursa_scheduler_tick_lateness_seconds",
+                          "How late each audio scheduler tick started", ["shard"], LATENESS_BUCKETS)
+TICK_OVERRUNS = Counter("ursa_scheduler_overruns_total",
+                        "Audio scheduler ticks more than a frame late", ["shard"])
+TICK_UNDERRUNS = Counter("ursa_scheduler_underruns_total",
+                         "Ticks a stream had no frame read ahead and sent silence instead", ["shard"])
+
+
+def _speak(voice_client, state: SpeakingState) -> None:
+    ws = getattr(voice_client, "ws", None)
+    if not ws:
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(ws.speak(state), voice_client.client.loop)
+    except Exception:
+        log.exception("speaking call failed")
+
+
+class ScheduledStream(object):
+    """
+    One source playing on one voice client, sent by an ``AudioScheduler`` shard.
+    It has the playback subset of the VoiceClient interface.
+
+    Frames are read ahead into ``frames`` by ``fill`` on the scheduler's prefetch threads, so a
+    shard only ever takes what is ready. Sources that return the same ctypes frame on every
+    read (the decoder pool's) are copied into buffers recycled through ``free``.
+    """
+    voice_client: Any
+    source: AudioSource
+    after: Optional[Callable[[Optional[Exception]], Any]]
+    encode: bool
+    frames: Deque[Union[bytes, ctypes.Array]]
+    free: Deque[ctypes.Array]
+    filling: bool
+    exhausted: bool
+    paused: bool
+    silenced: bool
+    ended: bool
+    error: Optional[Exception]
+    disconnected_at: Optional[float]
+    lock: Lock
+    reading: bool
+    closed: bool
+
+    def __init__(self, voice_client, source: AudioSource, after: Optional[Callable] = None):
+        self.voice_client = voice_client
+        self.source = source
+        self.after = after
+        self.encode = not source.is_opus()
+        self.frames = deque()
+        self.free = deque()
+        self.filling = False
+        self.exhausted = False
+        self.paused = False
+        self.silenced = False
+        self.ended = False
+        self.error = None
+        self.disconnected_at = None
+        self.lock = Lock()
+        self.reading = False
+        self.closed = False
+
+    @property
+    def position(self) -> int:
+        """
+        Sample (at 48 kHz) the source has been sent up to, not counting frames read ahead.
+        """
+        position = getattr(self.source, "position", 0)
+        return max(position - len(self.frames) * Encoder.SAMPLES_PER_FRAME, 0)
+
+    def is_playing(self) -> bool:
+        return not self.ended and not self.paused
+
+    def is_paused(self) -> bool:
+        return not self.ended and self.paused
+
+    def stop(self) -> None:
+        self.ended = True
+
+    def pause(self) -> None:
+        if not self.ended and not self.paused:
+            self.paused = True
+            _speak(self.voice_client, SpeakingState.none)
+
+    def resume(self) -> None:
+        if not self.ended and self.paused:
+            self.silenced = False
+            self.paused = False
+            _speak(self.voice_client, SpeakingState.voice)
+
+    def _read(self) -> Union[bytes, ctypes.Array]:
+        data = self.source.read()
+        if not isinstance(data, ctypes.Array) or not data:
+            return data
+
+        buffer = self.free.popleft() if self.free else (ctypes.c_char * len(data))()
+        ctypes.memmove(buffer, data, len(data))
+        return buffer
+
+    def fill(self) -> None:
+        """
+        Read ahead until ``PREFETCH_FRAMES`` are queued or the source ends. Runs on a prefetch
+        thread; a source closed meanwhile is cleaned up here once its read returns.
+        """
+        try:
+            while not self.ended and not self.exhausted and len(self.frames) < PREFETCH_FRAMES:
+                with self.lock:
+                    if self.closed:
+                        return
+                    self.reading = True
+                try:
+                    data = self._read()
+                finally:
+                    with self.lock:
+                        self.reading = False
+                        closed = self.closed
+                    if closed:
+                        self.source.cleanup()
+                if closed:
+                    return
+
+                if not data:
+                    self.error = getattr(self.source, "_current_error", None)
+                    self.exhausted = True
+                else:
+                    self.frames.append(data)
+        except Exception as e:
+            self.error = e
+            self.exhausted = True
+        finally:
+            self.filling = False
+
+    def close(self) -> None:
+        """
+        Clean up the source, now or, if it is being read, as soon as that read returns.
+        """
+        with self.lock:
+            self.closed = True
+            reading = self.reading
+        if not reading:
+            self.source.cleanup()
+
+
+class SchedulerShard(object):
+    """
+    A thread sending one frame for each of its streams every 20 ms, against a monotonic clock.
+    It never reads a source itself: a stream with no frame ready gets a silent one.
+    """
+    name: str
+    scheduler: 'AudioScheduler'
+    streams: List[ScheduledStream]
+    lock: Lock
+    wakeup: Event
+    running: bool
+    thread: Thread
+
+    def __init__(self, scheduler: 'AudioScheduler', name: str):
+        self.name = name
+        self.scheduler = scheduler
+        self.streams = list()
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.running = True
+        self.thread = Thread(target=self._run, name=f"ursa-audio-{name}", daemon=True)
+        self.thread.start()
+
+    def add(self, stream: ScheduledStream) -> None:
+        with self.lock:
+            self.streams.append(stream)
+        SCHEDULED_STREAMS.inc(shard=self.name)
+        self.wakeup.set()
+
+    def _remove(self, stream: ScheduledStream) -> None:
+        with self.lock:
+            if stream not in self.streams:
+                return
+            self.streams.remove(stream)
+        SCHEDULED_STREAMS.dec(shard=self.name)
+        self.scheduler.finish(stream)
+
+    def _run(self) -> None:
+        next_tick = perf_counter()
+        while self.running:
+            with self.lock:
+                streams = list(self.streams)
+            if not streams:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                next_tick = perf_counter()
+                continue
+
+            now = perf_counter()
+            for stream in streams:
+                self._send(stream, now)
+
+            next_tick += FRAME_SECONDS
+            lateness = perf_counter() - next_tick
+            if lateness > 0:
+                TICK_LATENESS.observe(lateness, shard=self.name)
+                if lateness > FRAME_SECONDS:
+                    TICK_OVERRUNS.inc(shard=self.name)
+                if lateness > FRAME_SECONDS * MAX_CATCH_UP:
+                    next_tick = perf_counter()
+            else:
+                TICK_LATENESS.observe(0.0, shard=self.name)
+                sleep(-lateness)
+
+        with self.lock:
+            streams, self.streams = self.streams, list()
+        for stream in streams:
+            stream.ended = True
+            SCHEDULED_STREAMS.dec(shard=self.name)
+            self.scheduler.finish(stream)
+
+    def _send(self, stream: ScheduledStream, now: float) -> None:
+        vc = stream.voice_client
+        try:
+            if stream.ended:
+                self._remove(stream)
+                return
+
+            if stream.paused:
+                if not stream.silenced:
+                    stream.silenced = True
+                    self.scheduler.send_silence(vc)
+                return
+
+            if not vc.is_connected():
+                # like discord.py's player, wait for a reconnect, but not forever
+                if stream.disconnected_at is None:
+                    stream.disconnected_at = now
+                elif now - stream.disconnected_at > getattr(vc, "timeout", 30.0):
+                    log.debug("not reconnected to voice, aborting playback")
+                    stream.ended = True
+                    self._remove(stream)
+                return
+
+            if stream.disconnected_at is not None:
+                stream.disconnected_at = None
+                _speak(vc, SpeakingState.voice)
+
+            # exhausted is only set after the last frame is queued, so read it first
+            exhausted = stream.exhausted
+            if not stream.frames:
+                if exhausted:
+                    stream.ended = True
+                    self._remove(stream)
+                    return
+                TICK_UNDERRUNS.inc(shard=self.name)
+                vc.send_audio_packet(OPUS_SILENCE, encode=False)
+                self.scheduler.prefetch(stream)
+                return
+
+            data = stream.frames.popleft()
+            vc.send_audio_packet(data, encode=stream.encode)
+            if isinstance(data, ctypes.Array):
+                stream.free.append(data)
+            if len(stream.frames) < PREFETCH_LOW:
+                self.scheduler.prefetch(stream)
+        except Exception as e:
+            stream.error = e
+            stream.ended = True
+            self._remove(stream)
+
+    def stop(self) -> None:
+        self.running = False
+        self.wakeup.set()
+
+
+class AudioScheduler(object):
+    """
+    Sends audio for every voice client from a small fixed set of threads, in place of the
+    thread per ``VoiceClient.play`` that discord.py starts. Each shard thread encodes and
+    sends one frame for each of its streams per 20 ms tick.
+
+    Sources are only read on prefetch threads, a few frames ahead of the ticks; the first
+    read, which may wait for a decoder to start, happens before the stream joins a shard.
+    A stream's end is announced on the shard that sent it, and its ``after`` callback and
+    cleanup run on another thread, so none of it holds up a tick.
+    """
+    threads: int
+    shards: List[SchedulerShard]
+    clients: Dict[int, ScheduledStream]
+    lock: Lock
+    prefetcher: Optional[ThreadPoolExecutor]
+    finisher: Optional[ThreadPoolExecutor]
+
+    def __init__(self, threads: int = 1):
+        self.threads = threads
+        self.shards = list()
+        self.clients = dict()
+        self.lock = Lock()
+        self.prefetcher = None
+        self.finisher = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threads > 0
+
+    def configure(self, threads: Optional[int] = None) -> None:
+        if threads is not None:
+            self.shutdown()
+            self.threads = threads
+
+    def _shard(self) -> SchedulerShard:
+        # caller holds self.lock
+        if not self.shards:
+            self.shards = [SchedulerShard(self, str(i)) for i in range(self.threads)]
+            self.prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS,
+                                                 thread_name_prefix="ursa-audio-prefetch")
+            self.finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ursa-audio-finish")
+        return min(self.shards, key=lambda shard: len(shard.streams))
+
+    def play(self, voice_client, source: AudioSource, *, after: Optional[Callable] = None) -> ScheduledStream:
+        """
+        Start sending ``source`` to ``voice_client``; the scheduled counterpart of ``VoiceClient.play``.
+        """
+        if not voice_client.is_connected():
+            raise ClientException('Not connected to voice.')
+
+        with self.lock:
+            current = self.clients.get(id(voice_client))
+            if current is not None and current.is_playing():
+                raise ClientException('Already playing audio.')
+
+            stream = ScheduledStream(voice_client, source, after)
+            self._attach(stream, voice_client)
+            shard = self._shard()
+            stream.filling = True
+            self.prefetcher.submit(self._prime, stream, shard)
+        return stream
+
+    def _attach(self, stream: ScheduledStream, voice_client) -> None:
+        # caller holds self.lock
+        if stream.encode and getattr(voice_client, "encoder", None) is MISSING:
+            voice_client.encoder = Encoder()
+        stream.voice_client = voice_client
+        self.clients[id(voice_client)] = stream
+
+    def retarget(self, stream: ScheduledStream, voice_client) -> None:
+        """
+        Carry on sending ``stream`` on another voice client, e.g. after reconnecting, without
+        interrupting its source.
+        """
+        with self.lock:
+            if self.clients.get(id(stream.voice_client)) is stream:
+                del self.clients[id(stream.voice_client)]
+            self._attach(stream, voice_client)
+        if stream.is_playing():
+            _speak(voice_client, SpeakingState.voice)
+
+    def _prime(self, stream: ScheduledStream, shard: SchedulerShard) -> None:
+        stream.fill()
+        if stream.ended:
+            # stopped before a frame was sent; there is nothing to end on the voice client
+            self.finish(stream, sent=False)
+            return
+
+        _speak(stream.voice_client, SpeakingState.voice)
+        shard.add(stream)
+
+    def prefetch(self, stream: ScheduledStream) -> None:
+        """
+        Top up ``stream``'s frames on a prefetch thread, unless that is already under way.
+        """
+        prefetcher = self.prefetcher
+        if stream.filling or stream.exhausted or prefetcher is None:
+            return
+
+        stream.filling = True
+        try:
+            prefetcher.submit(stream.fill)
+        except RuntimeError:
+            # shut down meanwhile
+            stream.filling = False
+
+    def finish(self, stream: ScheduledStream, sent: bool = True) -> None:
+        """
+        Retire ``stream``. On the thread that sent it, its voice client stops speaking and gets
+        a few silent frames, unless a newer stream already plays there; ``after`` and cleanup
+        then run on the finisher thread.
+        """
+        vc = stream.voice_client
+        with self.lock:
+            current = self.clients.get(id(vc))
+            if current is stream:
+                del self.clients[id(vc)]
+            # under the lock, so no new stream can start on vc until this is sent
+            if sent and current in (stream, None):
+                self._end_speaking(vc)
+            finisher = self.finisher
+        if finisher is None:
+            self._finish(stream)
+        else:
+            finisher.submit(self._finish, stream)
+
+    def _end_speaking(self, voice_client) -> None:
+        try:
+            _speak(voice_client, SpeakingState.none)
+            if voice_client.is_connected():
+                self.send_silence(voice_client)
+        except Exception:
+            log.exception("ending a stream failed")
+
+    @staticmethod
+    def _finish(stream: ScheduledStream) -> None:
+        try:
+            if stream.after is not None:
+                stream.after(stream.error)
+            elif stream.error is not None:
+                log.error("audio stream failed", exc_info=stream.error)
+        except Exception:
+            log.exception("calling the after function failed")
+        finally:
+            stream.close()
+
+    @staticmethod
+    def send_silence(voice_client, count: int = SILENCE_FRAMES) -> None:
+        try:
+            for _ in range(count):
+                voice_client.send_audio_packet(OPUS_SILENCE, encode=False)
+        except Exception:
+            # as in discord.py, a lost silence packet is not worth reporting
+            pass
+
+    def shutdown(self) -> None:
+        with self.lock:
+            shards, self.shards = self.shards, list()
+            prefetcher, self.prefetcher = self.prefetcher, None
+            finisher, self.finisher = self.finisher, None
+        for shard in shards:
+            shard.stop()
+        if prefetcher is not None:
+            prefetcher.shutdown(wait=False)
+        if finisher is not None:
+            finisher.shutdown(wait=False)
+
+
+audio_scheduler = AudioScheduler()
@@ -0,0 +1,151 @@
+from collections import Counter
+from itertools import chain, compress, islice, repeat
+from operator import contains
+from typing import Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+
+# shorter queries have no trigram to look up
+MIN_QUERY: int = 3
+# least trigram similarity (0..1) for a fuzzy match to count
+MIN_SIMILARITY: float = 0.2
+# most keys a lookup returns unless asked for all of them; what the tracks filter shows
+MAX_MATCHES: int = 1000
+# a capped lookup intersects postings up to this many times its limit before checking texts,
+# and walks larger ones lazily until it has enough matches
+LAZY_RATIO: int = 4
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex(Generic[K]):
+    """
+    Maps the trigrams of each key's text to the keys containing them, for substring and fuzzy
+    lookups that only touch the keys sharing the query's trigrams.
+
+    Texts are case-folded and padded with a space either side, so trigrams at word starts and
+    ends count in fuzzy matches. Keys are added, changed and removed one at a time.
+    """
+    texts: Dict[K, str]
+    # distinct trigrams in each key's text
+    sizes: Dict[K, int]
+    postings: Dict[str, Set[K]]
+
+    def __init__(self, items: Iterable[Tuple[K, str]] = ()):
+        self.texts = dict()
+        self.sizes = dict()
+        self.postings = dict()
+        for key, text in items:
+            self.add(key, text)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.texts
+
+    def add(self, key: K, text: str) -> None:
+        if key in self.texts:
+            self.remove(key)
+
+        folded = f" {text.casefold()} "
+        grams = trigrams(folded)
+        self.texts[key] = folded
+        self.sizes[key] = len(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: K) -> None:
+        folded = self.texts.pop(key, None)
+        if folded is None:
+            return
+
+        del self.sizes[key]
+        for gram in trigrams(folded):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+
+    def find(self, query: str, limit: Optional[int] = MAX_MATCHES) -> Set[K]:
+        """
+        Keys whose text contains ``query``, ignoring case: at most ``limit`` of them, or all with None.
+
+        Capped, a lookup stops once it has ``limit`` matches, so a query most keys match (a file
+        extension, two letters) costs no more than a selective one; all of its matches cost as
+        much as there are of them.
+        """
+        query = query.casefold()
+        grams = trigrams(query)
+        if not grams:
+            # too short for a trigram, but texts are padded, so every occurrence starts one
+            postings = [keys for gram, keys in self.postings.items() if gram.startswith(query)]
+            if limit is None:
+                return set().union(*postings)
+            # postings overlap, so take batches until enough of them are new
+            found, pending = set(), chain.from_iterable(postings)
+            while len(found) < limit:
+                batch = list(islice(pending, limit - len(found)))
+                if not batch:
+                    break
+                found.update(batch)
+            return found
+
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        if limit is not None:
+            if len(grams) == 1:
+                return set(islice(postings[0], limit))
+            keys = postings[0]
+            if len(keys) <= LAZY_RATIO * limit:
+                keys = keys.intersection(*postings[1:])
+            # containing the query means having every trigram, so the text check alone decides
+            return set(islice(self._containing(query, keys), limit))
+
+        # smallest first, so each step only walks what is left
+        candidates = postings[0].intersection(*postings[1:])
+        if len(grams) == 1:
+            return candidates
+        # sharing every trigram doesn't make a substring ("abcab" and "bcabc"); check
+        return set(self._containing(query, candidates))
+
+    def _containing(self, query: str, keys: Set[K]) -> Iterator[K]:
+        # the keys whose text contains query, lazily, without a Python-level loop
+        return compress(keys, map(contains, map(self.texts.__getitem__, keys), repeat(query)))
+
+    def similar(self, query: str, limit: int = 10, threshold: float = MIN_SIMILARITY) -> List[Tuple[float, K]]:
+        """
+        Up to ``limit`` (similarity, key) pairs, best first, by the Jaccard similarity of their trigrams.
+        """
+        grams = trigrams(f" {query.casefold()} ")
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scored = list()
+        for key, count in shared.items():
+            score = count / (len(grams) + self.sizes[key] - count)
+            if score >= threshold:
+                scored.append((score, key))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:limit]
+
+    def resolve(self, query: str) -> Optional[K]:
+        """
+        The key ``query`` names unambiguously: an exact match ignoring case, else the only key
+        containing it, else the only key similar to it. None if there is no such key, or several.
+        """
+        folded = f" {query.casefold()} "
+        # an exact match contains the padded query too, which has the more selective trigrams
+        for key in self.find(folded, limit=None):
+            if self.texts[key] == folded:
+                return key
+        contained = self.find(query, limit=2)
+        if len(contained) == 1:
+            return next(iter(contained))
+
+        similar = self.similar(query, limit=2)
+        if len(similar) == 1:
+            return similar[0][1]
+        return None
@@ -1,23 +1,61 @@
+import json
+import logging
 from abc import ABC, abstractmethod
 from queue import Queue
+from typing import NamedTuple, Optional, Tuple
 
-from discord import Guild, VoiceClient, TextChannel
+from discord import Guild, VoiceChannel, VoiceClient, TextChannel
 
 from .PhasedContext import PhasedContext
+from .decoder import SAMPLING_RATE
+from .playback import IDLE_TIMEOUT, PlaybackController
 from .playlist import Playlist
 
+log = logging.getLogger(__name__)
+
+# (phase, track index, sample at 48 kHz)
+ResumePoint = Tuple[str, int, int]
+
+
+class SessionCursor(NamedTuple):
+    """
+    Everything needed to bring a closed session back; a few dozen bytes once encoded.
+    """
+    context_name: str
+    phase: Optional[str]
+    index: int
+    position: int
+    voice_channel_id: Optional[int]
+    text_channel_id: int
+    playing: bool
+
+    @property
+    def resume_point(self) -> Optional[ResumePoint]:
+        return None if self.phase is None else (self.phase, self.index, self.position)
+
+    def encode(self) -> bytes:
+        return json.dumps(self, separators=(',', ':')).encode()
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'SessionCursor':
+        return cls(*json.loads(data))
+
 
 class BaseSession(ABC):
     guild: Guild
     voice_client: VoiceClient
+    player: PlaybackController
     text_channel: TextChannel
     message_history: Queue
+    closed: bool
 
     def __init__(self, guild: Guild, voice_client: VoiceClient, text_channel: TextChannel):
         self.guild = guild
         self.voice_client = voice_client
+        self.player = PlaybackController(voice_client, label="session")
         self.text_channel = text_channel
         self.message_history = Queue()
+        self.closed = False
 
     async def send_message(self, text: str):
         message = await self.text_channel.send(text)
@@ -31,11 +69,37 @@ class BaseSession(ABC):
     def stop(self) -> None:
         pass
 
+    async def move_to(self, channel: VoiceChannel) -> None:
+        """
+        Move the voice connection to another channel in the same guild; playback carries on.
+        """
+        if self.voice_client.channel != channel:
+            await self.voice_client.move_to(channel)
+
+    def reconnect(self, voice_client: VoiceClient) -> None:
+        """
+        Carry on over a new voice connection after the old one dropped.
+        """
+        self.voice_client = voice_client
+        self.player.rebind(voice_client)
+
+    def is_idle(self, timeout: float = IDLE_TIMEOUT) -> bool:
+        """
+        See ``PlaybackController.is_idle``.
+        """
+        return self.player.is_idle(timeout)
+
+    def close(self) -> None:
+        self.closed = True
+        self.stop()
+        self.player.close()
+
 
 class BackgroundSession(BaseSession):
     context_name: str
     context: PhasedContext
     is_stopped: bool
+    resume_point: Optional[ResumePoint]
 
     def __init__(self, guild: Guild, context_name: str, context: PhasedContext, voice_client: VoiceClient,
                  text_channel: TextChannel):
@@ -43,43 +107,114 @@ class BackgroundSession(BaseSession):
         self.context_name = context_name
         self.context = context
         self.is_stopped = True
+        self.resume_point = None
 
     def stop(self) -> None:
+        if not self.is_stopped and self.context.current_phase is not None:
+            self.resume_point = (self.context.current_phase, self.context.current_playlist.current_index,
+                                 self.player.position)
         self.is_stopped = True
-        if self.voice_client.is_playing() or self.voice_client.is_paused():
-            self.voice_client.stop()
+        self.player.stop()
+
+    def reconnect(self, voice_client: VoiceClient) -> None:
+        self.voice_client = voice_client
+        if self.player.rebind(voice_client) or self.is_stopped:
+            return
+
+        # the old connection took its player with it; start again from the same place
+        self.stop()
+        self.play_from_resume_point()
 
     def next_track(self, error=None):
+        # always invoked on the event loop by self.player
         if error is not None:
-            print(error)
+            log.error("player error: %s", error)
 
         if self.is_stopped:
             return
 
-        if self.voice_client is None or self.voice_client.is_playing():
-            print("DEBUG: not going to next track.")
+        if self.voice_client is None or self.player.is_playing():
+            log.debug("not going to next track.")
             return
 
         playlist: Playlist = self.context.current_playlist
-        if not playlist.play_track(self.voice_client, self.next_track) \
+        if not playlist.play_track(self.player, self.next_track) \
                 and self.context.current_phase != self.context.default_playlist:
             self.context.reset()
-            print("playlist at end, reset to default phase")
+            log.info("playlist at end, reset to default phase")
             self.context.current_phase = self.context.default_playlist
-            self.context.current_playlist.play_track(self.voice_client, self.next_track)
+            self.context.current_playlist.play_track(self.player, self.next_track)
 
     def set_context(self, context_name: str, context: PhasedContext) -> None:
         self.stop()
         self.context.reset()
         self.context_name = context_name
         self.context = context
+        self.resume_point = None
 
     def play_default(self) -> None:
         self.stop()
-        self.context.play_default(self.voice_client, self.next_track)
+        self.context.play_default(self.player, self.next_track)
         self.is_stopped = False
 
     def play_list(self, list_name: str) -> None:
         self.stop()
-        self.context.play_list(list_name, self.voice_client, self.next_track)
+        self.context.play_list(list_name, self.player, self.next_track)
         self.is_stopped = False
+
+    def seek(self, seconds: float) -> bool:
+        """
+        Restart the current track ``seconds`` in.
+        """
+        if self.is_stopped or self.context.current_phase is None:
+            return False
+
+        self.player.stop()
+        return self.context.current_playlist.play_current(self.player, self.next_track,
+                                                          int(max(0.0, seconds) * SAMPLING_RATE))
+
+    def play_from_resume_point(self) -> bool:
+        """
+        Continue where the session was last stopped, if its phase and track still exist.
+        """
+        if self.resume_point is None:
+            return False
+
+        phase, index, position = self.resume_point
+        playlist = self.context.playlists.get(phase)
+        if playlist is None or index not in range(len(playlist.playlist)):
+            return False
+
+        self.stop()
+        if self.context.current_phase is not None:
+            self.context.current_playlist.reset()
+        self.context.current_phase = phase
+        playlist.current_index = index
+        self.is_stopped = not playlist.play_current(self.player, self.next_track, position)
+        return not self.is_stopped
+
+    def cursor(self, playing: bool = False) -> SessionCursor:
+        phase, index, position = self.resume_point or (None, 0, 0)
+        channel = self.voice_client.channel
+        return SessionCursor(self.context_name, phase, index, position, None if channel is None else channel.id,
+                             self.text_channel.id, playing)
+
+    def snapshot(self) -> SessionCursor:
+        """
+        Cursor for the session as it is now, without stopping it.
+        """
+        if self.is_stopped or self.context.current_phase is None:
+            return self.cursor()
+
+        channel = self.voice_client.channel
+        return SessionCursor(self.context_name, self.context.current_phase, self.context.current_playlist.current_index,
+                             self.player.position, None if channel is None else channel.id, self.text_channel.id,
+                             not self.player.is_paused())
+
+    def suspend(self) -> SessionCursor:
+        """
+        Close the session, releasing its decoder, and return where to pick it up again.
+        """
+        playing = not self.is_stopped and not self.player.is_paused()
+        self.close()
+        return self.cursor(playing)
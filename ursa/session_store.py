@@ -0,0 +1,103 @@
+import logging
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STORE: Path = Path.home() / ".cache" / "ursa" / "sessions.sqlite3"
+# session states: playing in a voice channel, suspended while idle, or left with >leave
+ACTIVE: str = "active"
+SUSPENDED: str = "suspended"
+LEFT: str = "left"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    guild_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    cursor BLOB NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class SessionStore(object):
+    """
+    Per-guild session cursors (see ``SessionCursor``) in a small SQLite database, so sessions
+    survive a restart.
+
+    ``put`` and ``delete`` only record the latest change per guild in memory; ``flush`` writes
+    everything pending in one transaction. It does blocking I/O, so call it off the event loop.
+    """
+    path: Path
+    pending: Dict[int, Optional[Tuple[str, bytes]]]
+    lock: Lock
+    _db: Optional[sqlite3.Connection]
+
+    def __init__(self, path: Path = DEFAULT_STORE):
+        self.path = path
+        self.pending = dict()
+        self.lock = Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            # a lost last batch only costs a few seconds of position
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(SCHEMA)
+        return self._db
+
+    def put(self, guild_id: int, state: str, cursor: bytes) -> None:
+        with self.lock:
+            self.pending[guild_id] = (state, cursor)
+
+    def delete(self, guild_id: int) -> None:
+        with self.lock:
+            self.pending[guild_id] = None
+
+    def flush(self) -> int:
+        """
+        Write pending changes; returns how many guilds were written.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+        if not pending:
+            return 0
+
+        now = time()
+        rows = [(guild_id, entry[0], entry[1], now) for guild_id, entry in pending.items() if entry is not None]
+        gone = [(guild_id,) for guild_id, entry in pending.items() if entry is None]
+        try:
+            db = self._connect()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", rows)
+                db.executemany("DELETE FROM sessions WHERE guild_id = ?", gone)
+        except sqlite3.Error as e:
+            log.warning("could not write session store %s: %s", self.path, e)
+            with self.lock:
+                # keep anything newer that arrived meanwhile
+                self.pending = {**pending, **self.pending}
+            return 0
+
+        return len(pending)
+
+    def load(self) -> List[Tuple[int, str, bytes]]:
+        """
+        Every stored (guild id, state, cursor).
+        """
+        try:
+            return list(self._connect().execute("SELECT guild_id, state, cursor FROM sessions"))
+        except sqlite3.Error as e:
+            log.warning("ignoring unreadable session store %s: %s", self.path, e)
+            return list()
+
+    def close(self) -> None:
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,141 @@
+import ctypes
+from multiprocessing.shared_memory import SharedMemory
+from time import sleep
+from typing import Optional
+
+# header: capacity (u64), bytes written (u64), bytes consumed (u64), writer finished, reader closed
+CAPACITY_OFFSET: int = 0
+WRITTEN_OFFSET: int = 8
+CONSUMED_OFFSET: int = 16
+FINISHED_OFFSET: int = 24
+CLOSED_OFFSET: int = 25
+DATA_OFFSET: int = 64
+POLL_INTERVAL: float = 0.002
+
+
+class SharedPCMRing(object):
+    """
+    Single-producer/single-consumer byte ring in a ``multiprocessing.shared_memory`` block,
+    so a decoder process can hand PCM to the voice sender without a pipe or per-frame copies
+    into new ``bytes``.
+
+    Both sides only ever advance their own monotonic counter, so no lock is shared between
+    processes; a side that has to wait polls every ``POLL_INTERVAL``.
+    """
+    shm: SharedMemory
+    capacity: int
+    owner: bool
+    _written: ctypes.c_uint64
+    _consumed: ctypes.c_uint64
+    _finished: ctypes.c_bool
+    _closed: ctypes.c_bool
+    _base: int
+    _anchor: Optional[ctypes.Array]
+
+    def __init__(self, capacity: int = 0, name: Optional[str] = None):
+        if name is None:
+            self.shm = SharedMemory(create=True, size=DATA_OFFSET + capacity)
+            self.owner = True
+            ctypes.c_uint64.from_buffer(self.shm.buf, CAPACITY_OFFSET).value = capacity
+        else:
+            # registers the name again with the resource tracker, which pool workers share
+            # with the creating process, so the creator's unlink() still clears it
+            self.shm = SharedMemory(name=name)
+            self.owner = False
+
+        buf = self.shm.buf
+        # the mapping may be rounded up to a page, so take the size from the header
+        self.capacity = ctypes.c_uint64.from_buffer(buf, CAPACITY_OFFSET).value
+        self._written = ctypes.c_uint64.from_buffer(buf, WRITTEN_OFFSET)
+        self._consumed = ctypes.c_uint64.from_buffer(buf, CONSUMED_OFFSET)
+        self._finished = ctypes.c_bool.from_buffer(buf, FINISHED_OFFSET)
+        self._closed = ctypes.c_bool.from_buffer(buf, CLOSED_OFFSET)
+        self._anchor = (ctypes.c_char * self.capacity).from_buffer(buf, DATA_OFFSET)
+        self._base = ctypes.addressof(self._anchor)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def closed(self) -> bool:
+        return self._anchor is None or self._closed.value
+
+    def write(self, data) -> bool:
+        """
+        Copy ``data`` into the ring, waiting for the reader while it is full.
+        Returns False once the reader has closed the ring.
+        """
+        view = memoryview(data).cast('B')
+        src = (ctypes.c_char * len(view)).from_buffer_copy(view) if view.readonly else \
+            (ctypes.c_char * len(view)).from_buffer(view)
+        src_base = ctypes.addressof(src)
+        done = 0
+        while done < len(view):
+            if self.closed:
+                return False
+
+            written = self._written.value
+            free = self.capacity - (written - self._consumed.value)
+            if not free:
+                sleep(POLL_INTERVAL)
+                continue
+
+            tail = written % self.capacity
+            n = min(len(view) - done, free, self.capacity - tail)
+            ctypes.memmove(self._base + tail, src_base + done, n)
+            self._written.value = written + n
+            done += n
+        return True
+
+    def finish(self) -> None:
+        if self._anchor is not None:
+            self._finished.value = True
+
+    def readinto(self, buffer: ctypes.Array) -> int:
+        """
+        Fill ``buffer`` from the ring, waiting for the writer as needed.
+        Returns fewer than ``len(buffer)`` bytes only at the end of the stream.
+        """
+        want = len(buffer)
+        dst = ctypes.addressof(buffer)
+        got = 0
+        while got < want:
+            if self.closed:
+                break
+
+            consumed = self._consumed.value
+            available = self._written.value - consumed
+            if not available:
+                if self._finished.value:
+                    break
+                sleep(POLL_INTERVAL)
+                continue
+
+            head = consumed % self.capacity
+            n = min(want - got, available, self.capacity - head)
+            ctypes.memmove(dst + got, self._base + head, n)
+            self._consumed.value = consumed + n
+            got += n
+        return got
+
+    def close(self) -> None:
+        """
+        Tell the writer to stop. Safe to call while another thread is in ``readinto``.
+        """
+        if self._anchor is not None:
+            self._closed.value = True
+
+    def release(self) -> None:
+        """
+        Unmap the ring (and unlink it, on the creating side). Nothing may be using it.
+        """
+        if self._anchor is None:
+            return
+
+        # ctypes views pin the mapping; drop them before closing it
+        self._written = self._consumed = self._finished = self._closed = None
+        self._anchor = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,203 @@
+import logging
+from http.client import HTTPException
+from threading import Condition, Thread
+from time import sleep
+from typing import Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from .metrics import Counter
+
+log = logging.getLogger(__name__)
+
+RING_CAPACITY: int = 4 * 1024 * 1024
+PREFILL_BYTES: int = 256 * 1024
+REBUFFER_BYTES: int = 128 * 1024
+CHUNK_SIZE: int = 64 * 1024
+CONNECT_TIMEOUT: float = 10.0
+MAX_RETRIES: int = 5
+RETRY_BACKOFF: float = 0.5
+USER_AGENT: str = "UrsaMixer"
+
+STREAM_REBUFFERS = Counter("ursa_stream_rebuffers_total", "Times a remote stream ran dry and had to rebuffer")
+STREAM_RESUMES = Counter("ursa_stream_resumes_total", "Remote stream reconnects, resumed with a byte range")
+
+
+class RingBuffer(object):
+    """
+    Bounded single-producer/single-consumer byte ring.
+
+    ``write`` blocks while the ring is full. ``read`` blocks until data is available;
+    once the ring has run dry it keeps blocking until ``rebuffer`` bytes are queued again
+    (or the writer finishes), so a slow producer causes buffering pauses rather than a
+    trickle of tiny reads.
+    """
+    buffer: bytearray
+    view: memoryview
+    capacity: int
+    rebuffer: int
+    head: int
+    size: int
+    eof: bool
+    closed: bool
+    starved: bool
+    cond: Condition
+    rebuffers: Optional[Counter]
+
+    def __init__(self, capacity: int = RING_CAPACITY, rebuffer: int = REBUFFER_BYTES,
+                 rebuffers: Optional[Counter] = STREAM_REBUFFERS):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.capacity = capacity
+        self.rebuffer = min(rebuffer, capacity)
+        self.head = 0
+        self.size = 0
+        self.eof = False
+        self.closed = False
+        # start out buffering so the first read waits for a useful amount of data
+        self.starved = True
+        self.cond = Condition()
+        self.rebuffers = rebuffers
+
+    def write(self, data: bytes) -> bool:
+        view = memoryview(data).cast('B')
+        with self.cond:
+            while view:
+                while self.size == self.capacity and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return False
+
+                tail = (self.head + self.size) % self.capacity
+                n = min(len(view), self.capacity - self.size, self.capacity - tail)
+                self.view[tail:tail + n] = view[:n]
+                self.size += n
+                view = view[n:]
+                self.cond.notify_all()
+        return True
+
+    def finish(self) -> None:
+        with self.cond:
+            self.eof = True
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def wait_for(self, n: int, timeout: Optional[float] = None) -> bool:
+        with self.cond:
+            return self.cond.wait_for(lambda: self.size >= min(n, self.capacity) or self.eof or self.closed,
+                                      timeout)
+
+    def _wait_readable(self) -> bool:
+        # caller holds self.cond
+        if not self.size and not self.starved and not self.eof:
+            self.starved = True
+            if self.rebuffers is not None:
+                self.rebuffers.inc()
+        if self.starved:
+            self.cond.wait_for(lambda: self.size >= self.rebuffer or self.eof or self.closed)
+            self.starved = False
+
+        return not self.closed and self.size > 0
+
+    def _consume(self, n: int) -> None:
+        # caller holds self.cond
+        self.head = (self.head + n) % self.capacity
+        self.size -= n
+        self.cond.notify_all()
+
+    def read(self, n: int = -1) -> bytes:
+        with self.cond:
+            if not self._wait_readable():
+                return b''
+
+            n = self.size if n < 0 else min(n, self.size)
+            n = min(n, self.capacity - self.head)
+            data = bytes(self.view[self.head:self.head + n])
+            self._consume(n)
+            return data
+
+    def readinto(self, buffer) -> int:
+        """
+        Fill ``buffer`` without allocating a new bytes object. Returns fewer than
+        ``len(buffer)`` bytes only once the writer has finished or the ring is closed.
+        """
+        dst = memoryview(buffer).cast('B')
+        got = 0
+        with self.cond:
+            while got < len(dst) and self._wait_readable():
+                n = min(len(dst) - got, self.size, self.capacity - self.head)
+                dst[got:got + n] = self.view[self.head:self.head + n]
+                self._consume(n)
+                got += n
+        return got
+
+
+class HttpStream(object):
+    """
+    Downloads ``url`` into a RingBuffer on a worker thread, reconnecting with a
+    ``Range`` request from the last received byte if the connection drops.
+    """
+    url: str
+    ring: RingBuffer
+    received: int
+    error: Optional[Exception]
+    thread: Thread
+
+    def __init__(self, url: str, ring: Optional[RingBuffer] = None, start: int = 0):
+        self.url = url
+        self.ring = ring or RingBuffer()
+        self.received = start
+        self.error = None
+        self.thread = Thread(target=self._run, name=f"http-stream:{url}", daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        headers = {"User-Agent": USER_AGENT}
+        if self.received:
+            headers["Range"] = f"bytes={self.received}-"
+        return urlopen(Request(self.url, headers=headers), timeout=CONNECT_TIMEOUT)
+
+    def _run(self) -> None:
+        retries = 0
+        while not self.ring.closed:
+            try:
+                with self._open() as response:
+                    skip = self.received if self.received and response.status != 206 else 0
+                    while not self.ring.closed:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            if response.length:
+                                raise HTTPException(f"connection closed with {response.length} bytes outstanding")
+                            self.ring.finish()
+                            return
+                        if skip:
+                            # server ignored our Range header; discard what we already have
+                            dropped = min(skip, len(chunk))
+                            chunk, skip = chunk[dropped:], skip - dropped
+                        if chunk and not self.ring.write(chunk):
+                            return
+                        self.received += len(chunk)
+                        retries = 0
+            except HTTPError as e:
+                # 4xx/5xx will not get better by retrying a range
+                log.error("stream %s failed: %s", self.url, e)
+                self.error = e
+                break
+            except (URLError, HTTPException, OSError) as e:
+                retries += 1
+                if retries > MAX_RETRIES:
+                    log.error("stream %s gave up after %d retries: %s", self.url, MAX_RETRIES, e)
+                    self.error = e
+                    break
+                log.warning("stream %s dropped at byte %d (%s); resuming", self.url, self.received, e)
+                STREAM_RESUMES.inc()
+                sleep(RETRY_BACKOFF * retries)
+
+        self.ring.finish()
+
+    def close(self) -> None:
+        self.ring.close()
@@ -1,6 +1,11 @@
 from typing import Callable
 
-from discord import VoiceClient, FFmpegPCMAudio
+from discord import VoiceClient
+
+from .analysis import track_analysis
+from .cache import track_cache
+from .decoder import decoder_pool
+from .metrics import MeteredSource
 
 
 class Track(object):
@@ -11,10 +16,22 @@ class Track(object):
         self.track_name = track_name
         self.next_track_no = next_track_no
 
-    def play_track(self, client: VoiceClient, callback: Callable) -> bool:
+    def play_track(self, client: VoiceClient, callback: Callable, looping: bool = False, position: int = 0) -> bool:
+        """
+        :param position: sample (at 48 kHz) to start from
+        """
         if not client.is_playing():
-            audio_source = FFmpegPCMAudio(self.track_name)
-            client.play(audio_source, after=callback)
+            start, end = track_analysis.bounds(self.track_name, looping)
+            path = track_cache.resolve(self.track_name)
+            gain = track_analysis.gain(self.track_name)
+            if looping:
+                # a self-looping track is repeated by the source itself, so callback only runs once it is stopped
+                audio_source = decoder_pool.open_loop(path, gain, start, end, position)
+            else:
+                if end is None or position < end:
+                    start = max(start, position)
+                audio_source = decoder_pool.open(path, gain, start, end)
+            client.play(MeteredSource(audio_source, client.guild.id), after=callback)
             return True
 
         return False
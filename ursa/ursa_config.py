@@ -7,7 +7,12 @@ class Settings(BaseSettings):
 
     APPID: int
     TOKEN: str
+    # False drops the privileged message content intent; commands then only come in as slash commands
+    MESSAGE_CONTENT: bool = True
+    # "lean" caches only guilds, channels and voice states (see ursa.discord.profile)
+    CACHE_PROFILE: str = "default"
 
 settings = Settings()
 
-INVITE_LINK = f'https://discord.com/oauth2/authorize?client_id={settings.APPID}&permissions={URSA_PERMISSIONS}&scope=bot'
+INVITE_LINK = f'https://discord.com/oauth2/authorize?client_id={settings.APPID}&permissions={URSA_PERMISSIONS}' \
+              f'&scope=bot+applications.commands'